@@ -1,22 +1,24 @@
 
 import os
+import sys
 import json
-import base64
 import argparse
 import time
 from tqdm import tqdm
 from multiprocessing import Process
-from openai import OpenAI
 
-api_key = os.getenv("OPENAI_API_KEY")
-if not api_key:
-    print("[Error] OPENAI_API_KEY not set.")
-    exit()
-client = OpenAI(api_key=api_key)
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "..")))
+from navbench.stats import add_sequential_args, make_stopper, seeded_order
+from navbench.sampling import select_comp_lines, stratified_order, comp_strata
+from navbench.images import get_payload
+from navbench.llm import get_controller, require_api_key, init_worker
+from navbench.budget import get_budget
+from navbench.answers import ask, add_answer_args, apply_answer_args
+from navbench.comp_tasks import args_suffix
+
 
 def encode_image(image_path):
-    with open(image_path, "rb") as f:
-        return base64.b64encode(f.read()).decode("utf-8")
+    return get_payload(image_path)
 
 def build_prompt(image_paths, instructions):
     encoded_images = [encode_image(p) for p in image_paths]
@@ -43,16 +45,18 @@ def build_prompt(image_paths, instructions):
         messages[1]["content"].append({"type": "text", "text": f"Instruction {i+1}: {instr}"})
     return messages
 
-def ask_gpt(prompt_messages):
+def ask_gpt(prompt_messages, item):
     model = os.environ.get("OPENAI_MODEL", "gpt-4o")
-    response = client.chat.completions.create(
-        model=model,
-        messages=prompt_messages,
-        temperature=0.0,
-    )
-    return response.choices[0].message.content.strip()
-
-def evaluate_predictions(input_path, output_path, log_path, max_samples=None):
+    output, extra = ask(model, prompt_messages, "global", item)
+    return output.strip(), extra
+
+def score_prediction(item, output):
+    answer_idx = item["answer_idx"] + 1
+    item["gpt_output"] = output
+    item["success"] = str(answer_idx) in output
+    return item
+
+def evaluate_predictions(input_path, output_path, log_path, max_samples=None, stopper=None, seed=0, subset_file=None):
     correct = 0
     total = 0
     all_results = []
@@ -61,22 +65,32 @@ def evaluate_predictions(input_path, output_path, log_path, max_samples=None):
 
     with open(input_path) as f:
         lines = f.readlines()
+    lines = select_comp_lines(lines, subset_file, input_path)
+    budget = get_budget()
+    if budget is not None:
+        # most informative first: every prefix is a stratified sample, so a cut-short run stays representative
+        lines = [lines[i] for i in stratified_order([json.loads(l) for l in lines], comp_strata, seed)]
+    elif stopper is not None:
+        lines = [lines[i] for i in seeded_order(len(lines), seed)]
 
     with open(log_path, "w") as log_file:
         for i, line in enumerate(lines):
             if max_samples and i >= max_samples:
                 break
+            if budget is not None and not budget.try_start():
+                log_file.write(f"[{strategy}] budget stop: {budget.stop_reason}\n")
+                break
+            item_start = time.time()
 
             item = json.loads(line)
             image_paths = item["image_paths"]
             instructions = item["instructions"]
-            answer_idx = item["answer_idx"] + 1 
 
             try:
                 prompt = build_prompt(image_paths, instructions)
-                output = ask_gpt(prompt)
-                item["gpt_output"] = output
-                item["success"] = str(answer_idx) in output
+                output, extra = ask_gpt(prompt, item)
+                score_prediction(item, output)
+                item.update(extra)
                 if item["success"]:
                     correct += 1
             except Exception as e:
@@ -85,29 +99,49 @@ def evaluate_predictions(input_path, output_path, log_path, max_samples=None):
 
             total += 1
             all_results.append(item)
+            if budget is not None:
+                budget.finish(time.time() - item_start)
 
             # write log
             log_file.write(f"[{strategy}] {total}/{min(max_samples or len(lines), len(lines))} done ({100.0*total/min(max_samples or len(lines), len(lines)):.1f}%)\n")
             log_file.flush()
 
+            if stopper is not None and stopper.update(item["success"]):
+                log_file.write(f"[{strategy}] early stop: {stopper.summary()}\n")
+                break
+
     accuracy = correct / total if total > 0 else 0
     duration = time.time() - start_time
     print(f"[{strategy}] Accuracy: {correct}/{total} = {accuracy:.2%}  |  Time: {duration:.1f}s")
+    if stopper is not None:
+        print(f"[{strategy}] Sequential: {stopper.summary()}")
+    if budget is not None:
+        print(f"[{strategy}] Budget: {budget.summary(total, min(max_samples or len(lines), len(lines)))}")
 
     with open(output_path, "w") as f_out:
         for r in all_results:
             f_out.write(json.dumps(r) + "\n")
 
-def run_worker(strategy, max_samples):
+def run_worker(strategy, max_samples, args=None, controller=None, budget=None):
+    if controller is not None:
+        init_worker(controller, budget)
     input_file = f"{strategy}.jsonl"
-    output_file = f"results/{strategy}_results.jsonl"
-    log_file = f"results/{strategy}.log"
-    evaluate_predictions(input_file, output_file, log_file, max_samples)
+    suffix = args_suffix(args, get_budget() is not None) if args is not None else ""
+    output_file = f"results/{strategy}_results{suffix}.jsonl"
+    log_file = f"results/{strategy}{suffix}.log"
+    stopper = make_stopper(args) if args is not None else None
+    evaluate_predictions(input_file, output_file, log_file, max_samples, stopper=stopper, seed=getattr(args, "seed", 0),
+                         subset_file=getattr(args, "subset_file", None))
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--max_items", type=int, default=None, help="Maximum samples per strategy")
+    parser.add_argument("--subset_file", type=str, default=None, help="Subset index file from navbench.sampling")
+    add_sequential_args(parser)
+    add_answer_args(parser)
     args = parser.parse_args()
+    apply_answer_args(args)
+    require_api_key()
 
     os.makedirs("results", exist_ok=True)
     files = ["basic", "direction", "object", "shuffle"]
@@ -115,12 +149,18 @@ if __name__ == "__main__":
 
     print("\n=== Starting parallel evaluation ===")
     start = time.time()
+    # one controller and run budget for all four strategy processes, so they share a single request budget
+    controller = get_controller()
+    budget = get_budget()
     procs = []
     for name in files:
-        p = Process(target=run_worker, args=(name, args.max_items))
+        p = Process(target=run_worker, args=(name, args.max_items, args, controller, budget))
         p.start()
         procs.append(p)
 
     for p in procs:
         p.join()
     print(f"\n✅ All tasks finished in {time.time() - start:.1f} seconds.")
+    print(f"[Requests] {controller.summary()}")
+    if budget is not None:
+        budget.save_ledger()
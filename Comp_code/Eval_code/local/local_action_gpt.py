@@ -1,24 +1,23 @@
 import os
+import sys
 import json
-import base64
 from tqdm import tqdm
 from multiprocessing import Pool, cpu_count
-from openai import OpenAI
 import argparse
 import re
 
-os.makedirs("results", exist_ok=True)
-
-api_key = os.getenv("OPENAI_API_KEY")
-if not api_key:
-    print("[Error] OPENAI_API_KEY not set.")
-    exit()
-client = OpenAI(api_key=api_key)
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "..")))
+from navbench.stats import add_sequential_args, make_stopper, seeded_order
+from navbench.sampling import select_comp_lines, stratified_order, comp_strata
+from navbench.images import get_payload
+from navbench.llm import get_controller, require_api_key, init_worker
+from navbench.budget import Budgeted, get_budget
+from navbench.answers import ask, add_answer_args, apply_answer_args
+from navbench.comp_tasks import args_suffix
 
 
 def encode_image(image_path):
-    with open(image_path, "rb") as f:
-        return base64.b64encode(f.read()).decode("utf-8")
+    return get_payload(image_path)
 
 def organize_prompt(current_view, candidate_views, target_view):
     encoded_current = encode_image(current_view)
@@ -62,36 +61,40 @@ def extract_index(prediction):
         return ord(match.group()) - ord('A')
     raise ValueError(f"No valid letter A-Z found in prediction: {prediction}")
 
+def score_prediction(item, prediction):
+    pred_idx = extract_index(prediction)
+    return {
+        "gt": item["answer"],
+        "gt_letter": chr(ord('A') + item["answer"]),
+        "pred": pred_idx,
+        "pred_letter": chr(ord('A') + pred_idx),
+        "correct": pred_idx == item["answer"],
+        "raw_response": prediction
+    }
+
 def process_one_item(line):
     item = json.loads(line)
     try:
         messages = organize_prompt(item["current_view"], item["candidate_views"], item["target_view"])
         model = os.environ.get("OPENAI_MODEL", "gpt-4o")
-        response = client.chat.completions.create(
-            model=model,
-            messages=messages,
-            temperature=0.0
-        )
-        prediction = response.choices[0].message.content.strip()
-        pred_idx = extract_index(prediction)
-        return item["id"], {
-            "gt": item["answer"],
-            "gt_letter": chr(ord('A') + item["answer"]),
-            "pred": pred_idx,
-            "pred_letter": chr(ord('A') + pred_idx),
-            "correct": pred_idx == item["answer"],
-            "raw_response": prediction
-        }
+        prediction, extra = ask(model, messages, "local/action", item)
+        return item["id"], dict(score_prediction(item, prediction.strip()), **extra)
     except Exception as e:
         return item["id"], {"error": str(e)}
 
-def run_evaluation(max_items=None, debug=False):
+def run_evaluation(max_items=None, debug=False, stopper=None, seed=0, subset_file=None, suffix=""):
     input_path = "future_action_data.jsonl"
-    output_path = os.path.join("results", f"future_action_results_gpt-4o.jsonl" if max_items is None else f"future_action_results_gpt-4o_sample{max_items}.jsonl")
+    output_path = os.path.join("results", f"future_action_results_gpt-4o{suffix}.jsonl" if max_items is None else f"future_action_results_gpt-4o_sample{max_items}{suffix}.jsonl")
 
     with open(input_path, "r") as f:
         lines = f.readlines()
+    lines = select_comp_lines(lines, subset_file, input_path)
 
+    if get_budget() is not None:
+        # most informative first: every prefix is a stratified sample, so a cut-short run stays representative
+        lines = [lines[i] for i in stratified_order([json.loads(l) for l in lines], comp_strata, seed)]
+    elif stopper is not None:
+        lines = [lines[i] for i in seeded_order(len(lines), seed)]
     if max_items is not None:
         lines = lines[:max_items]
 
@@ -99,12 +102,24 @@ def run_evaluation(max_items=None, debug=False):
         print("[Debug Mode] Running in serial mode for easier debugging...")
         results = []
         for line in tqdm(lines):
-            result = process_one_item(line)
+            result = Budgeted(process_one_item)(line)
+            if result is None:
+                break
             print(result)
             results.append(result)
+            if stopper is not None and "correct" in result[1] and stopper.update(result[1]["correct"]):
+                print(f"[Sequential] Early stop: {stopper.summary()}")
+                break
     else:
-        with Pool(processes=cpu_count()) as pool:
-            results = list(tqdm(pool.imap(process_one_item, lines), total=len(lines)))
+        with Pool(processes=cpu_count(), initializer=init_worker, initargs=(get_controller(), get_budget())) as pool:
+            results = []
+            for result in tqdm(pool.imap(Budgeted(process_one_item), lines), total=len(lines)):
+                if result is None:
+                    continue  # not started: the run budget is used up
+                results.append(result)
+                if stopper is not None and "correct" in result[1] and stopper.update(result[1]["correct"]):
+                    print(f"[Sequential] Early stop: {stopper.summary()}")
+                    break
 
     with open(output_path, "w") as f:
         for _, result in results:
@@ -117,11 +132,22 @@ def run_evaluation(max_items=None, debug=False):
         print(f"Correct: {correct} / {total} | Accuracy: {correct / total:.2%}")
     else:
         print("No valid predictions found. Check for errors.")
+    print(f"[Requests] {get_controller().summary()}")
+    if get_budget() is not None:
+        print(f"[Budget] {get_budget().summary(len(results), len(lines))}")
+        get_budget().save_ledger()
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--max_items", type=int, default=None, help="Only evaluate this number of items")
     parser.add_argument("--debug", action="store_true", help="Enable serial debug mode")
+    parser.add_argument("--subset_file", type=str, default=None, help="Subset index file from navbench.sampling")
+    add_sequential_args(parser)
+    add_answer_args(parser)
     args = parser.parse_args()
+    apply_answer_args(args)
+    require_api_key()
+    os.makedirs("results", exist_ok=True)
 
-    run_evaluation(max_items=args.max_items, debug=args.debug)
+    run_evaluation(max_items=args.max_items, debug=args.debug, stopper=make_stopper(args), seed=args.seed,
+                   subset_file=args.subset_file, suffix=args_suffix(args, get_budget() is not None))
@@ -1,21 +1,23 @@
 import os
+import sys
 import json
-import base64
 import re
 import argparse
 from tqdm import tqdm
 from multiprocessing import Pool, cpu_count
-from openai import OpenAI
 
-api_key = os.getenv("OPENAI_API_KEY")
-if not api_key:
-    print("[Error] OPENAI_API_KEY not set.")
-    exit()
-client = OpenAI(api_key=api_key)
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "..")))
+from navbench.stats import add_sequential_args, make_stopper, seeded_order
+from navbench.sampling import select_comp_lines, stratified_order, comp_strata
+from navbench.images import get_payload
+from navbench.llm import get_controller, require_api_key, init_worker
+from navbench.budget import Budgeted, get_budget
+from navbench.answers import ask, add_answer_args, apply_answer_args
+from navbench.comp_tasks import args_suffix
+
 
 def encode_image(image_path):
-    with open(image_path, "rb") as f:
-        return base64.b64encode(f.read()).decode("utf-8")
+    return get_payload(image_path)
 
 def organize_prompt(current_traj_views, subinstrs):
     encoded_images = [encode_image(view) for view in current_traj_views]
@@ -66,55 +68,75 @@ def extract_index(prediction):
         return int(match.group())
     raise ValueError(f"No number found in prediction: {prediction}")
 
+def score_prediction(item, prediction):
+    gt = item["gt_index"] + 1
+    pred_idx = extract_index(prediction)
+    return {
+        "gt": gt,
+        "pred": pred_idx,
+        "correct": pred_idx == gt,
+        "raw_response": prediction
+    }
+
 def process_one_item(line):
     item = json.loads(line)
     instr_id = item["instr_id"]
     views = item["current_traj_views"]
     sub_instrs = item["sub_instructions"]
-    gt = item["gt_index"] + 1
     try:
-        client = OpenAI(api_key=api_key)
         messages = organize_prompt(views, sub_instrs)
         model = os.environ.get("OPENAI_MODEL", "gpt-4o")
-        response = client.chat.completions.create(
-            model=model,
-            messages=messages,
-            temperature=0.0
-        )
-        prediction = response.choices[0].message.content
-        pred_idx = extract_index(prediction)
-        return (instr_id, {
-            "gt": gt,
-            "pred": pred_idx,
-            "correct": pred_idx == gt,
-            "raw_response": prediction
-        })
+        prediction, extra = ask(model, messages, "progress", item)
+        return (instr_id, dict(score_prediction(item, prediction), **extra))
     except Exception as e:
         return (instr_id, {"error": str(e)})
 
-def run_evaluation(max_samples=None, n_processes=4):
+def run_evaluation(max_samples=None, n_processes=4, stopper=None, seed=0, subset_file=None, suffix=""):
     with open("progress_data.jsonl", "r") as f:
         lines = f.readlines()
+    lines = select_comp_lines(lines, subset_file, "progress_data.jsonl")
+    if get_budget() is not None:
+        # most informative first: every prefix is a stratified sample, so a cut-short run stays representative
+        lines = [lines[i] for i in stratified_order([json.loads(l) for l in lines], comp_strata, seed)]
+    elif stopper is not None:
+        lines = [lines[i] for i in seeded_order(len(lines), seed)]
     if max_samples is not None:
         lines = lines[:max_samples]
 
-    with Pool(processes=n_processes) as pool:
-        results = list(tqdm(pool.imap(process_one_item, lines), total=len(lines)))
+    with Pool(processes=n_processes, initializer=init_worker, initargs=(get_controller(), get_budget())) as pool:
+        results = []
+        for result in tqdm(pool.imap(Budgeted(process_one_item), lines), total=len(lines)):
+            if result is None:
+                continue  # not started: the run budget is used up
+            results.append(result)
+            if stopper is not None and "correct" in result[1] and stopper.update(result[1]["correct"]):
+                print(f"[Sequential] Early stop: {stopper.summary()}")
+                break
 
     results_dict = {k: v for k, v in results}
     correct = sum(1 for v in results_dict.values() if v.get("correct"))
     total = sum(1 for v in results_dict.values() if "correct" in v)
 
     os.makedirs("results", exist_ok=True)
-    with open("results/progress_results_gpt4o.json", "w") as f:
+    with open(f"results/progress_results_gpt4o{suffix}.json", "w") as f:
         json.dump(results_dict, f, indent=2)
 
     print(f"Accuracy: {correct}/{total} = {correct / total:.2%}" if total > 0 else "No valid results.")
+    print(f"[Requests] {get_controller().summary()}")
+    if get_budget() is not None:
+        print(f"[Budget] {get_budget().summary(len(results), len(lines))}")
+        get_budget().save_ledger()
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--max_items", type=int, default=None, help="Only evaluate this number of items")
     parser.add_argument("--n_processes", type=int, default=4, help="Number of processes to use")
+    parser.add_argument("--subset_file", type=str, default=None, help="Subset index file from navbench.sampling")
+    add_sequential_args(parser)
+    add_answer_args(parser)
     args = parser.parse_args()
+    apply_answer_args(args)
+    require_api_key()
     
-    run_evaluation(max_samples=args.max_items, n_processes=args.n_processes)
+    run_evaluation(max_samples=args.max_items, n_processes=args.n_processes, stopper=make_stopper(args), seed=args.seed,
+                   subset_file=args.subset_file, suffix=args_suffix(args, get_budget() is not None))
@@ -1,26 +1,17 @@
-from openai import OpenAI
-import base64
 import os
-from tenacity import (
-    retry,
-    stop_after_attempt,
-    wait_random_exponential,
-)  # for exponential backoff
+import sys
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from navbench.images import get_payload
+from navbench.llm import chat_completion, stream_completion
 
-api_key = os.getenv("OPENAI_API_KEY")
-if not api_key:
-    print("[Error] OPENAI_API_KEY not set.")
-    exit()
-client = OpenAI(api_key=api_key)
 
-
-@retry(wait=wait_random_exponential(min=1, max=60), stop=stop_after_attempt(6))
 def completion_with_backoff(**kwargs):
-    return client.chat.completions.create(**kwargs)
+    # retries and backoff are shared with every other request of the run (navbench/llm.py)
+    return chat_completion(**kwargs)
 
 
-def gpt_infer(system, text, image_list, model="gpt-4o", max_tokens=600, response_format=None):
+def make_messages(system, text, image_list):
 
     user_content = []
     for i, image in enumerate(image_list):
@@ -32,8 +23,8 @@ def gpt_infer(system, text, image_list, model="gpt-4o", max_tokens=600, response
                 },
             )
 
-            with open(image, "rb") as image_file:
-                image_base64 = base64.b64encode(image_file.read()).decode('utf-8')
+            # node images are re-sent at every step, so they are encoded once and shared
+            image_base64 = get_payload(image)
 
             image_message = {
                      "type": "image_url",
@@ -59,6 +50,12 @@ def gpt_infer(system, text, image_list, model="gpt-4o", max_tokens=600, response
          "content": user_content
          }
     ]
+    return messages
+
+
+def gpt_infer(system, text, image_list, model="gpt-4o", max_tokens=600, response_format=None):
+
+    messages = make_messages(system, text, image_list)
 
     if response_format:
         chat_message = completion_with_backoff(model=model, messages=messages, temperature=0.0, max_tokens=max_tokens, response_format=response_format)
@@ -69,4 +66,27 @@ def gpt_infer(system, text, image_list, model="gpt-4o", max_tokens=600, response
     answer = chat_message.choices[0].message.content
     tokens = chat_message.usage
 
-    return answer, tokens
\ No newline at end of file
+    return answer, tokens
+
+
+def gpt_infer_stream(system, text, image_list, model="gpt-4o", max_tokens=600, response_format=None, watch=None):
+    """ gpt_infer with a streamed answer; watch(text, elapsed) sees the partial answer and may cancel the rest """
+    kwargs = dict(model=model, messages=make_messages(system, text, image_list), temperature=0.0, max_tokens=max_tokens)
+    if response_format:
+        kwargs['response_format'] = response_format
+    return stream_completion(watch=watch, **kwargs)
+
+
+def stream_report(timings):
+    """ Mean time to first token / to the action / to the end of the answer of streamed steps (seconds) """
+    def mean(key):
+        values = [t[key] for t in timings if t.get(key) is not None]
+        return round(sum(values) / len(values), 3) if values else None
+
+    return {
+        'steps': len(timings),
+        'mean_ttft_s': mean('ttft'),
+        'mean_time_to_action_s': mean('time_to_action'),
+        'mean_total_s': mean('total'),
+        'cancelled': sum(1 for t in timings if t['cancelled']),
+    }
\ No newline at end of file
@@ -1,7 +1,33 @@
+import os
 import re
+import sys
+import json
 import math
 from ipdb import set_trace
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from navbench.tokens import image_tokens, text_tokens
+
+INIT_HISTORY = 'The navigation has just begun, with no history.'
+MAX_COMPACTION = 2
+LEAN_JSON_TOKENS = 20
+
+def prompt_size_report(sizes):
+    """ Per-step request sizes (make_prompt) of a run: mean / max estimated input tokens and the share compaction saved """
+    if not sizes:
+        return {'steps': 0}
+    tokens = sum(s['tokens'] for s in sizes)
+    full_tokens = sum(s['full_tokens'] for s in sizes)
+    return {
+        'steps': len(sizes),
+        'mean_tokens': round(tokens / len(sizes), 1),
+        'max_tokens': max(s['tokens'] for s in sizes),
+        'mean_full_tokens': round(full_tokens / len(sizes), 1),
+        'compacted_steps': sum(1 for s in sizes if s['compaction']),
+        'saved_share': round(1 - tokens / full_tokens, 4) if full_tokens else None,
+    }
+
+
 class OneStagePromptManager(object):
     def __init__(self, args):
 
@@ -14,6 +40,10 @@ class OneStagePromptManager(object):
         self.planning = [["Navigation has just started, with no planning yet."] for _ in range(self.args.batch_size)]
         self.use_map = getattr(args, 'use_map', False)  
         self.use_trajectory = getattr(args, 'use_trajectory', True)  
+        self.prompt_budget = getattr(args, 'prompt_budget', None)
+        self.keep_recent = max(1, getattr(args, 'keep_recent_steps', 3))
+        self.lean = getattr(args, 'output_mode', 'full') == 'lean'
+        self.lean_planning_words = getattr(args, 'lean_planning_words', 30)
 
     def get_action_concept(self, rel_heading, rel_elevation):
         if rel_elevation > 0:
@@ -123,7 +153,29 @@ class OneStagePromptManager(object):
             else:
                 self.history[i] += f""", step {str(t)}: {last_action}"""
 
-    def make_map_prompt(self, i):
+    def history_text(self, i, level=0):
+        """
+        'History' of the prompt. Compaction level 1 keeps the last keep_recent steps verbatim and collapses the
+        older ones into the Places they moved through; level 2 keeps only the last step verbatim.
+        """
+        steps = re.findall(r"step (\d+): (.*?)(?=, step \d+: |$)", self.history[i])
+        keep = self.keep_recent if level == 1 else 1
+        if level == 0 or len(steps) <= keep:
+            return self.history[i]
+        old, recent = steps[:-keep], steps[-keep:]
+        places = [place for _, action in old for place in re.findall(r"Place (\d+)", action)]
+        if len(old) == 1:
+            text = f"""step {old[0][0]}: moved to Place {', '.join(places)}"""
+        else:
+            text = f"""steps {old[0][0]}-{old[-1][0]}: moved through Places {', '.join(places)}"""
+        return text + ''.join(f""", step {t}: {action}""" for t, action in recent)
+
+    def make_map_prompt(self, i, level=0):
+        """
+        Trajectory, map and ghost node texts. From compaction level 1 on, the connections of visited Places whose
+        neighbours were all visited are left out of the map; level 2 also shortens the trajectory to its start and
+        last steps and lists the ghost nodes on one line.
+        """
         # graph-related text
         trajectory = self.trajectory[i]
         nodes_list = self.nodes_list[i]
@@ -134,14 +186,21 @@ class OneStagePromptManager(object):
         graph_text = ''
 
         candidate_nodes = graph[trajectory[-1]]
+        shown = trajectory
+        if level >= 2 and len(trajectory) > self.keep_recent + 2:
+            shown = trajectory[:1] + [None] + trajectory[-(self.keep_recent + 1):]
 
-        # trajectory and map connectivity
+        for node in shown:
+            trajectory_text += ' ...' if node is None else f""" {nodes_list.index(node)}"""
+
+        # map connectivity
         for node in trajectory:
             node_index = nodes_list.index(node)
-            trajectory_text += f""" {node_index}"""
 
             if node not in no_dup_nodes:
                 no_dup_nodes.append(node)
+                if level >= 1 and node != trajectory[-1] and all(adj in trajectory for adj in graph[node]):
+                    continue        # fully explored
 
                 adj_text = ''
                 adjacent_nodes = graph[node]
@@ -154,18 +213,62 @@ class OneStagePromptManager(object):
         # ghost nodes info
         graph_supp_text = ''
         supp_exist = None
+        ghosts = []
         for node_index, node in enumerate(nodes_list):
 
             if node in trajectory or node in candidate_nodes:
                 continue
             supp_exist = True
+            ghosts.append(str(node_index))
             graph_supp_text += f"""\nPlace {node_index}, which is corresponding to Image {node_index}"""
 
         if supp_exist is None:
             graph_supp_text = """Nothing yet."""
+        elif level >= 2:
+            graph_supp_text = f"""\nPlaces {', '.join(ghosts)}, which are corresponding to Images {', '.join(ghosts)}"""
 
         return trajectory_text, graph_text, graph_supp_text
 
+    def prompt_text(self, i, instruction, action_options, t, level=0):
+        prompt_parts = [f"Instruction: {instruction}"]
+
+        if t == 0:
+            prompt_parts.append(f"History: {INIT_HISTORY}")
+        else:
+            prompt_parts.append(f"History: {self.history_text(i, level)}")
+
+        if self.use_trajectory or self.use_map:
+            trajectory_text, graph_text, graph_supp_text = self.make_map_prompt(i, level)
+            if self.use_trajectory:
+                prompt_parts.append(f"Trajectory: {trajectory_text}")
+            if self.use_map:
+                prompt_parts.extend([f"Map:{graph_text}", f"Supplementary Info: {graph_supp_text}"])
+
+        prompt_parts.extend([
+            f"Previous Planning:\n{self.planning[i][-1]}",
+            f"Action options (step {str(t)}): {action_options}"
+        ])
+
+        return "\n".join(prompt_parts)
+
+    def make_prompt(self, i, instruction, action_options, t, task_description):
+        """
+        Prompt of step t. With a prompt_budget (estimated input tokens of the whole request, images included), the
+        compaction level is raised until the request fits or MAX_COMPACTION is reached.
+        Returns the prompt and its size: {'tokens', 'full_tokens' (uncompacted), 'compaction'}.
+        """
+        n_images = sum(1 for image in self.node_imgs[i] if image is not None)
+        fixed = text_tokens(task_description) + n_images * image_tokens(0, 0, detail="low")
+        full_tokens = None
+        for level in range(MAX_COMPACTION + 1 if self.prompt_budget else 1):
+            prompt = self.prompt_text(i, instruction, action_options, t, level)
+            tokens = fixed + text_tokens(prompt)
+            if full_tokens is None:
+                full_tokens = tokens
+            if not self.prompt_budget or tokens <= self.prompt_budget:
+                break
+        return prompt, {'tokens': tokens, 'full_tokens': full_tokens, 'compaction': level}
+
     def make_r2r_prompts(self, obs, cand_inputs, t):
         background = """You are an embodied robot that navigates in the real world."""
         background_supp = """You need to explore between some places marked with IDs and ultimately find the destination to stop.""" \
@@ -201,41 +304,22 @@ class OneStagePromptManager(object):
         task_description_parts.extend([pre_planning, option, requirement, dist_require, thought, new_planning, action])
         task_description = "\n".join(task_description_parts)
 
-        init_history = 'The navigation has just begun, with no history.'
-
         batch_size = len(obs)
         action_options_batch, only_options_batch = self.make_action_options(cand_inputs, t=t)
         prompt_batch = []
+        prompt_sizes = []
         for i in range(batch_size):
-            instruction = obs[i]["instruction"]
-            prompt_parts = [f"Instruction: {instruction}"]
-            
-            if t == 0:
-                prompt_parts.append(f"History: {init_history}")
-            else:
-                prompt_parts.append(f"History: {self.history[i]}")
-
-            if self.use_trajectory or self.use_map:
-                trajectory_text, graph_text, graph_supp_text = self.make_map_prompt(i)
-                if self.use_trajectory:
-                    prompt_parts.append(f"Trajectory: {trajectory_text}")
-                if self.use_map:
-                    prompt_parts.extend([f"Map:{graph_text}", f"Supplementary Info: {graph_supp_text}"])
-
-            prompt_parts.extend([
-                f"Previous Planning:\n{self.planning[i][-1]}",
-                f"Action options (step {str(t)}): {action_options_batch[i]}"
-            ])
-            
-            prompt = "\n".join(prompt_parts)
+            prompt, size = self.make_prompt(i, obs[i]["instruction"], action_options_batch[i], t, task_description)
             prompt_batch.append(prompt)
+            prompt_sizes.append(size)
 
         nav_input = {
             "task_description": task_description,
             "prompts" : prompt_batch,
             "only_options": only_options_batch,
             "action_options": action_options_batch,
-            "only_actions": cand_inputs["action_prompts"]
+            "only_actions": cand_inputs["action_prompts"],
+            "prompt_sizes": prompt_sizes,
         }
 
         return nav_input
@@ -267,6 +351,16 @@ class OneStagePromptManager(object):
         dist_require = """If you can already see the destination, estimate the distance between you and it. If the distance is far, continue moving and try to stop within 1 meter of the destination."""
         action = """At the end of your output, you must provide a single capital letter in the 'Action options' that corresponds to the action you have decided to take, and place only the letter into 'Action', such as "Action: A"."""
 
+        if self.lean:
+            # lean output: no written reasoning, the action first and a short planning
+            if self.use_map:
+                sources = """'Instruction', 'Trajectory', 'Map', 'Supplementary Info', your past 'History', 'Previous Planning', 'Action options', and the provided images"""
+            else:
+                sources = """'Instruction', your past 'History', 'Previous Planning', 'Action options', and the provided images"""
+            thought = f"""Your answer should be JSON format and must include exactly two fields: 'Action' and 'New Planning'. Do not write out your reasoning. You need to combine {sources} to decide what to do next."""
+            new_planning = f"""After 'Action', update your multi-step path planning in 'New Planning', in at most {self.lean_planning_words} words."""
+            action = """'Action' must be the single capital letter in the 'Action options' that corresponds to the action you have decided to take, such as "A"."""
+
         task_description_parts = [background, background_supp, instr_des, history]
         if self.use_trajectory:
             task_description_parts.append(traj_info)
@@ -275,41 +369,22 @@ class OneStagePromptManager(object):
         task_description_parts.extend([pre_planning, option, requirement, dist_require, thought, new_planning, action])
         task_description = "\n".join(task_description_parts)
 
-        init_history = 'The navigation has just begun, with no history.'
-
         batch_size = len(obs)
         action_options_batch, only_options_batch = self.make_action_options(cand_inputs, t=t)
         prompt_batch = []
+        prompt_sizes = []
         for i in range(batch_size):
-            instruction = obs[i]["instruction"]
-            prompt_parts = [f"Instruction: {instruction}"]
-            
-            if t == 0:
-                prompt_parts.append(f"History: {init_history}")
-            else:
-                prompt_parts.append(f"History: {self.history[i]}")
-
-            if self.use_trajectory or self.use_map:
-                trajectory_text, graph_text, graph_supp_text = self.make_map_prompt(i)
-                if self.use_trajectory:
-                    prompt_parts.append(f"Trajectory: {trajectory_text}")
-                if self.use_map:
-                    prompt_parts.extend([f"Map:{graph_text}", f"Supplementary Info: {graph_supp_text}"])
-
-            prompt_parts.extend([
-                f"Previous Planning:\n{self.planning[i][-1]}",
-                f"Action options (step {str(t)}): {action_options_batch[i]}"
-            ])
-            
-            prompt = "\n".join(prompt_parts)
+            prompt, size = self.make_prompt(i, obs[i]["instruction"], action_options_batch[i], t, task_description)
             prompt_batch.append(prompt)
+            prompt_sizes.append(size)
 
         nav_input = {
             "task_description": task_description,
             "prompts" : prompt_batch,
             "only_options": only_options_batch,
             "action_options": action_options_batch,
-            "only_actions": cand_inputs["action_prompts"]
+            "only_actions": cand_inputs["action_prompts"],
+            "prompt_sizes": prompt_sizes,
         }
 
         return nav_input
@@ -338,11 +413,71 @@ class OneStagePromptManager(object):
 
         return planning
 
+    def output_format(self, only_options):
+        """
+        (response_format, max_tokens) of a JSON step request. Lean mode asks for a minimal schema, the action
+        restricted to the option letters and then the planning, and derives max_tokens from it: the planning
+        cap at ~2 tokens per word plus the JSON around it.
+        """
+        if not self.lean:
+            return {"type": "json_object"}, self.args.max_tokens
+        schema = {
+            "type": "object",
+            "properties": {
+                "Action": {"type": "string", "enum": list(only_options)},
+                "New Planning": {"type": "string"},
+            },
+            "required": ["Action", "New Planning"],
+            "additionalProperties": False,
+        }
+        max_tokens = 2 * self.lean_planning_words + LEAN_JSON_TOKENS
+        return {"type": "json_schema", "json_schema": {"name": "navigation_step", "strict": True, "schema": schema}}, \
+            min(max_tokens, self.args.max_tokens)
+
+    def early_fields(self, text):
+        """
+        The fields already complete in a partial answer, for streamed steps: 'Action' as soon as its letter is in,
+        'New Planning' once its string is closed. JSON answers only count the "Action": "X" key, since the same
+        words can appear inside the Thought string; plain-text answers count an "Action: X" line.
+        """
+        fields = {}
+        if self.args.response_format == 'json':
+            action = re.search(r'"Action"\s*:\s*"([A-Z])"', text)
+        else:
+            action = re.search(r"^Action:\s*([A-M])\b", text, re.MULTILINE)
+        if action:
+            fields["Action"] = action.group(1)
+        planning = re.search(r'"New Planning"\s*:\s*"((?:[^"\\]|\\.)*)"', text)
+        if planning:
+            fields["New Planning"] = json.loads('"%s"' % planning.group(1))
+        return fields
+
+    def parse_json_output(self, nav_output):
+        """
+        The JSON answer of a step as a dict. A lean answer cut short by max_tokens still has its action, so the
+        fields that are complete (and a truncated planning) are recovered instead of failing.
+        """
+        try:
+            return json.loads(nav_output)
+        except json.JSONDecodeError:
+            if not self.lean:
+                raise
+        json_output = {}
+        action = re.search(r'"Action"\s*:\s*"([A-Z])"', nav_output)
+        if action:
+            json_output["Action"] = action.group(1)
+        planning = re.search(r'"New Planning"\s*:\s*"((?:[^"\\]|\\.)*)', nav_output)
+        if planning:
+            json_output["New Planning"] = planning.group(1)
+        return json_output
+
     def parse_json_planning(self, json_output):
         try:
             planning = json_output["New Planning"]
         except:
             planning = "No plans currently."
+        if self.lean:
+            planning = ' '.join(str(planning).split()[:self.lean_planning_words])
 
         self.planning[0].append(planning)
         return planning
@@ -1,10 +1,23 @@
 import os
+import sys
 import json
 import time
+import subprocess
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 
-from vln.env import R2RNavBatch
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from navbench.sampling import select_exec_items, stratified_order, exec_strata
+from navbench.budget import Budgeted, apply_budget_args, get_budget
+from navbench.scheduling import order_episodes, interleave_for_shards
+from navbench.preflight import run_preflight
+from navbench.llm import get_controller, request_stats, require_api_key
+from navbench.work_queue import WorkQueue, exec_queue
+
+from vln.env import R2RNavBatch, average_metrics, precompile_candidates
+from vln.nav_cache import NavCache
 from vln.parser import parse_args
+from vln.agent_base import run_tags, score_line
 
 from utils.data import set_random_seed
 from utils.logger import write_to_record_file
@@ -12,11 +25,8 @@ from utils.logger import write_to_record_file
 from vln.gpt_agent import GPTNavAgent
 
 
-def build_dataset(args, rank=0, is_test=True):
-    dataset_class = R2RNavBatch
+def load_episodes(args):
     split = args.split
-    val_envs = {}
-
     with open(os.path.join(args.anno_dir, split+'.json'), 'r') as f:
         val_instr_data = json.load(f)
 
@@ -24,12 +34,38 @@ def build_dataset(args, rank=0, is_test=True):
         args.end = len(val_instr_data)
     val_instr_data = val_instr_data[args.start:args.end]
     print(f'------------------ Evaluate {args.start}-{args.end} in {split} ------------------')
+    if args.subset_file:
+        val_instr_data = select_exec_items(val_instr_data, args.subset_file, split)
+        print(f'Using {len(val_instr_data)} episodes from subset {args.subset_file}')
+
+    if args.episode_order:
+        val_instr_data = order_episodes(val_instr_data, args.max_action_len, args.stop_after, args.episode_order)
+    elif get_budget() is not None:
+        # most informative first: every prefix is a stratified sample, so a cut-short split stays representative
+        val_instr_data = [val_instr_data[i] for i in stratified_order(val_instr_data, exec_strata, args.seed)]
+    if args.num_workers > 1:
+        val_instr_data = interleave_for_shards(val_instr_data, args.num_workers)
+    return val_instr_data
+
+
+def build_dataset(args, rank=0, is_test=True):
+    dataset_class = R2RNavBatch
+    split = args.split
+    val_envs = {}
+
+    val_instr_data = load_episodes(args)
 
     val_env = dataset_class(
         val_instr_data, args.connectivity_dir, batch_size=args.batch_size,
         seed=args.seed+rank,
         name=split, args=args,
+        sel_data_idxs=None if args.shard is None else (args.shard, args.num_workers),
     )   # evaluation using all objects
+    if args.shard is not None:
+        # resume: episodes with a case file were done by an earlier run
+        done = read_cases(args.case_dir)
+        val_env.data = [x for x in val_env.data if x['instr_id'] not in done]
+        print('Shard %d/%d: %d episodes to run' % (args.shard, args.num_workers, len(val_env.data)))
     val_envs[split] = val_env
 
     return val_envs
@@ -62,6 +98,30 @@ def valid(args, val_envs, rank=0):
         print('running...')
         agent.test(args=args)
         print(env_name, 'cost time: %.2fs' % (time.time() - start_time))
+        stats = request_stats()
+        stats['nav_cache'] = env.nav_cache.report()
+        print('Cache:', env.nav_cache.summary())
+        stats['output_mode'] = args.output_mode
+        stats['prompt_sizes'] = agent.prompt_size_report()
+        if args.prompt_budget:
+            print('Prompt sizes:', stats['prompt_sizes'])
+        if args.stream:
+            stats['streaming'] = agent.stream_report()
+            print('Streaming:', stats['streaming'])
+        if agent.loop_monitor is not None:
+            stats['loop_monitor'] = agent.loop_monitor.report()
+            print('Loop monitor:', agent.loop_monitor.summary())
+        if agent.replay is not None:
+            stats['replay'] = agent.replay.report()
+            print('Replay:', agent.replay.summary())
+        if get_budget() is not None:
+            stats['coverage'] = get_budget().coverage(len(agent.results), env.size())
+            print('Budget:', get_budget().summary(len(agent.results), env.size()))
+        print('Requests:', get_controller().summary())
+        if 'hedging' in stats:
+            print('Hedging:', stats['hedging'])
+        with open(os.path.join(args.log_dir, 'run_stats_%s.json' % env_name), 'w') as outf:
+            json.dump(stats, outf, indent=4)
         preds = agent.get_results(detailed_output=args.detailed_output)
 
         if default_gpu:
@@ -80,11 +140,254 @@ def valid(args, val_envs, rank=0):
                 )
                 
 
+def case_dir(args):
+    return os.path.join(args.pred_dir, 'cases_%s' % args.split)
+
+
+def read_cases(path):
+    ''' {instr_id: case} of the per-case outputs written by shard processes '''
+    cases = {}
+    if not os.path.isdir(path):
+        return cases
+    for name in os.listdir(path):
+        if name.endswith('.json'):
+            with open(os.path.join(path, name)) as f:
+                case = json.load(f)
+            cases[case['instr_id']] = case
+    return cases
+
+
+def print_progress(cases, shard_sizes, running):
+    done = [sum(1 for c in cases.values() if c.get('shard') == i) for i in range(len(shard_sizes))]
+    success = [s for c in cases.values() for s in c['evaluation']['success']]
+    sr = ' sr so far: %.2f' % (100 * sum(success) / len(success)) if success else ''
+    print('[Progress] %d/%d episodes (%s), %d shards running%s' % (
+        sum(done), sum(shard_sizes), ' '.join('%d/%d' % x for x in zip(done, shard_sizes)), running, sr), flush=True)
+
+
+def launch_shards(args):
+    ''' Run the split in args.num_workers processes (sel_data_idxs shards) and merge their per-case outputs. '''
+    prefix = 'submit' if args.detailed_output is False else 'detail'
+    pred_file = os.path.join(args.pred_dir, "%s_%s.json" % (prefix, args.split))
+    if os.path.exists(pred_file):
+        print('Path already exists...')
+        return
+    items = load_episodes(args)
+    n = args.num_workers
+    shard_sizes = [len(items) // n] * (n - 1) + [len(items) - (len(items) // n) * (n - 1)]
+    os.makedirs(case_dir(args), exist_ok=True)
+
+    # distance and candidate tables are built once here; the shards memory-map them read-only
+    store = args.nav_store or os.path.join(args.output_dir, 'nav_store')
+    scans = set(x['scan'] for x in items)
+    start_time = time.time()
+    nav_cache = NavCache(args.connectivity_dir, max_bytes=1, store_dir=store)  # one scan resident at a time
+    nav_cache.load_scans(scans)
+    precompile_candidates(nav_cache, scans)
+    print('Shared tables for %d scans in %s (%.1fs)' % (len(scans), store, time.time() - start_time))
+
+    # concurrent shards split the token / cost budget; the deadline holds for all of them
+    env = dict(os.environ)
+    for key in ('NAVBENCH_BUDGET_TOKENS', 'NAVBENCH_BUDGET_USD'):
+        if env.get(key):
+            env[key] = str(float(env[key]) / n)
+    procs = []
+    for shard in range(n):
+        shard_log_dir = os.path.join(args.log_dir, 'shard%d' % shard)
+        os.makedirs(shard_log_dir, exist_ok=True)
+        stdout = open(os.path.join(shard_log_dir, 'stdout.txt'), 'a')
+        cmd = [sys.executable, os.path.abspath(__file__)] + sys.argv[1:] + \
+              ['--shard', str(shard), '--nav_store', store, '--nav_mmap']
+        procs.append(subprocess.Popen(cmd, stdout=stdout, stderr=subprocess.STDOUT, env=env))
+    print('Started %d shard processes for %d episodes of %s (logs in %s/shard*/)' % (n, len(items), args.split, args.log_dir))
+
+    start_time = time.time()
+    while any(p.poll() is None for p in procs):
+        time.sleep(args.progress_interval)
+        print_progress(read_cases(case_dir(args)), shard_sizes, sum(p.poll() is None for p in procs))
+    failed = [i for i, p in enumerate(procs) if p.returncode != 0]
+    print(args.split, 'cost time: %.2fs' % (time.time() - start_time))
+    if failed:
+        print('[Error] shards %s failed, see %s/shard*/stdout.txt; rerun to resume' % (failed, args.log_dir))
+
+    cases = read_cases(case_dir(args))
+    print_progress(cases, shard_sizes, 0)
+    merge_shards(args, items, cases, pred_file)
+    if failed:
+        sys.exit(1)
+
+
+def merge_shards(args, items, cases, pred_file):
+    ''' One submit_<split>.json and one metrics summary from the per-case outputs. '''
+    cases = [cases[x['instr_id']] for x in items if x['instr_id'] in cases]
+    if not cases:
+        print('No episode was evaluated.')
+        return
+    keys = ['instr_id', 'trajectory', 'a_t'] + (['details'] if args.detailed_output else [])
+    preds = [{k: c[k] for k in keys + ['loop_monitor'] if k in c} for c in cases]
+    metrics = defaultdict(list)
+    for c in cases:
+        for k, v in c['evaluation'].items():
+            metrics[k] += v
+    score_summary = average_metrics(metrics)
+
+    loss_str = score_line("All cases", score_summary, args)
+    if len(cases) < len(items):
+        loss_str += '  (coverage %d/%d)' % (len(cases), len(items))
+    write_to_record_file(loss_str + '\n', os.path.join(args.log_dir, 'valid.txt'))
+    with open(os.path.join(args.log_dir, 'metrics_%s.json' % args.split), 'w') as outf:
+        json.dump({'split': args.split, 'episodes': len(cases), 'total': len(items), 'num_workers': args.num_workers,
+                   'output_mode': args.output_mode,
+                   'scores': {k: float(v) for k, v in score_summary.items()}}, outf, indent=4)
+    json.dump(
+        preds,
+        open(pred_file, 'w'),
+        sort_keys=True, indent=4, separators=(',', ': ')
+    )
+
+
+def run_queue_worker(args):
+    ''' Run episodes of the split leased from the shared work queue (navbench/work_queue.py) until none is left. '''
+    items = load_episodes(args)
+    by_id = {str(x['instr_id']): x for x in items}   # job ids are text
+    wq = WorkQueue(args.queue)
+    queue = exec_queue(args.split)
+    wq.add(queue, [(job_id, None) for job_id in by_id])   # idempotent: whichever worker comes first enqueues
+
+    env = build_dataset(args)[args.split]
+    agent = GPTNavAgent(args, env)
+    budget = get_budget()
+
+    def run_episode(instr_id, payload):
+        if budget is not None and not budget.try_start():
+            print('Budget stop (%s)' % budget.stop_reason)
+            return None
+        start_time = time.time()
+        env.data, env.ix = [by_id[instr_id]], 0
+        agent.results = {}
+        try:
+            traj = agent.rollout()[0]
+        except Exception:
+            if budget is not None:
+                budget.cancel()
+            raise
+        agent.results[traj['instr_id']] = traj
+        if budget is not None:
+            budget.finish(time.time() - start_time)
+        metrics = agent.evaluate_case(args)
+        return dict(agent.get_results(detailed_output=args.detailed_output)[-1], evaluation=metrics)
+
+    start_time = time.time()
+    # --start/--end/--subset_file: claim only the selected episodes of a queue that may hold the full split
+    stored = wq.run(queue, run_episode, lease_seconds=args.lease_seconds, job_ids=list(by_id))
+    print(args.split, 'cost time: %.2fs' % (time.time() - start_time))
+    cases = {by_id[job_id]['instr_id']: case for job_id, case in wq.results(queue).items() if job_id in by_id}
+    print('Queue %s: %d episodes run here, %d/%d done' % (queue, stored, len(cases), len(items)))
+    with open(os.path.join(args.log_dir, 'run_stats_%s.json' % args.split), 'w') as outf:
+        json.dump(dict(request_stats(), nav_cache=env.nav_cache.report()), outf, indent=4)
+    if len(cases) == len(items):
+        prefix = 'submit' if args.detailed_output is False else 'detail'
+        merge_shards(args, items, cases, os.path.join(args.pred_dir, "%s_%s.json" % (prefix, args.split)))
+
+
+def step_accuracy(records):
+    ''' Teacher-forced scores (%): all steps, move and stop steps, episodes with every step right, and per step t. '''
+    def acc(rs):
+        return 100 * sum(r['correct'] for r in rs) / len(rs) if rs else None
+
+    episodes = defaultdict(list)
+    per_step = defaultdict(list)
+    for r in records:
+        episodes[r['instr_id']].append(r['correct'])
+        per_step[r['t']].append(r)
+    return {
+        'step_acc': acc(records),
+        'move_acc': acc([r for r in records if r['expert'] != 0]),
+        'stop_acc': acc([r for r in records if r['expert'] == 0]),
+        'episode_acc': 100 * sum(all(c) for c in episodes.values()) / len(episodes) if episodes else None,
+        'steps': len(records),
+        'episodes': len(episodes),
+        'per_step': {t: acc(per_step[t]) for t in sorted(per_step)},
+    }
+
+
+def run_teacher_forced(args):
+    ''' --eval_mode teacher_forced: next-action accuracy along the expert paths, every step an independent request. '''
+    out_file = os.path.join(args.pred_dir, 'teacher_forced_%s.json' % args.split)
+    if os.path.exists(out_file):
+        print('Path already exists...', out_file)
+        return
+    env = build_dataset(args)[args.split]
+    agent = GPTNavAgent(args, env)
+    steps = [step for item in env.data for step in agent.expert_steps(item)]
+    print('Teacher forcing: %d steps of %d episodes, %d requests in parallel' % (
+        len(steps), env.size(), args.tf_workers))
+
+    start_time = time.time()
+    with ThreadPoolExecutor(max_workers=args.tf_workers) as pool:
+        actions = list(pool.map(Budgeted(agent.predict_step), steps))
+    print(args.split, 'cost time: %.2fs' % (time.time() - start_time))
+
+    records = [
+        {'instr_id': step['instr_id'], 't': step['t'], 'viewpoint': step['viewpoint'], 'expert': step['expert'],
+         'a_t': a_t, 'correct': a_t == step['expert']}
+        for step, a_t in zip(steps, actions) if a_t is not None     # None: refused by the run budget
+    ]
+    scores = step_accuracy(records)
+    loss_str = 'Teacher forced  -'
+    for metric in ('step_acc', 'move_acc', 'stop_acc', 'episode_acc'):
+        if scores[metric] is not None:
+            loss_str += '  %s: %.2f' % (metric, scores[metric])
+    if len(records) < len(steps):
+        loss_str += '  (coverage %d/%d steps)' % (len(records), len(steps))
+    loss_str += run_tags(args)
+    write_to_record_file(loss_str + '\n', os.path.join(args.log_dir, 'valid.txt'))
+
+    stats = request_stats()
+    if get_budget() is not None:
+        stats['coverage'] = get_budget().coverage(len(records), len(steps))
+    with open(os.path.join(args.log_dir, 'run_stats_%s.json' % args.split), 'w') as outf:
+        json.dump(stats, outf, indent=4)
+    with open(os.path.join(args.log_dir, 'metrics_tf_%s.json' % args.split), 'w') as outf:
+        json.dump(dict(scores, split=args.split, output_mode=args.output_mode), outf, indent=4)
+    json.dump(records, open(out_file, 'w'), sort_keys=True, indent=4, separators=(',', ': '))
+
+
 def main():
     args = parse_args()
     set_random_seed(args.seed)
+    if args.shard is not None:
+        # shard process of launch_shards: budget limits come from the launcher's environment
+        args.log_dir = os.path.join(args.log_dir, 'shard%d' % args.shard)
+        args.case_dir = case_dir(args)
+        args.submit = False
+        require_api_key()
+        val_envs = build_dataset(args)
+        if val_envs[args.split].size():
+            valid(args, val_envs)
+        return
+    apply_budget_args(args)
+    if args.preflight:
+        ok = run_preflight(comp=False, exec_splits=[args.split], img_root=args.img_root,
+                           connectivity_dir=args.connectivity_dir, anno_dir=args.anno_dir,
+                           output=os.path.join(args.log_dir, 'preflight_manifest.json'))
+        if not ok:
+            print('Preflight failed, no API request was made.')
+            sys.exit(1)
+    require_api_key()
+    if args.eval_mode == 'teacher_forced':
+        run_teacher_forced(args)
+        return
+    if args.queue:
+        run_queue_worker(args)
+        return
+    if args.num_workers > 1:
+        launch_shards(args)
+        return
     val_envs = build_dataset(args)
     valid(args, val_envs)
+    if get_budget() is not None:
+        get_budget().save_ledger()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,228 @@
+'''
+Run several Execution splits in one process, sharing navigation graphs and buffered candidate views.
+
+Episodes of all splits are grouped by scan (navbench.scheduling.scan_grouped_order): each scan is loaded once,
+its candidate views are reused by every split, and it is evicted when its last episode is done. Every split keeps
+its own max_action_len (navbench.datasets.EXEC_SPLITS), agent, simulators and "All cases" scores, and by default
+the splits run concurrently, one thread each (--split_workers 1 interleaves them in one thread instead).
+
+    python main_multi_split.py --splits NavBench_Easy NavBench_Medium NavBench_Hard --root_dir datasets ... \
+        --summary_json ../execution_sr_spl_avg.json
+'''
+import os
+import sys
+import copy
+import json
+import time
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from navbench.datasets import EXEC_SPLITS
+from navbench.sampling import select_exec_items
+from navbench.budget import apply_budget_args, get_budget
+from navbench.scheduling import scan_grouped_order
+from navbench.preflight import run_preflight
+from navbench.llm import get_controller, request_stats, require_api_key
+
+from vln.env import R2RNavBatch, average_metrics
+from vln.nav_cache import NavCache
+from vln.parser import parse_args
+from vln.agent_base import score_line
+
+from utils.data import set_random_seed
+from utils.logger import write_to_record_file
+
+from vln.gpt_agent import GPTNavAgent
+
+
+def split_args(args, split):
+    s_args = copy.copy(args)
+    s_args.split = split
+    s_args.max_action_len = EXEC_SPLITS.get(split, args.max_action_len)
+    return s_args
+
+
+def load_split(args, split):
+    with open(os.path.join(args.anno_dir, split+'.json'), 'r') as f:
+        val_instr_data = json.load(f)
+    end = len(val_instr_data) if args.end is None else args.end
+    val_instr_data = val_instr_data[args.start:end]
+    print(f'------------------ Evaluate {args.start}-{end} in {split} ------------------')
+    if args.subset_file:
+        val_instr_data = select_exec_items(val_instr_data, args.subset_file, split)
+        print(f'Using {len(val_instr_data)} episodes from subset {args.subset_file}')
+    return val_instr_data
+
+
+def pred_file(args, split):
+    prefix = 'submit' if args.detailed_output is False else 'detail'
+    return os.path.join(args.pred_dir, "%s_%s.json" % (prefix, split))
+
+
+def build_agents(args, nav_cache):
+    agents = {}
+    for split in args.splits:
+        if os.path.exists(pred_file(args, split)):
+            print('Path already exists...', pred_file(args, split))
+            continue
+        env = R2RNavBatch(
+            load_split(args, split), args.connectivity_dir, batch_size=args.batch_size,
+            seed=args.seed, name=split, args=split_args(args, split), nav_cache=nav_cache,
+        )
+        agents[split] = GPTNavAgent(env.args, env)
+    return agents
+
+
+def schedule(agents):
+    ''' One queue of (split, item) over all splits, grouped by scan; each env's data is put in queue order. '''
+    queue = [(split, item) for split, agent in agents.items() for item in agent.env.data]
+    queue = [queue[i] for i in scan_grouped_order(queue, scan_of=lambda entry: entry[1]['scan'])]
+    for split, agent in agents.items():
+        agent.env.data = [item for s, item in queue if s == split]
+        agent.env.reset_epoch()
+        agent.results = {}
+    return queue
+
+
+def run_episode(agent, item, nav_cache, metrics):
+    ''' Roll out and score the next episode of agent's env; False if the run budget refused to start it. '''
+    budget = get_budget()
+    if budget is not None and not budget.try_start():
+        print('Budget stop (%s) in %s after %d episodes' % (budget.stop_reason, agent.env.name, len(agent.results)))
+        return False
+    start_time = time.time()
+    traj = agent.rollout()[0]
+    assert traj['instr_id'] == item['instr_id'], 'episode order of %s is out of sync' % agent.env.name
+    agent.results[traj['instr_id']] = traj
+    if budget is not None:
+        budget.finish(time.time() - start_time)
+
+    # score before the scan may be evicted
+    for k, v in agent.evaluate_case(agent.args).items():
+        metrics[k] += v
+    nav_cache.episode_done(item['scan'])
+    return True
+
+
+def run(agents, nav_cache, workers=0):
+    queue = schedule(agents)
+    nav_cache.add_episodes(item for _, item in queue)
+    print('Running %d episodes of %d splits over %d scans' % (
+        len(queue), len(agents), len(set(item['scan'] for _, item in queue))))
+    metrics = {split: defaultdict(list) for split in agents}
+    stop = threading.Event()
+
+    def run_queue(entries):
+        for split, item in entries:
+            if stop.is_set() or not run_episode(agents[split], item, nav_cache, metrics[split]):
+                stop.set()
+                break
+
+    if workers == 1:
+        run_queue(queue)
+    else:
+        # one thread per split; every split follows the same scan order, so the splits share hot scans
+        per_split = [[entry for entry in queue if entry[0] == split] for split in agents]
+        with ThreadPoolExecutor(max_workers=workers or len(agents) or 1) as pool:
+            list(pool.map(run_queue, per_split))
+    return metrics
+
+
+def report(args, agents, metrics, nav_cache):
+    record_file = os.path.join(args.log_dir, 'valid.txt')
+    budget = get_budget()
+    scores = {}
+    for split, agent in agents.items():
+        if not metrics[split]['instr_id']:
+            print('%s: no episode was evaluated.' % split)
+            continue
+        scores[split] = average_metrics(metrics[split])
+        loss_str = score_line("All cases", scores[split], args) + '  [%s]' % split
+        if budget is not None:
+            loss_str += '  (%s)' % budget.summary(len(agent.results), agent.env.size())
+        write_to_record_file(loss_str + '\n', record_file)
+
+        if args.submit or args.save_pred:
+            json.dump(
+                agent.get_results(detailed_output=args.detailed_output),
+                open(pred_file(args, split), 'w'),
+                sort_keys=True, indent=4, separators=(',', ': ')
+            )
+
+    stats = request_stats()
+    stats['nav_cache'] = nav_cache.report()
+    stats['output_mode'] = args.output_mode
+    if budget is not None:
+        stats['coverage'] = budget.coverage(sum(len(a.results) for a in agents.values()),
+                                            sum(a.env.size() for a in agents.values()))
+        print('Budget:', budget.summary(stats['coverage']['done'], stats['coverage']['total']))
+    print('Requests:', get_controller().summary())
+    print('Cache:', nav_cache.summary())
+    for split, agent in agents.items():
+        stats.setdefault('prompt_sizes', {})[split] = agent.prompt_size_report()
+        if args.stream:
+            stats.setdefault('streaming', {})[split] = agent.stream_report()
+        if agent.loop_monitor is not None:
+            stats.setdefault('loop_monitor', {})[split] = agent.loop_monitor.report()
+            print('Loop monitor [%s]:' % split, agent.loop_monitor.summary())
+        if agent.replay is not None:
+            stats.setdefault('replay', {})[split] = agent.replay.report()
+            print('Replay [%s]:' % split, agent.replay.summary())
+    with open(os.path.join(args.log_dir, 'run_stats_multi_split.json'), 'w') as outf:
+        json.dump(stats, outf, indent=4)
+    return scores
+
+
+def level(split):
+    return split.rsplit('_', 1)[-1].lower()
+
+
+def write_summary(scores, path):
+    ''' sr / spl per split and their average, e.g. {"easy": {"sr": .., "spl": ..}, ..., "avg": {...}} '''
+    # averaged from the rounded per-split scores, as printed in the "All cases" lines
+    summary = {level(split): {'sr': round(float(s['sr']), 2), 'spl': round(float(s['spl']), 2)}
+               for split, s in scores.items()}
+    avg_sr = sum(s['sr'] for s in summary.values()) / len(summary)
+    avg_spl = sum(s['spl'] for s in summary.values()) / len(summary)
+    print('Average over %s  -  sr: %.2f  spl: %.2f' % ('/'.join(level(split).capitalize() for split in scores),
+                                                      avg_sr, avg_spl))
+    summary['avg'] = {'sr': round(avg_sr, 2), 'spl': round(avg_spl, 2)}
+    with open(path, 'w') as f:
+        f.write(json.dumps(summary, indent=2) + '\n')
+    print('Saved average scores to: %s' % path)
+    return summary
+
+
+def main():
+    args = parse_args()
+    args.splits = args.splits or list(EXEC_SPLITS)
+    set_random_seed(args.seed)
+    apply_budget_args(args)
+    if args.preflight:
+        ok = run_preflight(comp=False, exec_splits=args.splits, img_root=args.img_root,
+                           connectivity_dir=args.connectivity_dir, anno_dir=args.anno_dir,
+                           output=os.path.join(args.log_dir, 'preflight_manifest.json'))
+        if not ok:
+            print('Preflight failed, no API request was made.')
+            sys.exit(1)
+    require_api_key()
+    nav_cache = NavCache.from_args(args.connectivity_dir, args, evict_done=True)
+    agents = build_agents(args, nav_cache)
+    start_time = time.time()
+    metrics = run(agents, nav_cache, args.split_workers)
+    print('cost time: %.2fs' % (time.time() - start_time))
+    scores = report(args, agents, metrics, nav_cache)
+    if get_budget() is not None:
+        get_budget().save_ledger()
+    if args.summary_json:
+        missing = [split for split in args.splits if split not in scores]
+        if missing:
+            print('[Error] No scores for %s, %s not written' % (', '.join(missing), args.summary_json))
+            sys.exit(1)
+        write_summary(scores, args.summary_json)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,16 @@
+DATA_ROOT=datasets
+outdir=${OUTDIR:-${DATA_ROOT}/exprs_map/test/}
+
+# Easy / Medium / Hard in one process (max_action_len 8 / 15 / 20), episodes grouped by scan
+flag="--root_dir ${DATA_ROOT}
+      --img_root RGB_Observations
+      --splits NavBench_Easy NavBench_Medium NavBench_Hard
+      --end 144
+      --output_dir ${outdir}
+      --stop_after 3
+      --llm gpt-4o
+      --response_format json
+      --max_tokens 1000
+      "
+
+python main_multi_split.py $flag ${SUBSET_FILE:+--subset_file "$SUBSET_FILE"} "$@"
@@ -13,4 +13,4 @@ flag="--root_dir ${DATA_ROOT}
       --max_tokens 1000
       "
 
-python main_gpt.py $flag
+python main_gpt.py $flag ${SUBSET_FILE:+--subset_file "$SUBSET_FILE"}
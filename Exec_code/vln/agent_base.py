@@ -1,7 +1,31 @@
 import json
 import os
 import time
+from collections import defaultdict
 from utils.logger import write_to_record_file
+from navbench.budget import get_budget
+from vln.env import average_metrics
+
+
+def score_line(title, score_summary, args=None):
+    loss_str = "%s  -" % title
+    sr = score_summary.get('sr')
+    spl = score_summary.get('spl')
+    if sr is not None:
+        loss_str += '  sr: %.2f' % sr
+    if spl is not None:
+        loss_str += '  spl: %.2f' % spl
+    return loss_str + run_tags(args)
+
+
+def run_tags(args):
+    ''' Marks scores of runs that are not comparable with official ones (loop monitor, lean output) '''
+    tags = ''
+    if getattr(args, 'loop_policy', 'off') != 'off':
+        tags += '  [loop monitor: %s]' % args.loop_policy
+    if getattr(args, 'output_mode', 'full') != 'full':
+        tags += '  [%s output]' % args.output_mode
+    return tags
 
 
 class BaseAgent(object):
@@ -15,6 +39,8 @@ class BaseAgent(object):
         output = []
         for k, v in self.results.items():
             output.append({'instr_id': k, 'trajectory': v['path'], 'a_t': v['a_t']})
+            if 'loop_monitor' in v:
+                output[-1]['loop_monitor'] = v['loop_monitor']
             if detailed_output:
                 output[-1]['details'] = v['details']
         return output
@@ -26,8 +52,18 @@ class BaseAgent(object):
         self.env.reset_epoch(shuffle=(iters is not None))   # If iters is not none, shuffle the env batch
         self.results = {}
         looped = False
+        metrics = defaultdict(list)
+        budget = get_budget()
+        # our own navigation cache releases a scan once its last episode is scored
+        own_cache = not self.env.shared_cache
+        if own_cache:
+            self.env.nav_cache.add_episodes(self.env.data)
 
         while True:
+            if budget is not None and not budget.try_start():
+                print('Budget stop (%s) after %d episodes' % (budget.stop_reason, len(self.results)))
+                break
+            start_time = time.time()
             for traj in self.rollout(**kwargs):
                 if traj is None:
                     looped = True
@@ -36,54 +72,65 @@ class BaseAgent(object):
                     self.results[traj['instr_id']] = traj
 
             if looped:
+                if budget is not None:
+                    budget.cancel()
                 break
+            if budget is not None:
+                budget.finish(time.time() - start_time)
 
-            preds = self.get_results(detailed_output=args.detailed_output)
-            current_pred = [preds[-1]]
-
-            # evaluating current case
-            score_summary, current_metrics = self.env.eval_metrics(current_pred, args.dataset)
-
-            sr = score_summary.get('sr')
-            spl = score_summary.get('spl')
-
-            loss_str = "Current case  -"
-            if sr is not None:
-                loss_str += '  sr: %.2f' % sr
-            if spl is not None:
-                loss_str += '  spl: %.2f' % spl
-
-            print(loss_str)
-
-            # add evaluation result
-            instr_id = preds[-1]['instr_id']
-            scan, gt_traj = self.env.gt_trajs[instr_id]
-
-            preds[-1]['scan'] = scan
-            preds[-1]['gt_traj'] = gt_traj
-            preds[-1]['evaluation'] = current_metrics
+            for k, v in self.evaluate_case(args).items():
+                metrics[k] += v
+            if own_cache:
+                self.env.nav_cache.episode_done(self.env.gt_trajs[traj['instr_id']][0])
 
-            if args.save_pred:
-                json.dump(
-                    preds[-1],
-                    open(os.path.join(args.pred_dir, "case_InstrID_%s.json" % instr_id), 'w'),
-                    sort_keys=True, indent=4, separators=(',', ': ')
-                )
+        if not self.results:
+            print('No episode was evaluated.')
+            return
 
-        # evaluating all cases
-        score_summary, _ = self.env.eval_metrics(preds, args.dataset)
+        # all cases, from the per-case scores (their scans may be released by now)
+        score_summary = average_metrics(metrics)
 
-        sr = score_summary.get('sr')
-        spl = score_summary.get('spl')
+        loss_str = score_line("All cases", score_summary, args)
 
-        loss_str = "All cases  -"
-        if sr is not None:
-            loss_str += '  sr: %.2f' % sr
-        if spl is not None:
-            loss_str += '  spl: %.2f' % spl
+        if budget is not None:
+            # partial run: scores cover the evaluated episodes only
+            loss_str += '  (%s)' % budget.summary(len(self.results), self.env.size())
 
         record_file = os.path.join(args.log_dir, 'valid.txt')
         write_to_record_file(loss_str + '\n', record_file)
+        return score_summary
+
+    def evaluate_case(self, args):
+        ''' Score the episode that finished last; returns its metrics ({name: [value]}). '''
+        preds = self.get_results(detailed_output=args.detailed_output)
+        current_pred = [preds[-1]]
+
+        # evaluating current case
+        score_summary, current_metrics = self.env.eval_metrics(current_pred, args.dataset)
+
+        print(score_line("Current case", score_summary))
+
+        # add evaluation result
+        instr_id = preds[-1]['instr_id']
+        scan, gt_traj = self.env.gt_trajs[instr_id]
+
+        preds[-1]['scan'] = scan
+        preds[-1]['gt_traj'] = gt_traj
+        preds[-1]['evaluation'] = current_metrics
+
+        if args.save_pred:
+            json.dump(
+                preds[-1],
+                open(os.path.join(args.pred_dir, "case_%s_InstrID_%s.json" % (self.env.name, instr_id)), 'w'),
+                sort_keys=True, indent=4, separators=(',', ': ')
+            )
+        if getattr(args, 'case_dir', None):
+            # per-case output of a shard process, merged by the --num_workers launcher
+            case_file = os.path.join(args.case_dir, "%s.json" % instr_id)
+            with open(case_file + '.tmp', 'w') as f:
+                json.dump(dict(preds[-1], shard=getattr(args, 'shard', None)), f, sort_keys=True)
+            os.replace(case_file + '.tmp', case_file)
+        return current_metrics
 
 
 
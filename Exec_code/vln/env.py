@@ -4,19 +4,100 @@ import json
 import numpy as np
 import math
 import random
-import networkx as nx
 from collections import defaultdict
 import os
 
-from utils.data import load_nav_graphs, new_simulator
+from utils.data import new_simulator
 
 from vln.eval_utils import cal_dtw, cal_cls
+from vln.nav_cache import NavCache
 from vln.data_utils import load_obj2vps
 from ipdb import set_trace
 
 ERROR_MARGIN = 3.0
 
 
+# the fields of a candidate that are buffered; heading / elevation are relative to the current view
+CANDIDATE_KEYS = ['normalized_heading', 'normalized_elevation', 'scanId', 'viewpointId',
+                  'pointId', 'idx', 'position','caption', 'image', 'absolute_heading', 'absolute_elevation',
+                  'pretrained_inference', 'distance']
+
+
+def explore_viewpoint(sim, scanId, viewpointId, viewId, img_root):
+    ''' Navigable candidates of a viewpoint, found by turning sim through the 36 discretized views '''
+    def _loc_distance(loc):
+        return np.sqrt(loc.rel_heading ** 2 + loc.rel_elevation ** 2)
+
+    base_heading = (viewId % 12) * math.radians(30)
+    base_elevation = (viewId // 12 - 1) * math.radians(30)
+
+    adj_dict = {}
+    for ix in range(36):
+        if ix == 0:
+            sim.newEpisode([scanId], [viewpointId], [0], [math.radians(-30)])
+        elif ix % 12 == 0:
+            sim.makeAction([0], [1.0], [1.0])
+        else:
+            sim.makeAction([0], [1.0], [0])
+
+        state = sim.getState()[0]
+        assert state.viewIndex == ix
+
+        # Heading and elevation for the viewpoint center
+        heading = state.heading - base_heading
+        elevation = state.elevation - base_elevation
+
+        # get adjacent locations
+        for j, loc in enumerate(state.navigableLocations[1:]):
+            distance = _loc_distance(loc)
+
+            # Heading and elevation for for the loc
+            loc_heading = heading + loc.rel_heading
+            loc_elevation = elevation + loc.rel_elevation
+            # angle_feat = angle_feature(loc_heading, loc_elevation, self.angle_feat_size)
+            if (loc.viewpointId not in adj_dict or
+                    distance < adj_dict[loc.viewpointId]['distance']):
+
+                blip2_caption = None  # used for a two-stage system
+                img_path = os.path.join(img_root, scanId, viewpointId, str(ix) + '.jpg')
+
+                adj_dict[loc.viewpointId] = {
+                    'heading': loc_heading,
+                    'elevation': loc_elevation,
+                    "normalized_heading": state.heading + loc.rel_heading,
+                    "normalized_elevation": state.elevation + loc.rel_elevation,
+                    'scanId': scanId,
+                    'viewpointId': loc.viewpointId, # Next viewpoint id
+                    'pointId': ix,
+                    'distance': distance,
+                    'idx': j + 1,
+                    'position': (loc.x, loc.y, loc.z),
+                    'caption': blip2_caption,
+                    'image': img_path,
+                    'absolute_heading': state.heading,
+                    'absolute_elevation': state.elevation,
+                }
+
+    candidate = list(adj_dict.values())
+    for cand in candidate:
+        cand['pretrained_inference'] = None
+    return candidate
+
+
+def precompile_candidates(nav_cache, scans):
+    ''' Write the candidate table of every viewpoint of scans to the store of nav_cache (stored scans are skipped) '''
+    sim = None
+    for scan in sorted(scans):
+        if nav_cache.has_candidate_table(scan):
+            continue
+        sim = sim or new_simulator(nav_cache.connectivity_dir)
+        candidates = {
+            vp: [{key: c[key] for key in CANDIDATE_KEYS} for c in explore_viewpoint(sim, scan, vp, 0, '')]
+            for vp in nav_cache.distances(scan).viewpoints
+        }
+        nav_cache.save_candidate_table(scan, candidates)
+
+
 class EnvBatch(object):
     ''' A simple wrapper for a batch of MatterSim environments,
         using discretized viewpoints and pretrained features '''
@@ -78,7 +159,7 @@ class EnvBatch(object):
 class R2RNavBatch(object):
     def __init__(
         self, instr_data, connectivity_dir, view_db=None,
-        batch_size=64, seed=0, name=None, sel_data_idxs=None, args=None
+        batch_size=64, seed=0, name=None, sel_data_idxs=None, args=None, nav_cache=None
     ):
         self.env = EnvBatch(connectivity_dir, feat_db=view_db, batch_size=batch_size,
                             scan_data_dir=args.scan_data_dir,  # for visualization
@@ -106,11 +187,16 @@ class R2RNavBatch(object):
         self.seed = seed
 
         self.ix = 0
+        # scans are loaded on demand; our own cache releases a scan after its last episode (BaseAgent.test
+        # registers them), a shared one (several splits in one process) is managed by its owner
+        self.shared_cache = nav_cache is not None
+        self.nav_cache = nav_cache if nav_cache is not None else \
+            NavCache.from_args(connectivity_dir, args, evict_done=True)
         self._load_nav_graphs()
 
         self.sim = new_simulator(self.connectivity_dir)
 
-        self.buffered_state_dict = {}
+        self.buffered_state_dict = self.nav_cache.candidates
         print('%s loaded with %d instructions, using splits: %s' % (
             self.__class__.__name__, len(self.data), self.name))
 
@@ -133,14 +219,9 @@ class R2RNavBatch(object):
         Load connectivity graph for each scan, useful for reasoning about shortest paths
         :return: None
         """
-        print('Loading navigation graphs for %d scans' % len(self.scans))
-        self.graphs = load_nav_graphs(self.connectivity_dir, self.scans)
-        self.shortest_paths = {}
-        for scan, G in self.graphs.items():  # compute all shortest paths
-            self.shortest_paths[scan] = dict(nx.all_pairs_dijkstra_path(G))
-        self.shortest_distances = {}
-        for scan, G in self.graphs.items():  # compute all shortest paths
-            self.shortest_distances[scan] = dict(nx.all_pairs_dijkstra_path_length(G))
+        self.graphs = self.nav_cache.graphs
+        self.shortest_paths = self.nav_cache.shortest_paths
+        self.shortest_distances = self.nav_cache.shortest_distances
 
     def _next_minibatch(self, batch_size=None, **kwargs):
         """
@@ -166,77 +247,21 @@ class R2RNavBatch(object):
         self.ix = 0
 
     def make_candidate(self, scanId, viewpointId, viewId):
-        def _loc_distance(loc):
-            return np.sqrt(loc.rel_heading ** 2 + loc.rel_elevation ** 2)
-
         base_heading = (viewId % 12) * math.radians(30)
         base_elevation = (viewId // 12 - 1) * math.radians(30)
 
-        adj_dict = {}
         long_id = "%s_%s" % (scanId, viewpointId)
 
-        if long_id not in self.buffered_state_dict:
-            for ix in range(36):
-                if ix == 0:
-                    self.sim.newEpisode([scanId], [viewpointId], [0], [math.radians(-30)])
-                elif ix % 12 == 0:
-                    self.sim.makeAction([0], [1.0], [1.0])
-                else:
-                    self.sim.makeAction([0], [1.0], [0])
-
-                state = self.sim.getState()[0]
-                assert state.viewIndex == ix
-
-                # Heading and elevation for the viewpoint center
-                heading = state.heading - base_heading
-                elevation = state.elevation - base_elevation
-
-                # get adjacent locations
-                for j, loc in enumerate(state.navigableLocations[1:]):
-                    distance = _loc_distance(loc)
-
-                    # Heading and elevation for for the loc
-                    loc_heading = heading + loc.rel_heading
-                    loc_elevation = elevation + loc.rel_elevation
-                    # angle_feat = angle_feature(loc_heading, loc_elevation, self.angle_feat_size)
-                    if (loc.viewpointId not in adj_dict or
-                            distance < adj_dict[loc.viewpointId]['distance']):
-
-                        blip2_caption = None  # used for a two-stage system
-                        img_path = os.path.join(self.args.img_root, scanId, viewpointId, str(ix) + '.jpg')
-
-                        adj_dict[loc.viewpointId] = {
-                            'heading': loc_heading,
-                            'elevation': loc_elevation,
-                            "normalized_heading": state.heading + loc.rel_heading,
-                            "normalized_elevation": state.elevation + loc.rel_elevation,
-                            'scanId': scanId,
-                            'viewpointId': loc.viewpointId, # Next viewpoint id
-                            'pointId': ix,
-                            'distance': distance,
-                            'idx': j + 1,
-                            'position': (loc.x, loc.y, loc.z),
-                            'caption': blip2_caption,
-                            'image': img_path,
-                            'absolute_heading': state.heading,
-                            'absolute_elevation': state.elevation,
-                        }
-
-            candidate = list(adj_dict.values())
-            for cand in candidate:
-                cand['pretrained_inference'] = None
-
-            self.buffered_state_dict[long_id] = [
-                {key: c[key]
-                 for key in
-                    ['normalized_heading', 'normalized_elevation', 'scanId', 'viewpointId',
-                     'pointId', 'idx', 'position','caption', 'image', 'absolute_heading', 'absolute_elevation',
-                     'pretrained_inference', 'distance']}
+        candidate = self.nav_cache.get_candidates(scanId, long_id)
+        if candidate is None:
+            candidate = explore_viewpoint(self.sim, scanId, viewpointId, viewId, self.args.img_root)
+
+            self.nav_cache.put_candidates(scanId, long_id, [
+                {key: c[key] for key in CANDIDATE_KEYS}
                 for c in candidate
-            ]
+            ])
             return candidate
         else:
-            candidate = self.buffered_state_dict[long_id]
             candidate_new = []
             for c in candidate:
                 c_new = c.copy()
@@ -279,7 +304,7 @@ class R2RNavBatch(object):
             # RL reward. The negative distance between the state and the final state
             # There are multiple gt end viewpoints on REVERIE. 
             if ob['instr_id'] in self.gt_trajs:
-                ob['distance'] = self.shortest_distances[ob['scan']][ob['viewpoint']][item['path'][-1]]
+                ob['distance'] = self.nav_cache.distances(ob['scan'])[ob['viewpoint']][item['path'][-1]]
             else:
                 ob['distance'] = 0
 
@@ -345,7 +370,7 @@ class R2RNavBatch(object):
     def _eval_r2r_item(self, scan, pred_path, gt_path):
         scores = {}
 
-        shortest_distances = self.shortest_distances[scan]
+        shortest_distances = self.nav_cache.distances(scan)
 
         path = sum(pred_path, [])
         assert gt_path[0] == path[0], 'Result trajectories should include the start position'
@@ -389,16 +414,21 @@ class R2RNavBatch(object):
                 metrics[k].append(v)
             metrics['instr_id'].append(instr_id)
 
-        avg_metrics = {
-            # 'action_steps': np.mean(metrics['action_steps']),
-            'steps': np.mean(metrics['trajectory_steps']),
-            'lengths': np.mean(metrics['trajectory_lengths']),
-            'nav_error': np.mean(metrics['nav_error']),
-            'oracle_error': np.mean(metrics['oracle_error']),
-            'sr': np.mean(metrics['success']) * 100,
-            'oracle_sr': np.mean(metrics['oracle_success']) * 100,
-            'spl': np.mean(metrics['spl']) * 100,
-        }
+        avg_metrics = average_metrics(metrics)
 
         return avg_metrics, metrics
 
+
+def average_metrics(metrics):
+    ''' Summary scores of per-episode metrics ({name: [value per episode]}), as returned by eval_metrics '''
+    return {
+        # 'action_steps': np.mean(metrics['action_steps']),
+        'steps': np.mean(metrics['trajectory_steps']),
+        'lengths': np.mean(metrics['trajectory_lengths']),
+        'nav_error': np.mean(metrics['nav_error']),
+        'oracle_error': np.mean(metrics['oracle_error']),
+        'sr': np.mean(metrics['success']) * 100,
+        'oracle_sr': np.mean(metrics['oracle_success']) * 100,
+        'spl': np.mean(metrics['spl']) * 100,
+    }
+
@@ -1,9 +1,12 @@
 import sys
 import numpy as np
 from collections import defaultdict
-from GPT.one_stage_prompt_manager import OneStagePromptManager
+from GPT.one_stage_prompt_manager import OneStagePromptManager, prompt_size_report
 from .agent_base import BaseAgent
-from GPT.api import gpt_infer
+from .offline_env import view_index
+from .replay import StepReplay, request_key
+from .loop_monitor import LoopMonitor
+from GPT.api import gpt_infer, gpt_infer_stream, stream_report
 import json
 from ipdb import set_trace
 
@@ -26,6 +29,10 @@ class GPTNavAgent(BaseAgent):
         self.args = args
 
         self._build_prompt_manager()
+        self.replay = StepReplay.from_args(args, env.name)
+        self.loop_monitor = LoopMonitor.from_args(args)
+        self.prompt_sizes = []      # estimated request size of every step (OneStagePromptManager.make_prompt)
+        self.stream_timings = []    # --stream: time to first token / to the action / to the end of every step
 
         # Logs
         sys.stdout.flush()
@@ -114,19 +121,31 @@ class GPTNavAgent(BaseAgent):
 
             image_list = self.prompt_manager.node_imgs[0]
             environment_prompts = nav_input["prompts"][0]
+            for i in range(batch_size):
+                traj[i]['details'].setdefault('prompt_sizes', {})[t] = nav_input["prompt_sizes"][i]
+            self.prompt_sizes.append(nav_input["prompt_sizes"][0])
             print('-------------------- Environment Prompts --------------------')
             print(environment_prompts)
 
-            if self.args.llm == 'gpt-4o' and self.args.response_format == 'json':
+            intervention = None
+            if self.loop_monitor is not None:
+                intervention = self.loop_monitor.check(traj[0]['instr_id'], self.prompt_manager.trajectory[0],
+                                                       obs[0]['candidate'], t)
+            if intervention is not None:
+                # decided without a request; recorded so that the run is never taken for an official one
+                a_t = [intervention['action']]
+                traj[0].setdefault('loop_monitor', []).append(intervention)
+                print('Loop monitor: %s at step %d, action %d' % (intervention['reason'], t, a_t[0]))
+            elif self.args.llm == 'gpt-4o' and self.args.response_format == 'json':
                 if len(image_list) > 20:
                     # GPT-4o currently does not support queries with more than 20 images
                     a_t = [0]
                     print('Exceed image limit and stop!')
                 else:
-                    nav_output, tokens = gpt_infer(nav_input["task_description"], environment_prompts, image_list,
-                                                   self.args.llm, self.args.max_tokens, response_format={"type": "json_object"})
+                    nav_output = self._infer(traj[0]['instr_id'], t, nav_input["task_description"],
+                                             environment_prompts, image_list, nav_input["only_options"][0])
                     try:
-                        json_output = json.loads(nav_output)
+                        json_output = self.prompt_manager.parse_json_output(nav_output)
                     except json.JSONDecodeError as e:
                         print("JSON decode error:", e)
                         print("nav_output was:", nav_output)
@@ -166,4 +185,123 @@ class GPTNavAgent(BaseAgent):
 
             self.prompt_manager.make_history(a_t, nav_input, t)
 
+        if self.replay is not None:
+            self.replay.episode_done(traj[0]['instr_id'])
         return traj
+
+    def prompt_size_report(self):
+        return prompt_size_report(self.prompt_sizes)
+
+    def _infer(self, instr_id, t, system, text, image_list, only_options):
+        ''' gpt_infer, or the recorded output of this step while the episode matches the --replay_dir recording '''
+        response_format, max_tokens = self.prompt_manager.output_format(only_options)
+        key = None
+        if self.replay is not None:
+            key = request_key(system, text, image_list, self.args.llm, max_tokens)
+            nav_output = self.replay.lookup(instr_id, t, key)
+            if nav_output is not None:
+                self.replay.record(instr_id, t, key, nav_output, replayed=True)
+                return nav_output
+        if self.args.stream:
+            nav_output = self._infer_stream(system, text, image_list, max_tokens, response_format)
+        else:
+            nav_output, tokens = gpt_infer(system, text, image_list, self.args.llm, max_tokens,
+                                           response_format=response_format)
+        if self.replay is not None:
+            self.replay.record(instr_id, t, key, nav_output)
+        return nav_output
+
+    def _infer_stream(self, system, text, image_list, max_tokens, response_format):
+        '''
+        Streamed step: the action is picked out of the partial answer as soon as it is complete (time_to_action).
+        With --stream_cancel the generation is cut once 'Action' and 'New Planning' are both in; the answer is
+        then made of these two fields.
+        '''
+        marks = {}
+
+        def watch(partial, elapsed):
+            fields = self.prompt_manager.early_fields(partial)
+            if 'Action' in fields and 'time_to_action' not in marks:
+                marks['time_to_action'] = elapsed
+            if self.args.stream_cancel and 'Action' in fields and 'New Planning' in fields:
+                marks['fields'] = fields
+                return True
+            return False
+
+        nav_output, timing = gpt_infer_stream(system, text, image_list, self.args.llm, max_tokens,
+                                              response_format=response_format, watch=watch)
+        timing['time_to_action'] = marks.get('time_to_action')
+        self.stream_timings.append(timing)
+        if timing['cancelled']:
+            nav_output = json.dumps(marks['fields'])
+        return nav_output
+
+    def stream_report(self):
+        return stream_report(self.stream_timings)
+
+    def expert_steps(self, item):
+        """
+        Teacher forcing: place the agent at each viewpoint of the ground-truth path in turn and build the prompt of
+        that step as if it had followed the expert so far (history, trajectory and node images are replayed, the
+        planning stays at its initial text since no model output is involved). Returns one query per step with the
+        expert action (candidate index + 1, 0 = stop); the final stop is only asked once 'stop' is an option.
+        """
+        if not (self.args.llm == 'gpt-4o' and self.args.response_format == 'json'):
+            raise NotImplementedError('teacher forcing supports --llm gpt-4o --response_format json')
+        prompt_manager = OneStagePromptManager(self.args)     # own state, the agent's one is left untouched
+        path = item['path']
+        view_id = view_index(item['heading'], 0)     # start view, as set by env.reset()
+        previous_angle = [{'heading': 0., 'elevation': 0.}]
+        steps = []
+        for t, viewpoint in enumerate(path[:self.args.max_action_len]):
+            ob = {
+                'instr_id': item['instr_id'],
+                'viewpoint': viewpoint,
+                'instruction': item['instruction'],
+                'candidate': self.env.make_candidate(item['scan'], viewpoint, view_id),
+            }
+            cand_inputs = prompt_manager.make_action_prompt([ob], previous_angle)
+            nav_input = prompt_manager.make_r2r_json_prompts(cand_inputs=cand_inputs, obs=[ob], t=t)
+            if t + 1 < len(path):
+                cand_vpids = [c['viewpointId'] for c in ob['candidate']]
+                if path[t + 1] not in cand_vpids:
+                    print('Teacher forcing: %s is not a candidate of %s in %s, steps from %d skipped' % (
+                        path[t + 1], viewpoint, item['instr_id'], t))
+                    break
+                expert = cand_vpids.index(path[t + 1]) + 1
+            else:
+                expert = 0
+                if bool(self.args.stop_after) and t < self.args.stop_after:
+                    break                                       # 'stop' is not offered yet
+            steps.append({
+                'instr_id': item['instr_id'],
+                't': t,
+                'viewpoint': viewpoint,
+                'expert': expert,
+                'task_description': nav_input['task_description'],
+                'prompt': nav_input['prompts'][0],
+                'only_options': nav_input['only_options'][0],
+                'image_list': list(prompt_manager.node_imgs[0]),
+            })
+            if expert == 0:
+                break
+            prompt_manager.make_history([expert], nav_input, t)
+            chosen = ob['candidate'][expert - 1]
+            view_id = chosen['pointId']
+            previous_angle = [{'heading': chosen['absolute_heading'], 'elevation': chosen['absolute_elevation']}]
+        return steps
+
+    def predict_step(self, step):
+        """ The action (candidate index + 1, 0 = stop) chosen for one expert_steps() query; safe to call from threads. """
+        if len(step['image_list']) > 20:
+            # GPT-4o currently does not support queries with more than 20 images; rollout() stops here
+            return 0
+        response_format, max_tokens = self.prompt_manager.output_format(step['only_options'])
+        nav_output, tokens = gpt_infer(step['task_description'], step['prompt'], step['image_list'],
+                                       self.args.llm, max_tokens, response_format=response_format)
+        try:
+            json_output = self.prompt_manager.parse_json_output(nav_output)
+        except json.JSONDecodeError:
+            json_output = {}
+        # parse_json_action only reads args, so the shared prompt manager can be used concurrently
+        return self.prompt_manager.parse_json_action(json_output, [step['only_options']], step['t'])[0]
@@ -0,0 +1,74 @@
+''' Optional monitor that ends or redirects episodes stuck in revisit cycles (--loop_policy, off by default) '''
+import threading
+
+
+class LoopMonitor(object):
+    '''
+    Watches the visited Places of an episode (prompt_manager.trajectory) before every LLM call:
+
+    - cycle: the last visits repeat one block of 2..max_period distinct Places twice (A B A B, A B C A B C),
+    - stagnation: none of the last stagnation_steps visits reached a Place that was not visited before.
+
+    On a detection the step is decided without a request: 'stop' ends the episode, 'explore' moves to a
+    candidate that was never visited (and stops if there is none). Every intervention is recorded in the
+    episode's results, so runs with the monitor on can always be told apart from official ones.
+    '''
+
+    def __init__(self, policy='stop', max_period=3, stagnation_steps=4, max_action_len=15):
+        assert policy in ('stop', 'explore'), policy
+        self.policy = policy
+        self.max_period = max_period
+        self.stagnation_steps = stagnation_steps
+        self.max_action_len = max_action_len
+        self._lock = threading.Lock()
+        self.episodes = set()
+        self.interventions = 0
+        self.calls_saved = 0
+
+    @classmethod
+    def from_args(cls, args):
+        if getattr(args, 'loop_policy', 'off') == 'off':
+            return None
+        return cls(args.loop_policy, args.loop_period, args.stagnation_steps, args.max_action_len)
+
+    def detect(self, trajectory):
+        for p in range(2, self.max_period + 1):
+            tail = trajectory[-2 * p:]
+            if len(tail) == 2 * p and tail[:p] == tail[p:] and len(set(tail[:p])) == p:
+                return 'cycle%d' % p
+        k = self.stagnation_steps
+        if k and len(trajectory) > k and all(vp in trajectory[:-k] for vp in trajectory[-k:]):
+            return 'stagnation'
+        return None
+
+    def check(self, instr_id, trajectory, candidate, t):
+        '''
+        None, or the intervention for step t: {'t', 'reason', 'action' (candidate index + 1, 0 = stop),
+        'calls_saved'}. A forced stop saves the calls left before max_action_len (an upper bound).
+        '''
+        reason = self.detect(trajectory)
+        if reason is None:
+            return None
+        action = 0
+        if self.policy == 'explore':
+            unvisited = [j for j, c in enumerate(candidate) if c['viewpointId'] not in trajectory]
+            if unvisited:
+                action = unvisited[0] + 1
+        calls_saved = 1 if action else self.max_action_len - t
+        with self._lock:
+            self.episodes.add(instr_id)
+            self.interventions += 1
+            self.calls_saved += calls_saved
+        return {'t': t, 'reason': reason, 'action': action, 'calls_saved': calls_saved}
+
+    def report(self):
+        return {
+            'policy': self.policy,
+            'episodes': len(self.episodes),
+            'interventions': self.interventions,
+            'calls_saved': self.calls_saved,
+        }
+
+    def summary(self):
+        return 'policy %s, %d interventions in %d episodes, up to %d LLM calls saved' % (
+            self.policy, self.interventions, len(self.episodes), self.calls_saved)
@@ -0,0 +1,437 @@
+''' Navigation graphs, shortest distances and candidate views shared by several environments
+
+    Precompile the per-scan store once (distance tables of every scan in the connectivity dir; with
+    --candidates also the candidate table of every viewpoint, which needs MatterSim):
+        python -m vln.nav_cache --root_dir datasets --store datasets/nav_store --candidates
+
+    The store holds plain .npy arrays, so with mmap=True (--nav_mmap) processes attach to them read-only
+    and share one copy through the page cache instead of each building its own.
+'''
+import os
+import sys
+import pickle
+import argparse
+import resource
+import threading
+from collections import Counter, OrderedDict
+
+import numpy as np
+import networkx as nx
+
+from utils.data import load_nav_graphs
+
+MB = 1 << 20
+
+
+def approx_size(obj):
+    ''' Rough deep size in bytes of candidate lists (dicts, lists, tuples and scalars). '''
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(approx_size(k) + approx_size(v) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple)):
+        size += sum(approx_size(x) for x in obj)
+    return size
+
+
+class DistanceTable(object):
+    ''' All-pairs shortest distances of one scan as a dense matrix, indexed like the nested dicts
+        it replaces: table[viewpoint_a][viewpoint_b]. '''
+
+    def __init__(self, viewpoints, matrix):
+        self.viewpoints = list(viewpoints)
+        self.index = {vp: i for i, vp in enumerate(self.viewpoints)}
+        self.matrix = matrix
+
+    @classmethod
+    def from_graph(cls, G):
+        viewpoints = sorted(G.nodes())
+        index = {vp: i for i, vp in enumerate(viewpoints)}
+        matrix = np.full((len(viewpoints), len(viewpoints)), np.inf)
+        for a, lengths in nx.all_pairs_dijkstra_path_length(G):
+            row = matrix[index[a]]
+            for b, d in lengths.items():
+                row[index[b]] = d
+        return cls(viewpoints, matrix)
+
+    @classmethod
+    def load(cls, prefix, mmap=False):
+        with open(prefix + '.viewpoints.txt') as f:
+            viewpoints = f.read().split()
+        return cls(viewpoints, np.load(prefix + '.distances.npy', mmap_mode='r' if mmap else None))
+
+    def save(self, prefix):
+        np.save(prefix + '.distances.npy', self.matrix)
+        with open(prefix + '.viewpoints.txt', 'w') as f:
+            f.write('\n'.join(self.viewpoints) + '\n')
+
+    @property
+    def nbytes(self):
+        # matrix (unless memory-mapped, then it is shared) plus the viewpoint index (~100 bytes per entry)
+        matrix_bytes = 0 if isinstance(self.matrix, np.memmap) else int(self.matrix.nbytes)
+        return matrix_bytes + 100 * len(self.viewpoints)
+
+    def __contains__(self, viewpoint):
+        return viewpoint in self.index
+
+    def __getitem__(self, viewpoint):
+        return _DistanceRow(self.index, self.matrix[self.index[viewpoint]])
+
+
+class _DistanceRow(object):
+
+    def __init__(self, index, values):
+        self.index = index
+        self.values = values
+
+    def __getitem__(self, viewpoint):
+        return float(self.values[self.index[viewpoint]])
+
+
+class CandidateTable(object):
+    ''' Buffered candidates of every viewpoint of one scan as two arrays: rows (one per candidate, COLUMNS)
+        and offsets (candidates of viewpoint i are rows[offsets[i]:offsets[i + 1]]). '''
+
+    COLUMNS = ['viewpoint', 'pointId', 'idx', 'normalized_heading', 'normalized_elevation',
+               'absolute_heading', 'absolute_elevation', 'distance', 'x', 'y', 'z']
+
+    def __init__(self, scan, viewpoints, offsets, rows):
+        self.scan = scan
+        self.viewpoints = list(viewpoints)
+        self.index = {vp: i for i, vp in enumerate(self.viewpoints)}
+        self.offsets = offsets
+        self.rows = rows
+
+    @classmethod
+    def from_candidates(cls, scan, candidates):
+        ''' From {viewpoint: [buffered candidate, ...]} as made by R2RNavBatch.make_candidate '''
+        viewpoints = sorted(candidates)
+        viewpoints += sorted(set(c['viewpointId'] for cands in candidates.values() for c in cands) - set(viewpoints))
+        index = {vp: i for i, vp in enumerate(viewpoints)}
+        rows, offsets = [], [0]
+        for vp in viewpoints:
+            for c in candidates.get(vp, []):
+                rows.append([index[c['viewpointId']], c['pointId'], c['idx'], c['normalized_heading'],
+                             c['normalized_elevation'], c['absolute_heading'], c['absolute_elevation'],
+                             c['distance']] + list(c['position']))
+            offsets.append(len(rows))
+        return cls(scan, viewpoints, np.array(offsets, dtype=np.int64),
+                   np.array(rows, dtype=np.float64).reshape(-1, len(cls.COLUMNS)))
+
+    @classmethod
+    def load(cls, prefix, scan, mmap=False):
+        mode = 'r' if mmap else None
+        with open(prefix + '.candidate_viewpoints.txt') as f:
+            viewpoints = f.read().split()
+        return cls(scan, viewpoints, np.load(prefix + '.candidate_offsets.npy', mmap_mode=mode),
+                   np.load(prefix + '.candidates.npy', mmap_mode=mode))
+
+    def save(self, prefix):
+        np.save(prefix + '.candidate_offsets.npy', self.offsets)
+        np.save(prefix + '.candidates.npy', self.rows)
+        with open(prefix + '.candidate_viewpoints.txt', 'w') as f:
+            f.write('\n'.join(self.viewpoints) + '\n')
+
+    def get(self, viewpoint, img_root):
+        ''' Buffered candidates of viewpoint (same dicts as make_candidate stores), or None if unknown '''
+        i = self.index.get(viewpoint)
+        if i is None or i + 1 >= len(self.offsets):
+            return None
+        candidate = []
+        for r in self.rows[self.offsets[i]:self.offsets[i + 1]]:
+            pointId = int(r[1])
+            candidate.append({
+                'normalized_heading': float(r[3]),
+                'normalized_elevation': float(r[4]),
+                'scanId': self.scan,
+                'viewpointId': self.viewpoints[int(r[0])],
+                'pointId': pointId,
+                'idx': int(r[2]),
+                'position': (float(r[8]), float(r[9]), float(r[10])),
+                'caption': None,
+                'image': os.path.join(img_root, self.scan, viewpoint, str(pointId) + '.jpg'),
+                'absolute_heading': float(r[5]),
+                'absolute_elevation': float(r[6]),
+                'pretrained_inference': None,
+                'distance': float(r[7]),
+            })
+        return candidate
+
+
+class _OnDemand(dict):
+    ''' {scan: value} that computes missing entries with loader(scan). '''
+
+    def __init__(self, loader):
+        super().__init__()
+        self.loader = loader
+
+    def __missing__(self, scan):
+        value = self.loader(scan)
+        self[scan] = value
+        return value
+
+
+class NavCache(object):
+    ''' Per-scan navigation data, loaded on first use and shared by every R2RNavBatch built with it.
+
+        shortest_distances is {scan: DistanceTable}; graphs and shortest_paths are computed only when
+        indexed. candidates is the {"<scan>_<viewpoint>": [candidate, ...]} buffer of
+        R2RNavBatch.make_candidate.
+
+        Memory stays bounded in two ways:
+          - episodes registered with add_episodes pin their scan; with evict_done, a scan is released as
+            soon as its last pending episode is done;
+          - max_bytes / max_candidate_bytes cap the distance tables / candidate buffers. Over a cap, the
+            least recently used scan is evicted, preferring scans without pending episodes.
+        Evicted scans are reloaded on demand, from store_dir when it is set (distance tables are written
+        there when first computed, candidate buffers when evicted), otherwise recomputed. A precompiled
+        candidate table in the store answers every viewpoint of its scan without the simulator.
+
+        With mmap, store files are attached read-only and the store is never written to. '''
+
+    def __init__(self, connectivity_dir, evict_done=True, max_bytes=None, max_candidate_bytes=None, store_dir=None,
+                 mmap=False, img_root=''):
+        self.connectivity_dir = connectivity_dir
+        self.evict_done = evict_done
+        self.max_bytes = max_bytes
+        self.max_candidate_bytes = max_candidate_bytes
+        self.store_dir = store_dir
+        self.mmap = bool(store_dir and mmap)
+        self.img_root = img_root or ''
+        if store_dir and not self.mmap:
+            os.makedirs(store_dir, exist_ok=True)
+        self.graphs = _OnDemand(lambda scan: load_nav_graphs(self.connectivity_dir, [scan])[scan])
+        self.shortest_paths = _OnDemand(lambda scan: dict(nx.all_pairs_dijkstra_path(self.graphs[scan])))
+        self.shortest_distances = {}
+        self.candidates = {}
+        self.pending = Counter()
+        self.stats = Counter()
+        self._lru = OrderedDict()              # scans, least recently used first
+        self._scan_candidates = {}             # scan -> {long_id: bytes}
+        self._candidate_tables = {}            # scan -> CandidateTable or None (not in the store)
+        self._ever_loaded = set()
+        self._lock = threading.RLock()
+
+    @classmethod
+    def from_args(cls, connectivity_dir, args, evict_done=False):
+        to_bytes = lambda mb: int(mb * MB) if mb else None
+        return cls(connectivity_dir, evict_done=evict_done,
+                   max_bytes=to_bytes(getattr(args, 'nav_cache_mb', None)),
+                   max_candidate_bytes=to_bytes(getattr(args, 'candidate_cache_mb', None)),
+                   store_dir=getattr(args, 'nav_store', None), mmap=getattr(args, 'nav_mmap', False),
+                   img_root=getattr(args, 'img_root', None))
+
+    @property
+    def bounded(self):
+        return bool(self.max_bytes or self.max_candidate_bytes)
+
+    def _store_prefix(self, scan):
+        return os.path.join(self.store_dir, scan)
+
+    def _touch(self, scan):
+        self._lru[scan] = None
+        self._lru.move_to_end(scan)
+
+    def load_scan(self, scan):
+        ''' Make sure the distance table of scan is in memory. '''
+        self.distances(scan)
+
+    def load_scans(self, scans):
+        for scan in sorted(scans):
+            self.distances(scan)
+
+    def distances(self, scan):
+        ''' DistanceTable of scan, reloaded (from the store, else recomputed) if it was evicted. '''
+        with self._lock:
+            table = self.shortest_distances.get(scan)
+            if table is not None:
+                self.stats['scan_hits'] += 1
+                self._touch(scan)
+                return table
+            if self.store_dir and os.path.exists(self._store_prefix(scan) + '.distances.npy'):
+                table = DistanceTable.load(self._store_prefix(scan), self.mmap)
+                self.stats['store_loads'] += 1
+            else:
+                table = DistanceTable.from_graph(load_nav_graphs(self.connectivity_dir, [scan])[scan])
+                if self.store_dir and not self.mmap:
+                    table.save(self._store_prefix(scan))
+            self.shortest_distances[scan] = table
+            self.stats['scan_reloads' if scan in self._ever_loaded else 'scan_loads'] += 1
+            self._ever_loaded.add(scan)
+            self._touch(scan)
+            self._enforce_limits(scan)
+            return table
+
+    def get_candidates(self, scan, long_id):
+        ''' Buffered candidates of a viewpoint, or None on a miss. '''
+        with self._lock:
+            candidate = self.candidates.get(long_id)
+            if candidate is None and self._candidate_table(scan) is not None:
+                candidate = self._candidate_tables[scan].get(long_id[len(scan) + 1:], self.img_root)
+                if candidate is not None:
+                    self.stats['candidate_table_hits'] += 1
+            if candidate is None and scan not in self._scan_candidates and self._read_candidates(scan):
+                candidate = self.candidates.get(long_id)
+            self.stats['candidate_misses' if candidate is None else 'candidate_hits'] += 1
+            self._touch(scan)
+            return candidate
+
+    def put_candidates(self, scan, long_id, candidate):
+        with self._lock:
+            self.candidates[long_id] = candidate
+            self._scan_candidates.setdefault(scan, {})[long_id] = approx_size(candidate)
+            self._touch(scan)
+            self._enforce_limits(scan)
+
+    def has_candidate_table(self, scan):
+        return bool(self.store_dir) and os.path.exists(self._store_prefix(scan) + '.candidates.npy')
+
+    def save_candidate_table(self, scan, candidates):
+        ''' Store {viewpoint: [buffered candidate, ...]} of scan as its precompiled candidate table. '''
+        CandidateTable.from_candidates(scan, candidates).save(self._store_prefix(scan))
+
+    def _candidate_table(self, scan):
+        if scan not in self._candidate_tables:
+            self._candidate_tables[scan] = CandidateTable.load(self._store_prefix(scan), scan, self.mmap) \
+                if self.has_candidate_table(scan) else None
+        return self._candidate_tables[scan]
+
+    def _read_candidates(self, scan):
+        path = self.store_dir and self._store_prefix(scan) + '.candidates.pkl'
+        if not path or not os.path.exists(path):
+            return False
+        with open(path, 'rb') as f:
+            stored = pickle.load(f)
+        for long_id, candidate in stored.items():
+            self.candidates[long_id] = candidate
+        self._scan_candidates[scan] = {long_id: approx_size(c) for long_id, c in stored.items()}
+        self.stats['candidate_store_loads'] += 1
+        return True
+
+    def _write_candidates(self, scan):
+        long_ids = self._scan_candidates.get(scan)
+        if not self.store_dir or self.mmap or not long_ids:
+            return
+        path = self._store_prefix(scan) + '.candidates.pkl'
+        stored = {}
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                stored = pickle.load(f)
+        stored.update((long_id, self.candidates[long_id]) for long_id in long_ids if long_id in self.candidates)
+        with open(path + '.tmp', 'wb') as f:
+            pickle.dump(stored, f)
+        os.replace(path + '.tmp', path)
+
+    def _drop_candidates(self, scan):
+        self._write_candidates(scan)
+        for long_id in self._scan_candidates.pop(scan, {}):
+            self.candidates.pop(long_id, None)
+
+    def _drop_scan(self, scan):
+        for d in (self.shortest_distances, self.graphs, self.shortest_paths, self._candidate_tables):
+            d.pop(scan, None)
+
+    def distance_bytes(self):
+        return sum(table.nbytes for table in self.shortest_distances.values())
+
+    def candidate_bytes(self):
+        return sum(sum(sizes.values()) for sizes in self._scan_candidates.values())
+
+    def _victims(self, keep, resident):
+        ''' Scans in eviction order: least recently used first, scans with pending episodes last. '''
+        order = [scan for scan in self._lru if scan != keep and scan in resident]
+        return [s for s in order if not self.pending[s]] + [s for s in order if self.pending[s]]
+
+    def _enforce_limits(self, keep):
+        if self.max_bytes:
+            for scan in self._victims(keep, self.shortest_distances):
+                if self.distance_bytes() <= self.max_bytes:
+                    break
+                self._drop_scan(scan)
+                self.stats['evicted_for_memory'] += 1
+        if self.max_candidate_bytes:
+            for scan in self._victims(keep, self._scan_candidates):
+                if self.candidate_bytes() <= self.max_candidate_bytes:
+                    break
+                self._drop_candidates(scan)
+                self.stats['candidate_evictions'] += 1
+        resident = self.distance_bytes() + self.candidate_bytes()
+        self.stats['peak_bytes'] = max(self.stats['peak_bytes'], resident)
+        self.stats['peak_scans'] = max(self.stats['peak_scans'], len(self.shortest_distances))
+
+    def add_episodes(self, items):
+        ''' Register episodes that will run, so their scans are kept until episode_done was called for each. '''
+        with self._lock:
+            for item in items:
+                self.pending[item['scan']] += 1
+
+    def episode_done(self, scan):
+        with self._lock:
+            self.pending[scan] -= 1
+            if self.pending[scan] <= 0:
+                del self.pending[scan]
+                if self.evict_done:
+                    self.release(scan)
+
+    def release(self, scan):
+        ''' Drop everything held for scan; it is reloaded if it is needed again. '''
+        with self._lock:
+            if scan not in self.shortest_distances and scan not in self._scan_candidates:
+                return
+            self._drop_scan(scan)
+            self._drop_candidates(scan)
+            self._lru.pop(scan, None)
+            self.stats['evicted_scans'] += 1
+
+    def report(self):
+        ''' Hit rates, loads / evictions and memory high-water marks (for run_stats_*.json). '''
+        with self._lock:
+            stats = dict(self.stats)
+            stats['resident_scans'] = len(self.shortest_distances)
+            stats['resident_viewpoints'] = len(self.candidates)
+            stats['resident_mb'] = round((self.distance_bytes() + self.candidate_bytes()) / MB, 2)
+        scan_lookups = sum(stats.get(k, 0) for k in ('scan_hits', 'scan_loads', 'scan_reloads'))
+        cand_lookups = stats.get('candidate_hits', 0) + stats.get('candidate_misses', 0)
+        stats['scan_hit_rate'] = round(stats.get('scan_hits', 0) / scan_lookups, 4) if scan_lookups else None
+        stats['candidate_hit_rate'] = round(stats.get('candidate_hits', 0) / cand_lookups, 4) if cand_lookups else None
+        stats['peak_mb'] = round(stats.pop('peak_bytes', 0) / MB, 2)
+        # ru_maxrss is in KB on Linux
+        stats['peak_rss_mb'] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+        stats['max_mb'] = round(self.max_bytes / MB, 2) if self.max_bytes else None
+        stats['max_candidate_mb'] = round(self.max_candidate_bytes / MB, 2) if self.max_candidate_bytes else None
+        return stats
+
+    def summary(self):
+        s = self.report()
+        rate = lambda r: 'n/a' if r is None else '%.1f%%' % (100 * r)
+        return ('scans: %d loaded, %d reloaded, %d evicted (+%d for memory), peak %d resident, hit rate %s; '
+                'candidates: %d hits, %d misses, hit rate %s; memory: peak %.1f MB cached, %.1f MB RSS' % (
+                    s.get('scan_loads', 0), s.get('scan_reloads', 0), s.get('evicted_scans', 0),
+                    s.get('evicted_for_memory', 0), s.get('peak_scans', 0), rate(s['scan_hit_rate']),
+                    s.get('candidate_hits', 0), s.get('candidate_misses', 0), rate(s['candidate_hit_rate']),
+                    s['peak_mb'], s['peak_rss_mb']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Precompile per-scan distance tables')
+    parser.add_argument('--root_dir', type=str, default='../datasets')
+    parser.add_argument('--store', type=str, required=True)
+    parser.add_argument('--scans', type=str, nargs='*', default=None, help='default: every scan in connectivity/')
+    parser.add_argument('--candidates', action='store_true', default=False,
+                        help='also store the candidate table of every viewpoint (needs MatterSim)')
+    args = parser.parse_args()
+
+    connectivity_dir = os.path.join(args.root_dir, 'connectivity')
+    scans = args.scans or sorted(f[:-len('_connectivity.json')] for f in os.listdir(connectivity_dir)
+                                 if f.endswith('_connectivity.json'))
+    cache = NavCache(connectivity_dir, max_bytes=1, store_dir=args.store)  # keep one scan at a time
+    for scan in scans:
+        cache.distances(scan)
+    print('Stored %d distance tables in %s' % (len(scans), args.store))
+    if args.candidates:
+        from vln.env import precompile_candidates
+        precompile_candidates(cache, scans)
+        print('Stored %d candidate tables in %s' % (len(scans), args.store))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+''' Simulator-free helpers that rebuild MatterSim-style observations from the connectivity graphs '''
+import os
+import math
+
+
+def view_index(heading, elevation):
+    ''' Discretized view (0-35) that looks towards (heading, elevation), as used in make_candidate '''
+    heading_ix = int(round(heading / math.radians(30))) % 12
+    level = min(2, max(0, 1 + int(round(elevation / math.radians(30)))))
+    return level * 12 + heading_ix
+
+
+def graph_candidates(graph, scan, viewpoint, img_root):
+    '''
+    Navigable neighbours of a viewpoint in the same format as R2RNavBatch.make_candidate.
+    Headings come from the graph positions (0 = +y, clockwise), so each neighbour is assigned the
+    discretized view that faces it; images follow the <img_root>/<scan>/<viewpoint>/<viewIndex>.jpg layout.
+    '''
+    src = graph.nodes[viewpoint]['position']
+    candidate = []
+    for j, vp in enumerate(sorted(graph.neighbors(viewpoint))):
+        dst = graph.nodes[vp]['position']
+        dx, dy, dz = dst[0] - src[0], dst[1] - src[1], dst[2] - src[2]
+        heading = math.atan2(dx, dy) % (2 * math.pi)
+        elevation = math.atan2(dz, math.sqrt(dx ** 2 + dy ** 2))
+        ix = view_index(heading, elevation)
+        candidate.append({
+            'heading': heading,
+            'elevation': elevation,
+            'scanId': scan,
+            'viewpointId': vp,
+            'pointId': ix,
+            'distance': math.sqrt(dx ** 2 + dy ** 2 + dz ** 2),
+            'idx': j + 1,
+            'position': tuple(dst),
+            'caption': None,
+            'image': os.path.join(img_root, scan, viewpoint, str(ix) + '.jpg'),
+            'absolute_heading': (ix % 12) * math.radians(30),
+            'absolute_elevation': (ix // 12 - 1) * math.radians(30),
+            'pretrained_inference': None,
+        })
+    return candidate
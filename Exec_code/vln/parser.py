@@ -31,6 +31,62 @@ def parse_args():
     parser.add_argument('--end', type=int, default=None)
     parser.add_argument('--stop_after', type=int, default=3)
     parser.add_argument('--max_tokens', type=int, default=1000)
+    parser.add_argument('--stream', action='store_true', default=False,
+                        help='stream step answers, recording time to first token and time to the action')
+    parser.add_argument('--stream_cancel', action='store_true', default=False,
+                        help="with --stream, stop the generation once 'Action' and 'New Planning' are complete")
+    parser.add_argument('--output_mode', type=str, default='full', choices=['full', 'lean'],
+                        help="lean: JSON schema with only 'Action' and a short 'New Planning', max_tokens derived from it")
+    parser.add_argument('--lean_planning_words', type=int, default=30, help="cap of 'New Planning' in --output_mode lean")
+    parser.add_argument('--prompt_budget', type=int, default=None,
+                        help='estimated input tokens per request; older history and explored map entries are compacted to fit')
+    parser.add_argument('--keep_recent_steps', type=int, default=3, help='history steps kept verbatim when compacting')
+    parser.add_argument('--use_map', action='store_true', default=False, help="add 'Map' and 'Supplementary Info' to the prompt")
+    parser.add_argument('--no_trajectory', dest='use_trajectory', action='store_false', default=True,
+                        help="leave 'Trajectory' out of the prompt")
+    parser.add_argument('--subset_file', type=str, default=None, help='subset index file from navbench/sampling.py')
+    parser.add_argument('--image_pack', type=str, default=None, help='packed image archive from navbench/image_pack.py')
+    parser.add_argument('--hedge_percentile', type=float, default=None, help='hedge LLM requests slower than this latency percentile (e.g. 95)')
+    parser.add_argument('--hedge_budget', type=float, default=0.05, help='max hedged requests as a fraction of all requests')
+    parser.add_argument('--deadline', type=str, default=None, help='stop starting new episodes before this time (e.g. 90m, 2h, 18:30)')
+    parser.add_argument('--budget_tokens', type=float, default=None, help='total input + output token budget')
+    parser.add_argument('--budget_usd', type=float, default=None, help='total cost budget in USD')
+    parser.add_argument('--episode_order', type=str, default=None, choices=['annotation', 'longest_first', 'scan'],
+                        help='longest_first starts episodes with the most expected steps first (same results, shorter makespan); '
+                             'scan groups episodes by scan for cache locality')
+    parser.add_argument('--splits', type=str, nargs='+', default=None,
+                        help='splits run together by main_multi_split.py (max_action_len per split from navbench/datasets.py)')
+    parser.add_argument('--num_workers', type=int, default=1,
+                        help='run the split in this many processes (sel_data_idxs shards) and merge their outputs')
+    parser.add_argument('--shard', type=int, default=None, help=argparse.SUPPRESS)  # set by the --num_workers launcher
+    parser.add_argument('--progress_interval', type=float, default=10, help='seconds between progress lines of --num_workers')
+    parser.add_argument('--eval_mode', type=str, default='closed_loop', choices=['closed_loop', 'teacher_forced'],
+                        help='teacher_forced: next-action accuracy at every step of the expert paths instead of SR/SPL')
+    parser.add_argument('--tf_workers', type=int, default=32, help='parallel step requests of --eval_mode teacher_forced')
+    parser.add_argument('--loop_policy', type=str, default='off', choices=['off', 'stop', 'explore'],
+                        help='on revisit cycles / stagnation, force a stop or a move to an unvisited Place (not for official numbers)')
+    parser.add_argument('--loop_period', type=int, default=3, help='longest revisit cycle (in Places) the loop monitor detects')
+    parser.add_argument('--stagnation_steps', type=int, default=4,
+                        help='loop monitor: steps without reaching a new Place that count as stagnation (0 = off)')
+    parser.add_argument('--record_dir', type=str, default=None, help='record the request key and output of every step here')
+    parser.add_argument('--replay_dir', type=str, default=None,
+                        help='reuse outputs recorded with --record_dir up to the first step whose request differs')
+    parser.add_argument('--queue', type=str, default=None,
+                        help='work queue file (navbench/work_queue.py): lease episodes from it instead of a fixed range')
+    parser.add_argument('--lease_seconds', type=float, default=300, help='lease of a queued episode, renewed while it runs')
+    parser.add_argument('--nav_cache_mb', type=float, default=None,
+                        help='cap on resident distance tables; least recently used scans are evicted and reloaded on demand')
+    parser.add_argument('--candidate_cache_mb', type=float, default=None,
+                        help='cap on buffered candidate views, evicted by scan like --nav_cache_mb')
+    parser.add_argument('--nav_store', type=str, default=None,
+                        help='per-scan store of distance tables and candidate views (python -m vln.nav_cache)')
+    parser.add_argument('--nav_mmap', action='store_true', default=False,
+                        help='attach the --nav_store tables read-only via mmap (shared between processes)')
+    parser.add_argument('--split_workers', type=int, default=0,
+                        help='splits run concurrently by main_multi_split.py (0 = all, 1 = interleaved in one thread)')
+    parser.add_argument('--summary_json', type=str, default=None,
+                        help='write sr / spl per split and their average (execution_sr_spl_avg.json) here')
+    parser.add_argument('--preflight', action='store_true', default=False, help='validate all reachable observation images before running')
 
     args, _ = parser.parse_known_args()
 
@@ -46,10 +102,19 @@ def postprocess_args(args):
     args.scan_data_dir = os.path.join(ROOTDIR, 'Matterport3D', 'v1_unzip_scans')
     args.anno_dir = os.path.join(ROOTDIR, 'annotations')
 
+    if args.image_pack:
+        # picked up by the shared payload store used in gpt_infer
+        os.environ['NAVBENCH_IMAGE_PACK'] = os.path.abspath(args.image_pack)
+    if args.hedge_percentile:
+        # picked up by the shared request layer (navbench/llm.py)
+        os.environ['NAVBENCH_HEDGE_PERCENTILE'] = str(args.hedge_percentile)
+        os.environ['NAVBENCH_HEDGE_BUDGET'] = str(args.hedge_budget)
+
     # Build paths
     args.log_dir = os.path.join(args.output_dir, 'logs')
     args.pred_dir = os.path.join(args.output_dir, 'preds')
     args.vis_dir = os.path.join(args.output_dir, 'vis')
+    args.case_dir = None
 
     os.makedirs(args.output_dir, exist_ok=True)
     os.makedirs(args.log_dir, exist_ok=True)
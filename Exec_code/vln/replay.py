@@ -0,0 +1,93 @@
+''' Record / replay of the LLM steps of closed-loop episodes, for comparing prompt or parser variants '''
+import os
+import json
+import hashlib
+import threading
+
+
+def request_key(system, text, image_list, model, max_tokens):
+    ''' Identity of one step request: same key, same prompt, images and decoding settings '''
+    return hashlib.sha1(json.dumps([system, text, image_list, model, max_tokens]).encode('utf-8')).hexdigest()
+
+
+class StepReplay(object):
+    '''
+    --record_dir writes the request key and raw model output of every step to <record_dir>/<split>/<instr_id>.json.
+    --replay_dir reuses such a recording: while the requests of an episode are identical to the recorded ones
+    (same step, same key), the recorded output is used instead of a live call. From the first step whose request
+    differs, e.g. after a use_map / use_trajectory change or once a changed parser picked another action, the
+    episode runs live. The simulator is deterministic, so the shared prefix is re-stepped rather than restored.
+    '''
+
+    def __init__(self, split, record_dir=None, replay_dir=None):
+        self.record_dir = os.path.join(record_dir, split) if record_dir else None
+        self.replay_dir = os.path.join(replay_dir, split) if replay_dir else None
+        if self.record_dir:
+            os.makedirs(self.record_dir, exist_ok=True)
+        self._steps = {}        # instr_id: steps recorded in the running episode
+        self._replay = {}       # instr_id: {t: step} of the replayed recording, loaded once per episode
+        self._diverged = set()
+        self._lock = threading.Lock()
+        self.replayed = 0
+        self.live = 0
+
+    @classmethod
+    def from_args(cls, args, split):
+        record_dir, replay_dir = getattr(args, 'record_dir', None), getattr(args, 'replay_dir', None)
+        if not record_dir and not replay_dir:
+            return None
+        return cls(split, record_dir, replay_dir)
+
+    def _recorded(self, instr_id):
+        if instr_id not in self._replay:
+            path = os.path.join(self.replay_dir, '%s.json' % instr_id)
+            steps = []
+            if os.path.exists(path):
+                with open(path) as f:
+                    steps = json.load(f)
+            self._replay[instr_id] = {step['t']: step for step in steps}
+        return self._replay[instr_id]
+
+    def lookup(self, instr_id, t, key):
+        '''
+        The recorded output of step t if every request of the episode so far matched the recording, else None.
+        Steps decided without a request (loop monitor interventions) are not recorded and do not break the match.
+        '''
+        if not self.replay_dir or instr_id in self._diverged:
+            return None
+        step = self._recorded(instr_id).get(t)
+        if step is not None and step['key'] == key:
+            with self._lock:
+                self.replayed += 1
+            return step['output']
+        self._diverged.add(instr_id)
+        return None
+
+    def record(self, instr_id, t, key, output, replayed=False):
+        if not replayed:
+            with self._lock:
+                self.live += 1
+        self._steps.setdefault(instr_id, []).append({'t': t, 'key': key, 'output': output})
+
+    def episode_done(self, instr_id):
+        steps = self._steps.pop(instr_id, [])
+        self._replay.pop(instr_id, None)
+        self._diverged.discard(instr_id)
+        if self.record_dir:
+            tmp = os.path.join(self.record_dir, '.%s.json.tmp' % instr_id)
+            with open(tmp, 'w') as f:
+                json.dump(steps, f)
+            os.replace(tmp, os.path.join(self.record_dir, '%s.json' % instr_id))
+
+    def report(self):
+        total = self.replayed + self.live
+        return {
+            'replayed_steps': self.replayed,
+            'live_steps': self.live,
+            'replayed_share': round(self.replayed / total, 4) if total else None,
+        }
+
+    def summary(self):
+        r = self.report()
+        share = '%.1f%%' % (100 * r['replayed_share']) if r['replayed_share'] is not None else 'n/a'
+        return '%d steps replayed, %d live (%s replayed)' % (r['replayed_steps'], r['live_steps'], share)
@@ -0,0 +1,151 @@
+"""
+Constrained answers for the Comprehension tasks (--answer_mode constrained; the default "free" is unchanged).
+
+Every Comprehension item has a small closed set of valid answers: instruction / sub-instruction / candidate
+numbers, or candidate letters for local action. In constrained mode the request asks for a single token
+(max_tokens 1, 2 without tiktoken), biases the logits towards the option labels when their token ids are known,
+and asks for the top logprobs of that token, which give a probability per option:
+
+    option_probs  - normalized over the valid labels (labels missing from the top logprobs get 0)
+    confidence    - probability of the chosen label
+
+The free-text request stays the fallback: for answers that are not a valid label, and for endpoints that reject
+these parameters (after the first rejection the process stops trying). The task scripts score the answer text
+exactly as before, so accuracies of both modes are computed the same way.
+"""
+import os
+import math
+
+import openai
+
+from navbench import llm
+from navbench import tokens
+
+ANSWER_MODES = ("free", "constrained")
+LOGIT_BIAS = 100        # the API maximum: in practice only the labels can be sampled
+TOP_LOGPROBS = 20       # the API maximum
+
+_unsupported = False    # the endpoint rejected the constrained parameters once
+
+
+def answer_mode():
+    mode = os.environ.get("NAVBENCH_ANSWER_MODE", "free")
+    if mode not in ANSWER_MODES:
+        raise ValueError(f"Unknown NAVBENCH_ANSWER_MODE: {mode}")
+    return mode
+
+
+def add_answer_args(parser):
+    parser.add_argument("--answer_mode", type=str, default=None, choices=ANSWER_MODES,
+                        help="constrained: single-token answers restricted to the option labels, with per-option "
+                             "probabilities (free-text fallback); default free")
+    return parser
+
+
+def apply_answer_args(args):
+    """Pass --answer_mode to the task scripts and their worker processes."""
+    if getattr(args, "answer_mode", None):
+        os.environ["NAVBENCH_ANSWER_MODE"] = args.answer_mode
+
+
+def option_labels(subtask, item):
+    """Valid answers of an item, as the task script asks for them."""
+    if subtask.startswith("global"):
+        return [str(i + 1) for i in range(len(item["instructions"]))]
+    if subtask == "progress":
+        return [str(i + 1) for i in range(len(item["sub_instructions"]))]
+    if subtask == "local/action":
+        return [chr(ord("A") + i) for i in range(len(item["candidate_views"]))]
+    return [str(i + 1) for i in range(len(item["cand_views"]))]
+
+
+def label_token_ids(labels):
+    """Token id of every label, or None without tiktoken or when a label is not a single token."""
+    if tokens._ENCODING is None:
+        return None
+    ids = [tokens._ENCODING.encode(label) for label in labels]
+    if any(len(i) != 1 for i in ids):
+        return None
+    return [i[0] for i in ids]
+
+
+def constrained_params(labels):
+    token_ids = label_token_ids(labels)
+    params = {
+        "max_tokens": 1 if token_ids is not None or max(len(l) for l in labels) == 1 else 2,
+        # logprobs through extra_body: also accepted by SDK versions that do not know the parameters
+        "extra_body": {"logprobs": True, "top_logprobs": TOP_LOGPROBS},
+    }
+    if token_ids is not None:
+        params["logit_bias"] = {str(i): LOGIT_BIAS for i in token_ids}
+    return params
+
+
+def _field(obj, name):
+    """Attribute of an SDK object, or key of the plain dict older SDK versions leave for unknown fields."""
+    if isinstance(obj, dict):
+        return obj.get(name)
+    return getattr(obj, name, None)
+
+
+def option_probs(choice, labels):
+    """{label: probability} from the top logprobs of the first answer token, or None if the response has none."""
+    content = _field(_field(choice, "logprobs"), "content")
+    if not content:
+        return None
+    mass = dict.fromkeys(labels, 0.0)
+    for top in _field(content[0], "top_logprobs") or []:
+        label = _field(top, "token").strip().upper()
+        if label in mass:
+            mass[label] += math.exp(_field(top, "logprob"))
+    total = sum(mass.values())
+    if total <= 0:
+        return None
+    return {label: round(p / total, 4) for label, p in mass.items()}
+
+
+def ask(model, messages, subtask, item):
+    """
+    (answer text, extra record fields) for one item. Free mode is the plain request with no extra fields;
+    constrained mode adds answer_mode, and confidence / option_probs when the endpoint returns logprobs.
+    """
+    global _unsupported
+    if answer_mode() == "constrained" and not _unsupported:
+        labels = option_labels(subtask, item)
+        try:
+            response = llm.chat_completion(model=model, messages=messages, temperature=0.0, **constrained_params(labels))
+        except openai.BadRequestError:
+            _unsupported = True
+        else:
+            choice = response.choices[0]
+            text = (choice.message.content or "").strip()
+            if text.upper() in labels:
+                extra = {"answer_mode": "constrained"}
+                probs = option_probs(choice, labels)
+                if probs is not None:
+                    extra["confidence"] = probs[text.upper()]
+                    extra["option_probs"] = probs
+                return text, extra
+    response = llm.chat_completion(model=model, messages=messages, temperature=0.0)
+    extra = {"answer_mode": "free (fallback)"} if answer_mode() == "constrained" else {}
+    return response.choices[0].message.content, extra
+
+
+def calibration(records, n_bins=10):
+    """
+    Calibration of the records that carry a confidence: {'n', 'confidence' (mean), 'accuracy', 'ece'}, where
+    ece is the expected calibration error over n_bins equal-width confidence bins; None without confidences.
+    """
+    pairs = [(r["confidence"], bool(r.get("correct", r.get("success")))) for r in records if "confidence" in r]
+    if not pairs:
+        return None
+    bins = {}
+    for confidence, correct in pairs:
+        bins.setdefault(min(int(confidence * n_bins), n_bins - 1), []).append((confidence, correct))
+    ece = sum(abs(sum(c for c, _ in b) - sum(ok for _, ok in b)) for b in bins.values()) / len(pairs)
+    return {
+        "n": len(pairs),
+        "confidence": round(sum(c for c, _ in pairs) / len(pairs), 4),
+        "accuracy": round(sum(ok for _, ok in pairs) / len(pairs), 4),
+        "ece": round(ece, 4),
+    }
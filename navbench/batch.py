@@ -0,0 +1,226 @@
+"""
+Offline batch export / ingestion for the Comprehension tasks.
+
+Batch endpoints are much cheaper than interactive requests and do not count against interactive rate limits:
+
+    python -m navbench.batch export --output batch/comp_input.jsonl          # one line per request
+    (submit the file(s) to the provider's batch endpoint, download the output file)
+    python -m navbench.batch ingest --input batch/comp_output.jsonl          # -> results/*.jsonl for the scorers
+    python -m navbench.batch run_local --input batch/comp_input.jsonl --output batch/comp_output.jsonl --mock answer
+
+Every input line is {"custom_id", "method", "url", "body"} where body is a plain chat-completions payload, and
+custom_id is "<sub-task>:<line index in the data file>", so any output that keeps the custom_id can be ingested.
+Output lines are read either in the OpenAI batch format ({"custom_id", "response": {"body": {...}}, "error"}) or
+as a flat {"custom_id", "content"} record, which is easy to produce from any other provider.
+
+Execution steps are not exported: every step's prompt depends on the model's previous answer, so an episode
+cannot be submitted as independent requests.
+"""
+import os
+import json
+import random
+import argparse
+from contextlib import contextmanager
+from pathlib import Path
+
+from navbench.datasets import ROOT, COMP_SUBTASKS, comp_data_path, read_jsonl
+from navbench.sampling import load_subset
+from navbench.comp_tasks import build_messages, score_item, write_results, script_key, run_suffix
+
+BATCH_DIR = ROOT / "batch"
+MAX_FILE_MB = 190  # below the usual 200 MB upload limit of batch endpoints
+ENDPOINT = "/v1/chat/completions"
+
+
+@contextmanager
+def _in_dir(path):
+    # image paths in the data files are relative to the data file's directory
+    cwd = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(cwd)
+
+
+def selected_items(subtask, max_items=None, subset=None):
+    """(line index, item) pairs a normal run would evaluate (subset index, else the first max_items)."""
+    items = read_jsonl(comp_data_path(subtask))
+    rel_path = COMP_SUBTASKS[subtask]
+    if subset is not None and rel_path in subset["comprehension"]:
+        return [(i, items[i]) for i in subset["comprehension"][rel_path] if i < len(items)]
+    pairs = list(enumerate(items))
+    return pairs[:max_items] if max_items else pairs
+
+
+def custom_id(subtask, index):
+    return f"{subtask}:{index}"
+
+
+def parse_custom_id(cid):
+    subtask, index = cid.rsplit(":", 1)
+    return subtask, int(index)
+
+
+def export(output, subtasks=None, max_items=None, subset=None, model=None, max_file_mb=MAX_FILE_MB):
+    """Write one batch line per request, splitting into <output>.partN.jsonl files above max_file_mb."""
+    model = model or os.environ.get("OPENAI_MODEL", "gpt-4o")
+    output = Path(output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    limit = max_file_mb * (1 << 20)
+    files, out, size, n = [], None, 0, 0
+    for subtask in subtasks or COMP_SUBTASKS:
+        if not comp_data_path(subtask).exists():
+            print(f"[Skip] {comp_data_path(subtask)} not found")
+            continue
+        with _in_dir(comp_data_path(subtask).parent):
+            for index, item in selected_items(subtask, max_items, subset):
+                line = json.dumps({
+                    "custom_id": custom_id(subtask, index),
+                    "method": "POST",
+                    "url": ENDPOINT,
+                    "body": {"model": model, "messages": build_messages(subtask, item), "temperature": 0.0},
+                }) + "\n"
+                if out is None or (size and size + len(line) > limit):
+                    if out is not None:
+                        out.close()
+                    files.append(output.with_suffix(f".part{len(files)}.jsonl"))
+                    out, size = open(files[-1], "w"), 0
+                out.write(line)
+                size += len(line)
+                n += 1
+    if out is not None:
+        out.close()
+    if len(files) == 1:
+        files[0].replace(output)
+        files = [output]
+    print(f"[Batch] {n} requests -> {', '.join(str(f) for f in files) or 'nothing'}")
+    return files
+
+
+def response_text(record):
+    """Model answer of one batch output line, or None if the request failed."""
+    if "content" in record:
+        return record["content"]
+    response = record.get("response") or {}
+    if record.get("error") or response.get("status_code", 200) != 200:
+        return None
+    choices = (response.get("body") or {}).get("choices") or []
+    return choices[0]["message"]["content"] if choices else None
+
+
+def read_outputs(paths):
+    outputs = {}
+    for path in paths:
+        for record in read_jsonl(path):
+            outputs[record["custom_id"]] = record
+    return outputs
+
+
+def ingest(paths, max_items=None, suffix=""):
+    """Score batch outputs with each task script's own scorer and write its results file (suffix: run_suffix)."""
+    by_subtask = {}
+    for cid, record in read_outputs(paths).items():
+        subtask, index = parse_custom_id(cid)
+        by_subtask.setdefault(subtask, {})[index] = record
+    written = {}
+    for subtask, records in by_subtask.items():
+        items = read_jsonl(comp_data_path(subtask))
+        results = []
+        for index in sorted(records):
+            item = items[index]
+            text = response_text(records[index])
+            if text is None:
+                error = json.dumps(records[index].get("error") or records[index].get("response"))
+                if script_key(subtask) == "global":
+                    results.append((None, dict(item, gpt_output=f"[ERROR] {error}", success=False)))
+                else:
+                    key = item["instr_id"] if subtask == "progress" else item.get("id")
+                    results.append((key, {"error": error}))
+                continue
+            # the interactive scripts strip the answer except for progress; keep the same behaviour
+            results.append(score_item(subtask, item, text if subtask == "progress" else text.strip()))
+        written[subtask] = write_results(subtask, results, max_items, suffix)
+        print(f"[Batch] {subtask}: {len(results)} results -> {written[subtask]}")
+    return written
+
+
+def mock_answer(subtask, item, mode="answer", rng=random):
+    """Stand-in model: the ground-truth answer, or a random valid one."""
+    key = script_key(subtask)
+    if key == "global":
+        n, gt = len(item["instructions"]), item["answer_idx"]
+    elif key == "progress":
+        n, gt = len(item["sub_instructions"]), item["gt_index"]
+    elif key == "local/action":
+        n, gt = len(item["candidate_views"]), item["answer"]
+    else:
+        n, gt = len(item["cand_views"]), item["answer_idx"]
+    idx = gt if mode == "answer" else rng.randrange(max(n, 1))
+    return chr(ord("A") + idx) if key == "local/action" else str(idx + 1)
+
+
+def run_local(input_paths, output, cache=None, mock="answer", seed=0):
+    """
+    "Execute" batch input files offline: answers come from a previous output file (cache) by custom_id,
+    otherwise from mock_answer. Writes an output file in the OpenAI batch format.
+    """
+    cached = read_outputs([cache]) if cache else {}
+    rng = random.Random(seed)
+    data = {}
+    n_cached = n = 0
+    Path(output).parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w") as out:
+        for path in input_paths:
+            for request in read_jsonl(path):
+                cid = request["custom_id"]
+                text = response_text(cached[cid]) if cid in cached else None
+                if text is not None:
+                    n_cached += 1
+                else:
+                    subtask, index = parse_custom_id(cid)
+                    if subtask not in data:
+                        data[subtask] = read_jsonl(comp_data_path(subtask))
+                    text = mock_answer(subtask, data[subtask][index], mock, rng)
+                body = {"model": request["body"].get("model"),
+                        "choices": [{"index": 0, "message": {"role": "assistant", "content": text}}]}
+                out.write(json.dumps({"custom_id": cid, "response": {"status_code": 200, "body": body},
+                                      "error": None}) + "\n")
+                n += 1
+    print(f"[Batch] {n} requests executed locally ({n_cached} from cache, {n - n_cached} mock '{mock}') -> {output}")
+    return output
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch export / ingestion for Comprehension requests")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("export", help="Write every request as batch JSONL")
+    p.add_argument("--output", default=str(BATCH_DIR / "comp_input.jsonl"))
+    p.add_argument("--subtasks", nargs="*", default=None, choices=list(COMP_SUBTASKS))
+    p.add_argument("--max_items", type=int, default=None)
+    p.add_argument("--subset_file", default=None)
+    p.add_argument("--model", default=None)
+    p.add_argument("--max_file_mb", type=float, default=MAX_FILE_MB)
+    p = sub.add_parser("ingest", help="Turn batch output files into results/*.jsonl")
+    p.add_argument("--input", nargs="+", required=True)
+    p.add_argument("--max_items", type=int, default=None, help="Same value as at export (names the local result files)")
+    p.add_argument("--subset_file", default=None, help="Same value as at export (names the result files)")
+    p = sub.add_parser("run_local", help="Execute a batch input file offline against a cache or mock")
+    p.add_argument("--input", nargs="+", required=True)
+    p.add_argument("--output", default=str(BATCH_DIR / "comp_output.jsonl"))
+    p.add_argument("--cache", default=None, help="Earlier batch output file to answer from")
+    p.add_argument("--mock", default="answer", choices=["answer", "random"])
+    p.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.command == "export":
+        subset = load_subset(args.subset_file) if args.subset_file else None
+        export(args.output, args.subtasks, args.max_items, subset, args.model, args.max_file_mb)
+    elif args.command == "ingest":
+        ingest(args.input, args.max_items, run_suffix(args.subset_file))
+    else:
+        run_local(args.input, args.output, args.cache, args.mock, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""
+End-to-end load benchmark of the request path against the local mock server (navbench/mock_server.py).
+
+Drives the real Comprehension prompt builders and scorers through the shared request layer with the same
+worker-pool layout as the task scripts, and the Execution loop (OneStagePromptManager + gpt_infer +
+parse_json_action) with a simulator stand-in that moves along the connectivity graphs. Image payloads are
+replaced by a fixed placeholder of --image_kb, so no dataset images are needed.
+
+    python -m navbench.bench --comp_items 20 --episodes 3 --latency lognormal:0.5,0.5 --rate_429 0.05
+
+Reports requests/s, p50/p99 latency and client CPU time per request for each phase.
+"""
+import os
+import sys
+import json
+import time
+import base64
+import argparse
+import multiprocessing as mp
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor
+
+from navbench.datasets import COMP_SUBTASKS, EXEC_ROOT, EXEC_SPLITS, comp_data_path, read_jsonl, load_exec_split
+from navbench.comp_tasks import SCRIPTS, load_script, build_messages, score_item
+from navbench.hedging import percentile
+from navbench.scheduling import expected_steps, scan_grouped_order
+from navbench.mock_server import add_mock_args, config_from_args, start_server
+from navbench import llm
+
+
+def placeholder_payload(image_kb):
+    return base64.b64encode(os.urandom(int(image_kb * 1024))).decode("utf-8")
+
+
+def _serve(args, queue):
+    _, base_url = start_server(config_from_args(args), port=0)
+    queue.put(base_url)
+    while True:
+        time.sleep(3600)
+
+
+def start_mock_process(args):
+    """Mock server in its own process, so its CPU time is not charged to the client."""
+    queue = mp.Queue()
+    proc = mp.Process(target=_serve, args=(args, queue), daemon=True)
+    proc.start()
+    return proc, queue.get(timeout=30)
+
+
+def _init_comp_worker(controller, payload):
+    llm.set_controller(controller)
+    for subtask in SCRIPTS:
+        load_script(subtask).encode_image = lambda path: payload
+
+
+def _comp_request(job):
+    subtask, item = job
+    cpu, start = time.process_time(), time.time()
+    try:
+        response = llm.chat_completion(model=os.environ.get("OPENAI_MODEL", "gpt-4o"),
+                                       messages=build_messages(subtask, item), temperature=0.0)
+        score_item(subtask, item, response.choices[0].message.content.strip())
+        ok = True
+    except Exception:
+        ok = False
+    return time.time() - start, time.process_time() - cpu, ok
+
+
+def summarize(name, latencies, cpu_total, elapsed, failures=0):
+    n = len(latencies)
+    row = {
+        "phase": name,
+        "requests": n,
+        "failed": failures,
+        "requests_per_s": round(n / elapsed, 2) if elapsed else None,
+        "p50_latency_s": round(percentile(latencies, 50), 3) if n else None,
+        "p99_latency_s": round(percentile(latencies, 99), 3) if n else None,
+        "cpu_ms_per_request": round(1000 * cpu_total / n, 2) if n else None,
+        "wall_s": round(elapsed, 2),
+    }
+    print(f"[Bench] {name:<14} {n:>6} req  {row['requests_per_s']} req/s  p50 {row['p50_latency_s']}s  "
+          f"p99 {row['p99_latency_s']}s  cpu {row['cpu_ms_per_request']} ms/req  failed {failures}")
+    return row
+
+
+def bench_comprehension(n_items, workers, payload):
+    jobs = []
+    for subtask in COMP_SUBTASKS:
+        if comp_data_path(subtask).exists():
+            jobs += [(subtask, item) for item in read_jsonl(comp_data_path(subtask))[:n_items]]
+    controller = llm.get_controller()
+    start = time.time()
+    with mp.Pool(processes=workers, initializer=_init_comp_worker, initargs=(controller, payload)) as pool:
+        results = pool.map(_comp_request, jobs, chunksize=1)
+    elapsed = time.time() - start
+    return summarize("comprehension", [r[0] for r in results if r[2]], sum(r[1] for r in results), elapsed,
+                     sum(1 for r in results if not r[2]))
+
+
+def _exec_imports():
+    if str(EXEC_ROOT) not in sys.path:
+        sys.path.insert(0, str(EXEC_ROOT))
+    from GPT import api
+    from GPT.one_stage_prompt_manager import OneStagePromptManager
+    from utils.data import load_nav_graphs
+    from vln.offline_env import graph_candidates
+    return api, OneStagePromptManager, load_nav_graphs, graph_candidates
+
+
+def run_episode(item, graph, max_action_len, pm_args, api, OneStagePromptManager, graph_candidates, latencies,
+                img_root="RGB_Observations"):
+    """GPTNavAgent.rollout with the simulator replaced by moves along the navigation graph."""
+    pm = OneStagePromptManager(pm_args)
+    pm.history, pm.nodes_list, pm.node_imgs = [''], [[]], [[]]
+    pm.graph, pm.trajectory = [{}], [[]]
+    pm.planning = [["Navigation has just started, with no planning yet."]]
+    previous_angle = [{'heading': 0., 'elevation': 0.}]
+    viewpoint = item['path'][0]
+    for t in range(max_action_len):
+        ob = {'viewpoint': viewpoint, 'instruction': item['instruction'],
+              'candidate': graph_candidates(graph, item['scan'], viewpoint, img_root)}
+        cand_inputs = pm.make_action_prompt([ob], previous_angle)
+        nav_input = pm.make_r2r_json_prompts(obs=[ob], cand_inputs=cand_inputs, t=t)
+        image_list = pm.node_imgs[0]
+        if len(image_list) > 20:
+            break
+        start = time.time()
+        nav_output, _ = api.gpt_infer(nav_input["task_description"], nav_input["prompts"][0], image_list,
+                                      "gpt-4o", pm_args.max_tokens, response_format={"type": "json_object"})
+        latencies.append(time.time() - start)
+        try:
+            json_output = json.loads(nav_output)
+        except json.JSONDecodeError:
+            json_output = {}
+        a_t = pm.parse_json_action(json_output, nav_input["only_options"], t)
+        pm.parse_json_planning(json_output)
+        if a_t[0] == 0 or a_t[0] > len(ob['candidate']):
+            break
+        chosen = ob['candidate'][a_t[0] - 1]
+        viewpoint = chosen['viewpointId']
+        previous_angle = [{'heading': chosen['absolute_heading'], 'elevation': chosen['absolute_elevation']}]
+        pm.make_history(a_t, nav_input, t)
+
+
+def bench_execution(n_episodes, splits, exec_workers, payload, stop_after=3, max_tokens=1000, episode_order="annotation"):
+    api, OneStagePromptManager, load_nav_graphs, graph_candidates = _exec_imports()
+    api.get_payload = lambda path: payload
+    pm_args = SimpleNamespace(batch_size=1, stop_after=stop_after, use_map=False, use_trajectory=True,
+                              max_tokens=max_tokens)
+    episodes = []
+    for split in splits:
+        data = load_exec_split(split)[:n_episodes]
+        graphs = load_nav_graphs(str(EXEC_ROOT / "datasets" / "connectivity"), set(x['scan'] for x in data))
+        episodes += [(item, graphs[item['scan']], EXEC_SPLITS[split]) for item in data]
+    if episode_order == "longest_first":
+        episodes.sort(key=lambda e: (-expected_steps(e[0], e[2], stop_after), -float(e[0].get('distance', 0.0))))
+    elif episode_order == "scan":
+        episodes = [episodes[i] for i in scan_grouped_order(episodes, scan_of=lambda e: e[0]['scan'])]
+    latencies = []
+    cpu, start = time.process_time(), time.time()
+    with ThreadPoolExecutor(max_workers=exec_workers) as pool:
+        futures = [pool.submit(run_episode, item, graph, max_len, pm_args, api, OneStagePromptManager,
+                               graph_candidates, latencies) for item, graph, max_len in episodes]
+        failures = sum(1 for f in futures if f.exception() is not None)
+    row = summarize("execution", latencies, time.process_time() - cpu, time.time() - start, failures)
+    row["episodes"] = len(episodes)
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load benchmark of the LLM request path against a local mock server")
+    parser.add_argument("--base_url", type=str, default=None, help="Use a running server instead of starting the mock")
+    parser.add_argument("--comp_items", type=int, default=20, help="Items per Comprehension sub-task (0 = skip)")
+    parser.add_argument("--workers", type=int, default=mp.cpu_count(), help="Comprehension worker processes")
+    parser.add_argument("--episodes", type=int, default=3, help="Episodes per Execution split (0 = skip)")
+    parser.add_argument("--splits", nargs="+", default=list(EXEC_SPLITS))
+    parser.add_argument("--exec_workers", type=int, default=1, help="Episodes run concurrently")
+    parser.add_argument("--episode_order", type=str, default="annotation", choices=["annotation", "longest_first", "scan"])
+    parser.add_argument("--image_kb", type=float, default=64, help="Size of the placeholder image payload")
+    parser.add_argument("--output", type=str, default=None, help="Also write the report as JSON")
+    add_mock_args(parser)
+    args = parser.parse_args()
+
+    proc = None
+    if args.base_url is None:
+        proc, args.base_url = start_mock_process(args)
+    os.environ["OPENAI_BASE_URL"] = args.base_url
+    os.environ.setdefault("OPENAI_API_KEY", "mock")
+    print(f"[Bench] server {args.base_url}")
+
+    payload = placeholder_payload(args.image_kb)
+    report = {"config": vars(args), "phases": []}
+    if args.comp_items:
+        report["phases"].append(bench_comprehension(args.comp_items, args.workers, payload))
+    if args.episodes:
+        report["phases"].append(bench_execution(args.episodes, args.splits, args.exec_workers, payload,
+                                                  episode_order=args.episode_order))
+    report["requests"] = llm.request_stats()
+    print(f"[Bench] controller: {llm.get_controller().summary()}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if proc is not None:
+        proc.terminate()
+
+
+if __name__ == "__main__":
+    main()
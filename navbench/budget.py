@@ -0,0 +1,234 @@
+"""
+Deadline- and budget-aware runs.
+
+A run can be given a wall-clock deadline and a token and/or dollar budget. Items are then ordered so that every
+prefix is a stratified sample (navbench.sampling.stratified_order), and a new item is only started while
+
+    now + mean item time <= deadline,   spent + (in flight + 1) x mean item spend <= budget,
+
+so the run stops issuing requests shortly before a limit instead of being killed halfway, and the items that did
+run form a representative partial result. Coverage (done / total and the reason for stopping) is reported.
+
+The limits are passed to the task processes through the environment:
+    NAVBENCH_DEADLINE        unix time
+    NAVBENCH_BUDGET_TOKENS   total input + output tokens
+    NAVBENCH_BUDGET_USD      total cost (priced with NAVBENCH_INPUT_PRICE / NAVBENCH_OUTPUT_PRICE, USD per 1M)
+    NAVBENCH_BUDGET_LEDGER   JSON file with what earlier processes of the same run have spent
+    NAVBENCH_BUDGET_SHARE    fraction of the remaining time / budget this process may use (e.g. 1/3)
+The runners set NAVBENCH_BUDGET_SHARE to 1/<tasks left> so that every sub-task or split gets covered.
+"""
+import os
+import re
+import json
+import time
+import datetime
+import multiprocessing as mp
+from fractions import Fraction
+
+from navbench import tokens
+
+REASONS = ["", "deadline", "token budget", "cost budget"]
+
+_budget = False  # not yet resolved; None = no limits
+
+
+def parse_deadline(value, now=None):
+    """Unix time for "90m", "2h", "45s", "3600" (seconds from now), "18:30" (next occurrence) or an ISO datetime."""
+    now = time.time() if now is None else now
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)([smh]?)", value.strip())
+    if match:
+        return now + float(match.group(1)) * {"": 1, "s": 1, "m": 60, "h": 3600}[match.group(2)]
+    if re.fullmatch(r"\d{1,2}:\d{2}", value.strip()):
+        hour, minute = (int(x) for x in value.split(":"))
+        current = datetime.datetime.fromtimestamp(now)
+        target = current.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if target <= current:
+            target += datetime.timedelta(days=1)
+        return target.timestamp()
+    return datetime.datetime.fromisoformat(value).timestamp()
+
+
+def read_ledger(path):
+    if not path or not os.path.exists(path):
+        return {"tokens": 0, "usd": 0.0}
+    with open(path) as f:
+        return json.load(f)
+
+
+class RunBudget(object):
+
+    def __init__(self, deadline=None, max_tokens=None, max_usd=None, input_price=tokens.DEFAULT_INPUT_PRICE,
+                 output_price=tokens.DEFAULT_OUTPUT_PRICE, ledger=None, ctx=None):
+        ctx = ctx or mp.get_context()
+        self.deadline = deadline
+        self.max_tokens = max_tokens
+        self.max_usd = max_usd
+        self.input_price = input_price
+        self.output_price = output_price
+        self.ledger = ledger
+        self._lock = ctx.Lock()
+        self._tokens_in = ctx.Value("d", 0.0, lock=False)
+        self._tokens_out = ctx.Value("d", 0.0, lock=False)
+        self._item_seconds = ctx.Value("d", 0.0, lock=False)
+        self._started_at = ctx.Value("d", time.time(), lock=False)
+        # counters: in flight, done, refused, stop reason (index into REASONS)
+        self._counts = ctx.Array("l", 4, lock=False)
+
+    @classmethod
+    def from_env(cls):
+        env = os.environ
+        deadline = float(env["NAVBENCH_DEADLINE"]) if env.get("NAVBENCH_DEADLINE") else None
+        max_tokens = float(env["NAVBENCH_BUDGET_TOKENS"]) if env.get("NAVBENCH_BUDGET_TOKENS") else None
+        max_usd = float(env["NAVBENCH_BUDGET_USD"]) if env.get("NAVBENCH_BUDGET_USD") else None
+        if deadline is None and max_tokens is None and max_usd is None:
+            return None
+        share = float(Fraction(env.get("NAVBENCH_BUDGET_SHARE", "1")))
+        ledger = env.get("NAVBENCH_BUDGET_LEDGER")
+        spent = read_ledger(ledger)
+        now = time.time()
+        if deadline is not None:
+            deadline = now + max(0.0, deadline - now) * share
+        if max_tokens is not None:
+            max_tokens = max(0.0, max_tokens - spent["tokens"]) * share
+        if max_usd is not None:
+            max_usd = max(0.0, max_usd - spent["usd"]) * share
+        return cls(deadline, max_tokens, max_usd,
+                   float(env.get("NAVBENCH_INPUT_PRICE", tokens.DEFAULT_INPUT_PRICE)),
+                   float(env.get("NAVBENCH_OUTPUT_PRICE", tokens.DEFAULT_OUTPUT_PRICE)), ledger)
+
+    @property
+    def spent_tokens(self):
+        return self._tokens_in.value + self._tokens_out.value
+
+    @property
+    def spent_usd(self):
+        return tokens.cost(self._tokens_in.value, self._tokens_out.value, self.input_price, self.output_price)
+
+    @property
+    def stop_reason(self):
+        return REASONS[self._counts[3]]
+
+    def record_usage(self, usage):
+        """Account the usage block of one completion (called by navbench.llm for every response)."""
+        if usage is None:
+            return
+        with self._lock:
+            self._tokens_in.value += getattr(usage, "prompt_tokens", 0) or 0
+            self._tokens_out.value += getattr(usage, "completion_tokens", 0) or 0
+
+    def _limit_reason(self):
+        done = self._counts[1]
+        pending = self._counts[0] + 1
+        if self.deadline is not None:
+            mean_seconds = self._item_seconds.value / done if done else 0.0
+            if time.time() + mean_seconds > self.deadline:
+                return 1
+        if self.max_tokens is not None:
+            mean_tokens = self.spent_tokens / done if done else 0.0
+            if self.spent_tokens + pending * mean_tokens > self.max_tokens:
+                return 2
+        if self.max_usd is not None:
+            mean_usd = self.spent_usd / done if done else 0.0
+            if self.spent_usd + pending * mean_usd > self.max_usd:
+                return 3
+        return 0
+
+    def try_start(self):
+        """Reserve a slot for one more item, or refuse (and remember why) when a limit is near."""
+        with self._lock:
+            reason = self._limit_reason()
+            if reason:
+                self._counts[2] += 1
+                self._counts[3] = self._counts[3] or reason
+                return False
+            self._counts[0] += 1
+            return True
+
+    def finish(self, seconds):
+        with self._lock:
+            self._counts[0] -= 1
+            self._counts[1] += 1
+            self._item_seconds.value += seconds
+
+    def cancel(self):
+        """Release a slot that did not turn into an item."""
+        with self._lock:
+            self._counts[0] -= 1
+
+    def coverage(self, done, total):
+        return {
+            "done": done,
+            "total": total,
+            "coverage": round(done / total, 4) if total else None,
+            "stop_reason": self.stop_reason or None,
+            "tokens": int(self.spent_tokens),
+            "usd": round(self.spent_usd, 4),
+            "elapsed_s": round(time.time() - self._started_at.value, 1),
+        }
+
+    def summary(self, done, total):
+        c = self.coverage(done, total)
+        pct = f"{100 * c['coverage']:.1f}%" if total else "n/a"
+        stop = f"stopped early ({c['stop_reason']})" if c["stop_reason"] else "complete"
+        return f"coverage {done}/{total} ({pct}), {stop}, {c['tokens']} tokens, ${c['usd']:.2f}, {c['elapsed_s']}s"
+
+    def save_ledger(self):
+        """Add this process's spend to the run ledger, so later tasks of the run see the remaining budget."""
+        if not self.ledger:
+            return
+        spent = read_ledger(self.ledger)
+        spent["tokens"] += self.spent_tokens
+        spent["usd"] += self.spent_usd
+        with open(self.ledger, "w") as f:
+            json.dump(spent, f)
+
+
+class Budgeted(object):
+    """fn(*args) if the run budget admits one more item, else None (picklable, for Pool.imap)."""
+
+    def __init__(self, fn):
+        self.fn = fn
+
+    def __call__(self, *args):
+        budget = get_budget()
+        if budget is None:
+            return self.fn(*args)
+        if not budget.try_start():
+            return None
+        start = time.time()
+        try:
+            return self.fn(*args)
+        finally:
+            budget.finish(time.time() - start)
+
+
+def set_budget(budget):
+    global _budget
+    _budget = budget
+
+
+def get_budget():
+    global _budget
+    if _budget is False:
+        _budget = RunBudget.from_env()
+    return _budget
+
+
+def add_budget_args(parser):
+    parser.add_argument("--deadline", type=str, default=None, help="Stop starting new items before this time (e.g. 90m, 2h, 18:30)")
+    parser.add_argument("--budget_tokens", type=float, default=None, help="Total input + output token budget")
+    parser.add_argument("--budget_usd", type=float, default=None, help="Total cost budget in USD")
+    return parser
+
+
+def apply_budget_args(args, ledger=None):
+    """Export the limits of args to the environment for this process and its task subprocesses."""
+    if args.deadline:
+        os.environ["NAVBENCH_DEADLINE"] = str(parse_deadline(args.deadline))
+    if args.budget_tokens:
+        os.environ["NAVBENCH_BUDGET_TOKENS"] = str(args.budget_tokens)
+    if args.budget_usd:
+        os.environ["NAVBENCH_BUDGET_USD"] = str(args.budget_usd)
+    if ledger:
+        os.environ["NAVBENCH_BUDGET_LEDGER"] = str(ledger)
+    return bool(args.deadline or args.budget_tokens or args.budget_usd)
@@ -0,0 +1,106 @@
+"""
+The Comprehension task scripts as importable modules, with a uniform way to build each item's request.
+Scripts are loaded from their file (the "global" directory is not an importable package name).
+"""
+import os
+import json
+import importlib.util
+
+from navbench.datasets import COMP_ROOT
+
+SCRIPTS = {
+    "global": "global/global_gpt.py",
+    "progress": "progress/progress_gpt.py",
+    "local/action": "local/local_action_gpt.py",
+    "local/observation": "local/local_obs_gpt.py",
+}
+
+_modules = {}
+
+
+def script_key(subtask):
+    return "global" if subtask.startswith("global/") else subtask
+
+
+def load_script(subtask):
+    key = script_key(subtask)
+    if key not in _modules:
+        path = COMP_ROOT / SCRIPTS[key]
+        spec = importlib.util.spec_from_file_location(f"navbench_comp_{key.replace('/', '_')}", path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        _modules[key] = module
+    return _modules[key]
+
+
+def build_messages(subtask, item):
+    """Chat messages for one item, built by the task script's own prompt builder."""
+    module = load_script(subtask)
+    key = script_key(subtask)
+    if key == "global":
+        return module.build_prompt(item["image_paths"], item["instructions"])
+    if key == "progress":
+        return module.organize_prompt(item["current_traj_views"], item["sub_instructions"])
+    if key == "local/action":
+        return module.organize_prompt(item["current_view"], item["candidate_views"], item["target_view"])
+    return module.organize_prompt(item["current_view"], item["cand_views"], item["target_view"])
+
+
+def score_item(subtask, item, prediction):
+    """(key, record) exactly as the task script writes it for a model answer; unparsable answers give an error record."""
+    module = load_script(subtask)
+    key = script_key(subtask)
+    if key == "global":
+        return None, module.score_prediction(dict(item), prediction)
+    item_id = item["instr_id"] if key == "progress" else item.get("id")
+    try:
+        return item_id, module.score_prediction(item, prediction)
+    except Exception as e:
+        return item_id, {"error": str(e)}
+
+
+def run_suffix(subset_file=None, sequential=False, seed=0, budgeted=False):
+    """
+    Result file suffix of a partial run, so that it never overwrites (or is summarized as) a full run:
+    _<subset file name> for a subset, _seq<seed> for sequential early stopping, _budget under a deadline / budget.
+    """
+    suffix = ""
+    if subset_file:
+        name = os.path.splitext(os.path.basename(subset_file))[0]
+        suffix += f"_{name}" if name.startswith("subset") else f"_subset_{name}"
+    if sequential:
+        suffix += f"_seq{seed}"
+    if budgeted:
+        suffix += "_budget"
+    return suffix
+
+
+def args_suffix(args, budgeted=False):
+    """run_suffix of a task script's or runner's parsed arguments."""
+    return run_suffix(getattr(args, "subset_file", None), getattr(args, "sequential", False), getattr(args, "seed", 0),
+                      budgeted)
+
+
+def result_path(subtask, max_items=None, suffix=""):
+    """Default output file of the task script for this sub-task (suffix: run_suffix of a partial run)."""
+    if subtask.startswith("global/"):
+        return COMP_ROOT / "global" / "results" / f"{subtask.split('/')[1]}_results{suffix}.jsonl"
+    if subtask == "progress":
+        return COMP_ROOT / "progress" / "results" / f"progress_results_gpt4o{suffix}.json"
+    suffix = (f"_sample{max_items}" if max_items else "") + suffix
+    if subtask == "local/action":
+        return COMP_ROOT / "local" / "results" / f"future_action_results_gpt-4o{suffix}.jsonl"
+    return COMP_ROOT / "local" / "results" / f"local_observation_results_gpt4o{suffix}.jsonl"
+
+
+def write_results(subtask, results, max_items=None, suffix=""):
+    """Write (key, record) pairs in the task script's own result format and return the path."""
+    path = result_path(subtask, max_items, suffix)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as f:
+        if subtask == "progress":
+            json.dump({k: v for k, v in results}, f, indent=2)
+        else:
+            for _, record in results:
+                f.write(json.dumps(record) + "\n")
+    return path
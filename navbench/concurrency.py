@@ -0,0 +1,126 @@
+"""
+Adaptive (AIMD) concurrency control for LLM requests.
+
+One controller is shared by every call site of a run, including the worker processes of the Comprehension
+scripts (its state lives in multiprocessing shared memory, so pass it to workers through the Pool initializer
+or the Process arguments). It allows at most `limit` requests in flight:
+
+- each successful request grows the limit additively (+increase per limit successes, i.e. +increase per "round"),
+- a 429 / 5xx / timeout or a latency spike cuts it multiplicatively (at most once per cooldown window),
+- a retry-after header blocks every caller until it has passed, instead of each worker backing off on its own.
+
+The live limit, in-flight count and throughput are logged every log_interval seconds.
+"""
+import os
+import time
+import multiprocessing as mp
+
+
+class AIMDController(object):
+
+    def __init__(self, initial=4, min_limit=1, max_limit=32, increase=1.0, decrease=0.5,
+                 spike_factor=3.0, cooldown=2.0, log_interval=30.0, ctx=None):
+        ctx = ctx or mp.get_context()
+        self._cond = ctx.Condition(ctx.Lock())
+        self._limit = ctx.Value("d", float(initial), lock=False)
+        self._in_flight = ctx.Value("i", 0, lock=False)
+        self._blocked_until = ctx.Value("d", 0.0, lock=False)
+        self._last_decrease = ctx.Value("d", 0.0, lock=False)
+        self._latency_ewma = ctx.Value("d", 0.0, lock=False)
+        self._last_log = ctx.Value("d", time.time(), lock=False)
+        self._started = ctx.Value("d", time.time(), lock=False)
+        # counters: requests, successes, throttled, errors, latency spikes, max in flight, successes since last log
+        self._counts = ctx.Array("l", 7, lock=False)
+        self._latency_sum = ctx.Value("d", 0.0, lock=False)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase = increase
+        self.decrease = decrease
+        self.spike_factor = spike_factor
+        self.cooldown = cooldown
+        self.log_interval = log_interval
+
+    @classmethod
+    def from_env(cls, **kwargs):
+        """Defaults overridable with NAVBENCH_CONCURRENCY_{INITIAL,MIN,MAX} (set by the runners)."""
+        env = os.environ
+        kwargs.setdefault("initial", int(env.get("NAVBENCH_CONCURRENCY_INITIAL", 4)))
+        kwargs.setdefault("min_limit", int(env.get("NAVBENCH_CONCURRENCY_MIN", 1)))
+        kwargs.setdefault("max_limit", int(env.get("NAVBENCH_CONCURRENCY_MAX", 32)))
+        return cls(**kwargs)
+
+    @property
+    def limit(self):
+        return self._limit.value
+
+    def acquire(self):
+        with self._cond:
+            while True:
+                wait = self._blocked_until.value - time.time()
+                if wait <= 0 and self._in_flight.value < max(self.min_limit, int(self._limit.value)):
+                    break
+                self._cond.wait(timeout=max(wait, 0.05) if wait > 0 else 1.0)
+            self._in_flight.value += 1
+            self._counts[0] += 1
+            self._counts[5] = max(self._counts[5], self._in_flight.value)
+
+    def _cut(self, now):
+        if now - self._last_decrease.value >= self.cooldown:
+            self._limit.value = max(float(self.min_limit), self._limit.value * self.decrease)
+            self._last_decrease.value = now
+
+    def release(self, latency, throttled=False, error=False, retry_after=None):
+        """Report the outcome of one request started with acquire()."""
+        now = time.time()
+        with self._cond:
+            self._in_flight.value -= 1
+            if throttled:
+                self._counts[2] += 1
+                self._cut(now)
+                if retry_after:
+                    self._blocked_until.value = max(self._blocked_until.value, now + retry_after)
+            elif error:
+                self._counts[3] += 1
+            else:
+                self._counts[1] += 1
+                self._counts[6] += 1
+                self._latency_sum.value += latency
+                ewma = self._latency_ewma.value
+                if self._counts[1] > 5 and latency > self.spike_factor * ewma:
+                    self._counts[4] += 1
+                    self._cut(now)
+                else:
+                    self._limit.value = min(float(self.max_limit), self._limit.value + self.increase / max(self._limit.value, 1.0))
+                self._latency_ewma.value = latency if ewma == 0 else 0.9 * ewma + 0.1 * latency
+            self._cond.notify_all()
+            if self.log_interval and now - self._last_log.value >= self.log_interval:
+                self._log(now)
+
+    def _log(self, now):
+        elapsed = now - self._last_log.value
+        print(f"[AIMD] limit={self._limit.value:.1f} in_flight={self._in_flight.value} "
+              f"throughput={self._counts[6] / max(elapsed, 1e-6):.2f} req/s "
+              f"throttled={self._counts[2]} latency_ewma={self._latency_ewma.value:.1f}s", flush=True)
+        self._last_log.value = now
+        self._counts[6] = 0
+
+    def stats(self):
+        with self._cond:
+            elapsed = max(time.time() - self._started.value, 1e-6)
+            ok = self._counts[1]
+            return {
+                "limit": round(self._limit.value, 2),
+                "requests": self._counts[0],
+                "succeeded": ok,
+                "throttled": self._counts[2],
+                "errors": self._counts[3],
+                "latency_spikes": self._counts[4],
+                "max_in_flight": self._counts[5],
+                "mean_latency_s": round(self._latency_sum.value / ok, 3) if ok else None,
+                "throughput_rps": round(ok / elapsed, 3),
+            }
+
+    def summary(self):
+        s = self.stats()
+        return (f"{s['succeeded']}/{s['requests']} ok, {s['throttled']} throttled, {s['errors']} errors, "
+                f"final limit {s['limit']}, max in flight {s['max_in_flight']}, {s['throughput_rps']} req/s")
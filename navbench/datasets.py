@@ -0,0 +1,93 @@
+"""
+Where the NavBench data lives and how to read items out of it.
+Shared by the sampling / image / planning helpers so that every tool agrees on file names and item keys.
+"""
+import os
+import re
+import json
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+COMP_ROOT = ROOT / "Comp_code" / "Eval_code"
+EXEC_ROOT = ROOT / "Exec_code"
+
+# Comprehension sub-tasks: key -> data file (relative to COMP_ROOT)
+COMP_SUBTASKS = {
+    "global/basic": "global/basic.jsonl",
+    "global/direction": "global/direction.jsonl",
+    "global/object": "global/object.jsonl",
+    "global/shuffle": "global/shuffle.jsonl",
+    "progress": "progress/progress_data.jsonl",
+    "local/action": "local/future_action_data.jsonl",
+    "local/observation": "local/future_observation_data.jsonl",
+}
+
+# Execution splits: name -> max_action_len used by the official scripts
+EXEC_SPLITS = {
+    "NavBench_Easy": 8,
+    "NavBench_Medium": 15,
+    "NavBench_Hard": 20,
+}
+
+_SCAN_RE = re.compile(r"Data/[^/]+/([^/]+)/")
+
+
+def comp_data_path(subtask):
+    return COMP_ROOT / COMP_SUBTASKS[subtask]
+
+
+def comp_subtask_of(data_path):
+    """Map a data file path (as passed to a task script) back to its sub-task key."""
+    rel = os.path.relpath(os.path.abspath(data_path), COMP_ROOT).replace(os.sep, "/")
+    for key, path in COMP_SUBTASKS.items():
+        if path == rel:
+            return key
+    raise KeyError(f"Not a known Comprehension data file: {data_path}")
+
+
+def read_jsonl(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def load_exec_split(split, anno_dir=None):
+    anno_dir = anno_dir or (EXEC_ROOT / "datasets" / "annotations")
+    with open(os.path.join(anno_dir, split + ".json")) as f:
+        return json.load(f)
+
+
+def comp_item_images(item):
+    """All image paths referenced by a Comprehension item, in prompt order."""
+    if "image_paths" in item:                               # global
+        return list(item["image_paths"])
+    if "current_traj_views" in item:                        # progress
+        return list(item["current_traj_views"])
+    cands = item.get("candidate_views", item.get("cand_views", []))   # local action / observation
+    return [item["current_view"], item["target_view"]] + list(cands)
+
+
+def comp_item_scan(item):
+    if item.get("scan"):
+        return item["scan"]
+    for path in comp_item_images(item):
+        match = _SCAN_RE.search(path)
+        if match:
+            return match.group(1)
+    return None
+
+
+def comp_item_length(item):
+    """Trajectory length for global/progress items, number of candidates for local items."""
+    if "image_paths" in item:
+        return len(item["image_paths"])
+    if "current_traj_views" in item:
+        return len(item["current_traj_views"])
+    return len(item.get("candidate_views", item.get("cand_views", [])))
+
+
+def comp_item_id(subtask, index, item):
+    """A stable id for a Comprehension item: its own id when it has one, otherwise its line index."""
+    for key in ("id", "instr_id"):
+        if item.get(key) is not None:
+            return f"{subtask}:{item[key]}"
+    return f"{subtask}:{index}"
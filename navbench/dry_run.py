@@ -0,0 +1,265 @@
+"""
+No-network dry run: how many requests, images, bytes, tokens and dollars a run will cost.
+
+Comprehension requests are built with the task scripts' real prompt builders (only the base64 encoder is
+replaced by a sizing stub). Execution is simulated along the ground-truth paths with OneStagePromptManager,
+so the prompt and image list grow exactly as in GPTNavAgent.rollout when the agent follows the expert.
+
+Image byte / pixel sizes come from the preflight manifest when available, otherwise from the files
+themselves, otherwise from the --default_*_size estimates.
+
+    python -m navbench.dry_run [--no_exec] [--max_items 3] [--subset_file ...] [--preflight_manifest preflight_manifest.json]
+"""
+import os
+import sys
+import json
+import argparse
+from types import SimpleNamespace
+
+from navbench.datasets import COMP_SUBTASKS, EXEC_ROOT, EXEC_SPLITS, comp_data_path, read_jsonl, load_exec_split
+from navbench.comp_tasks import load_script, build_messages
+from navbench.images import encoded_size
+from navbench.preflight import DEFAULT_OUTPUT as PREFLIGHT_MANIFEST
+from navbench.sampling import load_subset
+from navbench import tokens
+
+PLANNING_PLACEHOLDER = "Continue along the corridor, pass the doorway and look for the next landmark. "
+
+
+class ImageSizes(object):
+    """(bytes, width, height) of an image from the preflight manifest, the file, or a default."""
+
+    def __init__(self, manifest=None, comp_default=(150000, 1024, 512), exec_default=(50000, 640, 480)):
+        self.sizes = {}
+        self.comp_default = comp_default
+        self.exec_default = exec_default
+        self.n_estimated = 0
+        for section in ("comprehension", "execution"):
+            part = (manifest or {}).get(section) or {}
+            for rel, info in part.get("images", {}).items():
+                path = os.path.normpath(os.path.join(part["root"], rel))
+                self.sizes[path] = (info["bytes"], info["width"], info["height"])
+
+    def lookup(self, path, default):
+        """path: absolute, or relative to the current directory."""
+        path = os.path.abspath(path)
+        if path in self.sizes:
+            return self.sizes[path]
+        self.n_estimated += 1
+        if os.path.exists(path):
+            return os.path.getsize(path), default[1], default[2]
+        return default
+
+
+class SizingEncoder(object):
+    """
+    Stands in for encode_image: records the size of every image a builder asks for, returns no data.
+    Image paths in the data files are relative to the data file's directory (base).
+    """
+
+    def __init__(self, sizes, base="."):
+        self.sizes = sizes
+        self.base = base
+        self.calls = []
+
+    def __call__(self, path):
+        path = os.path.normpath(os.path.join(self.base, path))
+        self.calls.append(self.sizes.lookup(path, self.sizes.comp_default))
+        return ""
+
+
+def new_totals():
+    return {"requests": 0, "images": 0, "payload_bytes": 0, "request_bytes": 0, "max_request_bytes": 0,
+            "text_tokens": 0, "image_tokens": 0, "output_tokens": 0}
+
+
+def add_request(totals, n_images, payload_bytes, body_bytes, text_tok, image_tok, output_tok):
+    totals["requests"] += 1
+    totals["images"] += n_images
+    totals["payload_bytes"] += payload_bytes
+    totals["request_bytes"] += body_bytes
+    totals["max_request_bytes"] = max(totals["max_request_bytes"], body_bytes)
+    totals["text_tokens"] += text_tok
+    totals["image_tokens"] += image_tok
+    totals["output_tokens"] += output_tok
+
+
+def _select(items, key, max_items, subset, section):
+    if subset is not None and key in subset[section]:
+        chosen = set(subset[section][key])
+        if section == "comprehension":
+            return [x for i, x in enumerate(items) if i in chosen]
+        return [x for x in items if x["instr_id"] in chosen]
+    return items[:max_items] if max_items else items
+
+
+def plan_comprehension(sizes, max_items=None, subset=None, output_tokens=5):
+    plan = {}
+    encoder = SizingEncoder(sizes)
+    for subtask, rel_path in COMP_SUBTASKS.items():
+        path = comp_data_path(subtask)
+        if not path.exists():
+            continue
+        module = load_script(subtask)
+        encoder.base = str(path.parent)
+        encode_image, module.encode_image = module.encode_image, encoder
+        totals = new_totals()
+        try:
+            for item in _select(read_jsonl(path), rel_path, max_items, subset, "comprehension"):
+                encoder.calls = []
+                messages = build_messages(subtask, item)
+                details = [detail for _, detail in tokens.message_images(messages)]
+                payload = sum(encoded_size(b) for b, _, _ in encoder.calls)
+                image_tok = sum(tokens.image_tokens(w, h, d) for (_, w, h), d in zip(encoder.calls, details))
+                add_request(totals, len(encoder.calls), payload, tokens.request_bytes(messages, payload),
+                            tokens.message_text_tokens(messages), image_tok, output_tokens)
+        finally:
+            module.encode_image = encode_image     # the script modules are cached for the rest of the process
+        plan[f"comprehension/{subtask}"] = totals
+    return plan
+
+
+def _exec_imports():
+    if str(EXEC_ROOT) not in sys.path:
+        sys.path.insert(0, str(EXEC_ROOT))
+    from GPT.one_stage_prompt_manager import OneStagePromptManager
+    from utils.data import load_nav_graphs
+    from vln.offline_env import graph_candidates
+    return OneStagePromptManager, load_nav_graphs, graph_candidates
+
+
+def simulate_episode(prompt_manager, item, graph, img_root, max_action_len, response_format, graph_candidates,
+                     planning_text=PLANNING_PLACEHOLDER):
+    """
+    Yield (system, prompt, image_list) for every request of an episode that follows the ground-truth path,
+    mirroring GPTNavAgent.rollout (including the 20-image stop).
+    """
+    pm = prompt_manager
+    pm.history, pm.nodes_list, pm.node_imgs = [''], [[]], [[]]
+    pm.graph, pm.trajectory = [{}], [[]]
+    pm.planning = [["Navigation has just started, with no planning yet."]]
+    previous_angle = [{'heading': 0., 'elevation': 0.}]
+    path = item['path']
+    for t in range(max_action_len):
+        ob = {'viewpoint': path[t], 'instruction': item['instruction'],
+              'candidate': graph_candidates(graph, item['scan'], path[t], img_root)}
+        cand_inputs = pm.make_action_prompt([ob], previous_angle)
+        if response_format == 'json':
+            nav_input = pm.make_r2r_json_prompts(obs=[ob], cand_inputs=cand_inputs, t=t)
+        else:
+            nav_input = pm.make_r2r_prompts(obs=[ob], cand_inputs=cand_inputs, t=t)
+        image_list = pm.node_imgs[0]
+        if len(image_list) > 20:
+            return
+        yield nav_input["task_description"], nav_input["prompts"][0], image_list
+        if t == len(path) - 1:
+            return                      # the expert stops here
+        next_ix = cand_inputs['cand_vpids'][0].index(path[t + 1])
+        a_t = [next_ix + 1]             # option 0 is 'stop' (or the stop offset before stop_after)
+        pm.planning[0].append(planning_text)
+        previous_angle = [{'heading': ob['candidate'][next_ix]['absolute_heading'],
+                           'elevation': ob['candidate'][next_ix]['absolute_elevation']}]
+        pm.make_history(a_t, nav_input, t)
+
+
+def plan_execution(sizes, splits=None, img_root="RGB_Observations", connectivity_dir=None, anno_dir=None,
+                   max_items=None, subset=None, response_format='json', use_map=False, use_trajectory=True,
+                   stop_after=3, max_tokens=1000, output_tokens=250, planning_tokens=60):
+    OneStagePromptManager, load_nav_graphs, graph_candidates = _exec_imports()
+    connectivity_dir = connectivity_dir or str(EXEC_ROOT / "datasets" / "connectivity")
+    img_root = os.path.join(str(EXEC_ROOT), img_root) if not os.path.isabs(img_root) else img_root
+    pm_args = SimpleNamespace(batch_size=1, stop_after=stop_after, use_map=use_map, use_trajectory=use_trajectory)
+    planning_text = (PLANNING_PLACEHOLDER * (planning_tokens // 15 + 1))[:planning_tokens * 4]
+    plan = {}
+    for split in splits or EXEC_SPLITS:
+        data = _select(load_exec_split(split, anno_dir), split, max_items, subset, "execution")
+        graphs = load_nav_graphs(connectivity_dir, set(x['scan'] for x in data))
+        totals = new_totals()
+        for item in data:
+            pm = OneStagePromptManager(pm_args)
+            for system, prompt, image_list in simulate_episode(pm, item, graphs[item['scan']], img_root,
+                                                               EXEC_SPLITS[split], response_format,
+                                                               graph_candidates, planning_text):
+                images = [sizes.lookup(p, sizes.exec_default) for p in image_list if p is not None]
+                labels = "".join(f"Image {i}:" for i, p in enumerate(image_list) if p is not None)
+                payload = sum(encoded_size(b) for b, _, _ in images)
+                text_tok = tokens.text_tokens(system) + tokens.text_tokens(prompt) + tokens.text_tokens(labels) \
+                    + 2 * tokens.TOKENS_PER_MESSAGE
+                body = len(json.dumps([system, prompt, labels])) + payload + 150 * len(images)
+                add_request(totals, len(images), payload, body, text_tok, 85 * len(images), min(output_tokens, max_tokens))
+        totals["episodes"] = len(data)
+        plan[f"execution/{split}"] = totals
+    return plan
+
+
+def print_plan(plan, input_price=tokens.DEFAULT_INPUT_PRICE, output_price=tokens.DEFAULT_OUTPUT_PRICE):
+    header = f"{'Task':<34} {'Requests':>9} {'Images':>8} {'Body MB':>11} {'Max req MB':>11} {'In tokens':>12} {'Out tokens':>11} {'Cost $':>9}"
+    print(header)
+    print("-" * len(header))
+    grand = new_totals()
+    for name, t in plan.items():
+        in_tok = t["text_tokens"] + t["image_tokens"]
+        t["cost_usd"] = tokens.cost(in_tok, t["output_tokens"], input_price, output_price)
+        print(f"{name:<34} {t['requests']:>9} {t['images']:>8} {t['request_bytes'] / 2**20:>11.1f} "
+              f"{t['max_request_bytes'] / 2**20:>11.2f} {in_tok:>12} {t['output_tokens']:>11} {t['cost_usd']:>9.2f}")
+        for k in grand:
+            grand[k] = max(grand[k], t[k]) if k == "max_request_bytes" else grand[k] + t[k]
+    in_tok = grand["text_tokens"] + grand["image_tokens"]
+    total_cost = tokens.cost(in_tok, grand["output_tokens"], input_price, output_price)
+    print("-" * len(header))
+    print(f"{'Total':<34} {grand['requests']:>9} {grand['images']:>8} {grand['request_bytes'] / 2**20:>11.1f} "
+          f"{grand['max_request_bytes'] / 2**20:>11.2f} {in_tok:>12} {grand['output_tokens']:>11} {total_cost:>9.2f}")
+    return total_cost
+
+
+def add_dry_run_args(parser):
+    parser.add_argument("--preflight_manifest", type=str, default=str(PREFLIGHT_MANIFEST), help="Image sizes from navbench.preflight")
+    parser.add_argument("--input_price", type=float, default=tokens.DEFAULT_INPUT_PRICE, help="USD per 1M input tokens")
+    parser.add_argument("--output_price", type=float, default=tokens.DEFAULT_OUTPUT_PRICE, help="USD per 1M output tokens")
+    parser.add_argument("--comp_output_tokens", type=int, default=5, help="Expected completion tokens per Comprehension request")
+    return parser
+
+
+def load_sizes(args):
+    manifest = None
+    if args.preflight_manifest and os.path.exists(args.preflight_manifest):
+        with open(args.preflight_manifest) as f:
+            manifest = json.load(f)
+    return ImageSizes(manifest)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Estimate requests, payload bytes, tokens and cost without calling any API")
+    parser.add_argument("--no_comp", action="store_true")
+    parser.add_argument("--no_exec", action="store_true")
+    parser.add_argument("--max_items", type=int, default=None, help="Items per Comprehension sub-task / episodes per split")
+    parser.add_argument("--subset_file", type=str, default=None)
+    parser.add_argument("--splits", nargs="+", default=list(EXEC_SPLITS))
+    parser.add_argument("--img_root", type=str, default="RGB_Observations", help="Relative to Exec_code unless absolute")
+    parser.add_argument("--response_format", type=str, default="json", choices=["str", "json"])
+    parser.add_argument("--use_map", action="store_true")
+    parser.add_argument("--max_tokens", type=int, default=1000)
+    parser.add_argument("--exec_output_tokens", type=int, default=250, help="Expected completion tokens per Execution step")
+    parser.add_argument("--output", type=str, default=None, help="Also write the plan as JSON")
+    add_dry_run_args(parser)
+    args = parser.parse_args()
+
+    sizes = load_sizes(args)
+    subset = load_subset(args.subset_file) if args.subset_file else None
+    plan = {}
+    if not args.no_comp:
+        plan.update(plan_comprehension(sizes, args.max_items, subset, args.comp_output_tokens))
+    if not args.no_exec:
+        plan.update(plan_execution(sizes, args.splits, args.img_root, max_items=args.max_items, subset=subset,
+                                   response_format=args.response_format, use_map=args.use_map,
+                                   max_tokens=args.max_tokens, output_tokens=args.exec_output_tokens))
+    print_plan(plan, args.input_price, args.output_price)
+    if sizes.n_estimated:
+        print(f"\n[Note] {sizes.n_estimated} image lookups used estimated sizes (run navbench.preflight for exact ones).")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(plan, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
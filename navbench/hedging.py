@@ -0,0 +1,125 @@
+"""
+Hedged LLM requests to cut tail latency.
+
+Once a request has been outstanding longer than the given percentile of recent request latencies, a duplicate is
+sent and whichever finishes first is used (the other one is left to finish in the background and its result is
+dropped). Duplicates are capped at `budget` x the number of primary requests, so the extra spend is bounded.
+
+The latency window and the win counters are per process; the Execution agent (single process) reports them in
+run_stats_<split>.json.
+"""
+import os
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    k = min(len(values) - 1, max(0, int(round(q / 100.0 * (len(values) - 1)))))
+    return values[k]
+
+
+class HedgePolicy(object):
+
+    def __init__(self, percentile=95.0, budget=0.05, min_samples=20, window=500, history=10000, max_workers=None):
+        self.percentile = percentile
+        self.budget = budget
+        self.min_samples = min_samples
+        self._latencies = deque(maxlen=window)       # recent primary latencies, for the threshold
+        self._primary = deque(maxlen=history)        # primary latency of every request (also when a hedge won)
+        self._effective = deque(maxlen=history)      # latency the caller actually waited
+        self._lock = threading.Lock()
+        # as many workers as the AIMD controller may ever allow in flight, so neither pool caps the window;
+        # hedges get their own pool so that they never queue behind primaries
+        max_workers = max_workers or int(os.environ.get("NAVBENCH_CONCURRENCY_MAX", 32))
+        self._primaries = ThreadPoolExecutor(max_workers=max_workers)
+        self._hedges = ThreadPoolExecutor(max_workers=max_workers)
+        self.counts = {"requests": 0, "hedged": 0, "hedge_wins": 0, "primary_wins": 0, "over_budget": 0}
+
+    @classmethod
+    def from_env(cls):
+        """Enabled when NAVBENCH_HEDGE_PERCENTILE is set (NAVBENCH_HEDGE_BUDGET defaults to 0.05)."""
+        q = os.environ.get("NAVBENCH_HEDGE_PERCENTILE")
+        if not q:
+            return None
+        return cls(percentile=float(q), budget=float(os.environ.get("NAVBENCH_HEDGE_BUDGET", 0.05)))
+
+    def threshold(self):
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return None
+            return percentile(list(self._latencies), self.percentile)
+
+    def _timed(self, fn, start, record):
+        try:
+            return fn()
+        finally:
+            if record:
+                with self._lock:
+                    self._primary.append(time.time() - start)
+                    self._latencies.append(time.time() - start)
+
+    def call(self, fn):
+        """Run fn() (one full request incl. retries), hedging it with a second fn() if it is slow."""
+        start = time.time()
+        with self._lock:
+            self.counts["requests"] += 1
+            can_hedge = self.counts["hedged"] < self.budget * self.counts["requests"]
+        threshold = self.threshold()
+        if threshold is None or not can_hedge:
+            # cannot be hedged: run on the caller's thread
+            result = self._timed(fn, start, True)
+            if threshold is not None and time.time() - start > threshold:
+                with self._lock:
+                    self.counts["over_budget"] += 1
+            self._record(start)
+            return result
+        primary = self._primaries.submit(self._timed, fn, start, True)
+        done, _ = wait([primary], timeout=threshold)
+        if done:
+            result = primary.result()
+            self._record(start)
+            return result
+        with self._lock:
+            allowed = self.counts["hedged"] < self.budget * self.counts["requests"]
+            self.counts["hedged" if allowed else "over_budget"] += 1
+        if not allowed:
+            result = primary.result()
+            self._record(start)
+            return result
+        hedge = self._hedges.submit(fn)
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    with self._lock:
+                        self.counts["primary_wins" if future is primary else "hedge_wins"] += 1
+                        self._effective.append(time.time() - start)
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def _record(self, start):
+        with self._lock:
+            self._effective.append(time.time() - start)
+
+    def stats(self):
+        with self._lock:
+            primary_p99 = percentile(self._primary, 99)
+            effective_p99 = percentile(self._effective, 99)
+            stats = dict(self.counts)
+            stats.update({
+                "percentile": self.percentile,
+                "budget": self.budget,
+                "p99_primary_s": round(primary_p99, 3) if primary_p99 is not None else None,
+                "p99_effective_s": round(effective_p99, 3) if effective_p99 is not None else None,
+            })
+        if primary_p99 is not None and effective_p99 is not None:
+            stats["p99_improvement_s"] = round(primary_p99 - effective_p99, 3)
+        return stats
@@ -0,0 +1,195 @@
+"""
+Pack every benchmark image into one archive plus an offset index, memory-mapped at run time.
+
+    python -m navbench.image_pack build --output images.pack [--img_root Exec_code/RGB_Observations] [--no_b64]
+    python -m navbench.image_pack info images.pack
+
+Layout of <output>: MAGIC, the raw image bytes (one blob per unique content), then optionally the same blobs
+pre-encoded as base64. <output>.json maps each image key to (raw_offset, raw_len, b64_offset, b64_len).
+Keys are "<root tag>/<path relative to that root>", and root directories are stored relative to the repo root
+when possible, so an archive keeps working when the checkout moves.
+
+The reader hands out memoryview slices of the mapping (no copy); the payload store in navbench/images.py
+uses it whenever NAVBENCH_IMAGE_PACK is set (run_eval_comprehension.py / main_gpt.py --image_pack).
+"""
+import os
+import sys
+import json
+import mmap
+import base64
+import hashlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+from navbench.datasets import ROOT, COMP_ROOT, EXEC_ROOT, EXEC_SPLITS, load_exec_split
+from navbench.images import comp_image_paths
+
+MAGIC = b"NBPACK01"
+IMAGE_EXTS = (".jpg", ".jpeg", ".png")
+
+
+def _store_root(path):
+    path = os.path.abspath(path)
+    rel = os.path.relpath(path, ROOT)
+    return rel if not rel.startswith("..") else path
+
+
+def _resolve_root(root):
+    return root if os.path.isabs(root) else os.path.normpath(os.path.join(ROOT, root))
+
+
+def exec_image_paths(img_root, anno_dir=None):
+    """Every rendered view under img_root/<scan>/ for the scans used by the Execution splits."""
+    scans = set()
+    for split in EXEC_SPLITS:
+        try:
+            scans.update(x["scan"] for x in load_exec_split(split, anno_dir))
+        except FileNotFoundError:
+            continue
+    paths = []
+    for scan in sorted(scans):
+        scan_dir = os.path.join(img_root, scan)
+        for dirpath, _, files in os.walk(scan_dir):
+            paths.extend(os.path.join(dirpath, f) for f in sorted(files) if f.lower().endswith(IMAGE_EXTS))
+    return paths
+
+
+def build_pack(output, sources, with_b64=True, workers=16, chunk=256):
+    """
+    sources: {root tag: (root dir, [absolute image paths])}.
+    Files are read in parallel chunks and streamed into the archive; identical contents are stored once.
+    """
+    roots = {tag: _store_root(root) for tag, (root, _) in sources.items()}
+    entries, blobs = {}, {}
+    missing = 0
+
+    def _read(p):
+        try:
+            with open(p, "rb") as f:
+                return p, f.read()
+        except OSError:
+            return p, None
+
+    with open(output, "wb") as out, ThreadPoolExecutor(max_workers=workers) as pool:
+        out.write(MAGIC)
+        for tag, (root, paths) in sources.items():
+            for start in range(0, len(paths), chunk):
+                for p, raw in pool.map(_read, paths[start:start + chunk]):
+                    if raw is None:
+                        missing += 1
+                        continue
+                    digest = hashlib.sha1(raw).hexdigest()
+                    if digest not in blobs:
+                        blobs[digest] = [out.tell(), len(raw), -1, 0]
+                        out.write(raw)
+                    entries[f"{tag}/{os.path.relpath(p, root)}"] = digest
+
+        if with_b64:
+            out.flush()
+            with open(output, "rb") as src:
+                for blob in blobs.values():
+                    src.seek(blob[0])
+                    encoded = base64.b64encode(src.read(blob[1]))
+                    blob[2], blob[3] = out.tell(), len(encoded)
+                    out.write(encoded)
+
+    index = {
+        "version": 1,
+        "roots": roots,
+        "b64": with_b64,
+        "n_blobs": len(blobs),
+        "entries": {key: blobs[digest] for key, digest in entries.items()},
+    }
+    with open(output + ".json", "w") as f:
+        json.dump(index, f)
+    return index, missing
+
+
+class ImagePack(object):
+    """Read-only, memory-mapped view of an archive written by build_pack()."""
+
+    def __init__(self, path):
+        with open(path + ".json") as f:
+            index = json.load(f)
+        self.entries = index["entries"]
+        self.has_b64 = index["b64"]
+        self.roots = {tag: _resolve_root(root) for tag, root in index["roots"].items()}
+        self._file = open(path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a NavBench image pack")
+        self._view = memoryview(self._mmap)
+
+    def key(self, path):
+        abspath = os.path.abspath(path)
+        for tag, root in self.roots.items():
+            rel = os.path.relpath(abspath, root)
+            if not rel.startswith(".."):
+                key = f"{tag}/{rel}"
+                if key in self.entries:
+                    return key
+        return None
+
+    def __contains__(self, path):
+        return self.key(path) is not None
+
+    def raw(self, path):
+        """Zero-copy memoryview of the image bytes."""
+        off, length, _, _ = self.entries[self.key(path)]
+        return self._view[off:off + length]
+
+    def b64(self, path):
+        """Zero-copy memoryview of the pre-encoded base64 bytes (None if the pack has no base64 section)."""
+        _, _, off, length = self.entries[self.key(path)]
+        if off < 0:
+            return None
+        return self._view[off:off + length]
+
+    def payload(self, path):
+        """Base64 string for a data URL; the only copy made is the str the request body needs."""
+        encoded = self.b64(path)
+        if encoded is None:
+            return base64.b64encode(self.raw(path)).decode("ascii")
+        return str(encoded, "ascii")
+
+    def close(self):
+        self._view.release()
+        self._mmap.close()
+        self._file.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pack NavBench images into one memory-mapped archive")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build")
+    b.add_argument("--output", type=str, required=True)
+    b.add_argument("--img_root", type=str, default=str(EXEC_ROOT / "RGB_Observations"), help="Execution observation images")
+    b.add_argument("--no_comp", action="store_true", help="Skip Comprehension images")
+    b.add_argument("--no_exec", action="store_true", help="Skip Execution images")
+    b.add_argument("--no_b64", action="store_true", help="Do not store the pre-encoded base64 section")
+    b.add_argument("--workers", type=int, default=16)
+    i = sub.add_parser("info")
+    i.add_argument("pack", type=str)
+    args = parser.parse_args()
+
+    if args.cmd == "info":
+        pack = ImagePack(args.pack)
+        print(f"{len(pack.entries)} keys, roots: {pack.roots}, base64 section: {pack.has_b64}")
+        print(f"archive size: {os.path.getsize(args.pack) / 2**20:.1f} MiB")
+        return
+
+    sources = {}
+    if not args.no_comp:
+        sources["comp"] = (str(COMP_ROOT), comp_image_paths())
+    if not args.no_exec:
+        img_root = os.path.abspath(args.img_root)
+        sources["exec"] = (img_root, exec_image_paths(img_root))
+    index, missing = build_pack(args.output, sources, with_b64=not args.no_b64, workers=args.workers)
+    print(f"[Pack] {len(index['entries'])} images ({index['n_blobs']} unique) -> {args.output}"
+          f" ({os.path.getsize(args.output) / 2**20:.1f} MiB), {missing} missing")
+    if missing:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+"""
+Content-addressed image manifest and a shared base64 payload store.
+
+Comprehension items reuse the same panoramas many times (progress items are growing prefixes of one path,
+local items share views_pano_panobasic panoramas), and the Execution agent re-sends every node image at each step.
+The store reads and encodes each unique image content once and hands the same string to every request:
+
+- an in-process LRU keyed by content hash, bounded by --payload_memory_mb,
+- an optional on-disk cache of encoded payloads (NAVBENCH_PAYLOAD_CACHE) shared by all worker processes,
+  filled in parallel once per run by `warm()` before any worker starts,
+- an optional memory-mapped image archive (NAVBENCH_IMAGE_PACK, see navbench/image_pack.py) that replaces
+  the per-file reads entirely.
+"""
+import os
+import json
+import base64
+import hashlib
+import argparse
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from navbench.datasets import COMP_ROOT, COMP_SUBTASKS, read_jsonl, comp_item_images
+
+MANIFEST_PATH = COMP_ROOT / "image_manifest.json"
+DEFAULT_MEMORY_MB = 256
+
+
+def file_digest(path, chunk_size=1 << 20):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def encoded_size(n_bytes):
+    return 4 * ((n_bytes + 2) // 3)
+
+
+def comp_image_paths(subtasks=None, max_items=None, subset=None):
+    """
+    Absolute paths of the images referenced by the Comprehension data files (deduplicated, stable order),
+    optionally restricted to the items a run will actually use (first max_items, or a loaded subset index).
+    """
+    seen = OrderedDict()
+    for subtask in subtasks or COMP_SUBTASKS:
+        data_path = COMP_ROOT / COMP_SUBTASKS[subtask]
+        if not data_path.exists():
+            continue
+        base = data_path.parent
+        items = read_jsonl(data_path)
+        if subset is not None and COMP_SUBTASKS[subtask] in subset["comprehension"]:
+            items = [items[i] for i in subset["comprehension"][COMP_SUBTASKS[subtask]] if i < len(items)]
+        elif max_items:
+            items = items[:max_items]
+        for item in items:
+            for p in comp_item_images(item):
+                seen[os.path.normpath(os.path.join(base, p))] = None
+    return list(seen)
+
+
+def build_manifest(paths, root=COMP_ROOT, workers=16):
+    """
+    {"root": root, "images": {relative path: {"hash", "bytes"}}}; missing files get hash None.
+    Hashing runs in a thread pool since it is I/O bound.
+    """
+    def _entry(p):
+        try:
+            return p, {"hash": file_digest(p), "bytes": os.path.getsize(p)}
+        except OSError:
+            return p, {"hash": None, "bytes": None}
+
+    images = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for p, entry in pool.map(_entry, paths):
+            images[os.path.relpath(p, root)] = entry
+    unique = len({e["hash"] for e in images.values() if e["hash"]})
+    return {"root": str(root), "n_paths": len(images), "n_unique": unique, "images": images}
+
+
+def load_manifest(path=MANIFEST_PATH):
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_manifest(manifest, path=MANIFEST_PATH):
+    with open(path, "w") as f:
+        json.dump(manifest, f, indent=1)
+
+
+class PayloadStore(object):
+    """Base64 payloads keyed by content hash, with a byte-bounded LRU and an optional disk cache."""
+
+    def __init__(self, manifest=None, cache_dir=None, max_bytes=DEFAULT_MEMORY_MB << 20, pack=None):
+        self.manifest = manifest
+        self.pack = pack
+        self.root = manifest["root"] if manifest else None
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lru = OrderedDict()
+        self._lru_bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "memory_hits": 0, "pack_hits": 0, "disk_hits": 0, "encodes": 0, "bytes_read": 0}
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, path):
+        """Content hash from the manifest when known, otherwise the absolute path."""
+        abspath = os.path.abspath(path)
+        if self.manifest is not None:
+            entry = self.manifest["images"].get(os.path.relpath(abspath, self.root))
+            if entry and entry["hash"]:
+                return entry["hash"]
+        return abspath
+
+    def _cache_file(self, key):
+        if not self.cache_dir or os.sep in key:
+            return None
+        return os.path.join(self.cache_dir, key + ".b64")
+
+    def _remember(self, key, payload):
+        size = len(payload)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._lru:
+                return
+            self._lru[key] = payload
+            self._lru_bytes += size
+            while self._lru_bytes > self.max_bytes:
+                _, old = self._lru.popitem(last=False)
+                self._lru_bytes -= len(old)
+
+    def _encode(self, path):
+        with open(path, "rb") as f:
+            raw = f.read()
+        self.stats["encodes"] += 1
+        self.stats["bytes_read"] += len(raw)
+        return base64.b64encode(raw).decode("utf-8")
+
+    def get(self, path):
+        self.stats["requests"] += 1
+        key = self.key(path)
+        with self._lock:
+            payload = self._lru.get(key)
+            if payload is not None:
+                self._lru.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return payload
+        if self.pack is not None and path in self.pack:
+            payload = self.pack.payload(path)
+            self.stats["pack_hits"] += 1
+            self._remember(key, payload)
+            return payload
+        cache_file = self._cache_file(key)
+        if cache_file and os.path.exists(cache_file):
+            with open(cache_file) as f:
+                payload = f.read()
+            self.stats["disk_hits"] += 1
+        else:
+            payload = self._encode(path)
+            if cache_file:
+                self._write_cache(cache_file, payload)
+        self._remember(key, payload)
+        return payload
+
+    @staticmethod
+    def _write_cache(cache_file, payload):
+        tmp = f"{cache_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w") as f:
+            f.write(payload)
+        os.replace(tmp, cache_file)
+
+    def warm(self, paths, workers=16):
+        """
+        Encode every unique image among paths into the disk cache, in parallel.
+        Payloads are streamed to disk and not kept in memory; without a cache_dir this is a no-op.
+        """
+        if not self.cache_dir:
+            return 0
+        todo = OrderedDict()
+        for p in paths:
+            key = self.key(p)
+            cache_file = self._cache_file(key)
+            if self.pack is not None and p in self.pack:
+                continue
+            if cache_file and key not in todo and not os.path.exists(cache_file) and os.path.exists(p):
+                todo[key] = (p, cache_file)
+
+        def _one(args):
+            p, cache_file = args
+            self._write_cache(cache_file, self._encode(p))
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(_one, todo.values()))
+        return len(todo)
+
+
+_default_store = None
+_default_lock = threading.Lock()
+
+
+def default_store():
+    """
+    Process-wide store configured from the environment, so worker processes started by the
+    task scripts share the parent's disk cache:
+    NAVBENCH_IMAGE_MANIFEST, NAVBENCH_PAYLOAD_CACHE, NAVBENCH_PAYLOAD_MEMORY_MB, NAVBENCH_IMAGE_PACK.
+    """
+    global _default_store
+    if _default_store is None:
+        with _default_lock:
+            if _default_store is None:
+                manifest_path = os.environ.get("NAVBENCH_IMAGE_MANIFEST")
+                manifest = load_manifest(manifest_path) if manifest_path and os.path.exists(manifest_path) else None
+                memory_mb = int(os.environ.get("NAVBENCH_PAYLOAD_MEMORY_MB", DEFAULT_MEMORY_MB))
+                pack = None
+                if os.environ.get("NAVBENCH_IMAGE_PACK"):
+                    from navbench.image_pack import ImagePack
+                    pack = ImagePack(os.environ["NAVBENCH_IMAGE_PACK"])
+                _default_store = PayloadStore(manifest, os.environ.get("NAVBENCH_PAYLOAD_CACHE") or None,
+                                              memory_mb << 20, pack=pack)
+    return _default_store
+
+
+def get_payload(path):
+    """Base64 string of the image at path, shared across all requests of this run."""
+    return default_store().get(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the Comprehension image manifest / warm the payload cache")
+    parser.add_argument("--manifest", type=str, default=str(MANIFEST_PATH))
+    parser.add_argument("--payload_cache", type=str, default=None, help="Also encode every unique image into this directory")
+    parser.add_argument("--workers", type=int, default=16)
+    args = parser.parse_args()
+
+    paths = comp_image_paths()
+    manifest = build_manifest(paths, workers=args.workers)
+    save_manifest(manifest, args.manifest)
+    missing = sum(1 for e in manifest["images"].values() if e["hash"] is None)
+    print(f"[Manifest] {manifest['n_paths']} image paths, {manifest['n_unique']} unique contents, {missing} missing -> {args.manifest}")
+    if args.payload_cache:
+        n = PayloadStore(manifest, args.payload_cache).warm(paths, args.workers)
+        print(f"[Payload] Encoded {n} unique images into {args.payload_cache}")
+
+
+if __name__ == "__main__":
+    main()
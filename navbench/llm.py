@@ -0,0 +1,190 @@
+"""
+Shared LLM request layer for the Comprehension scripts and the Execution agent.
+
+- The client is created on first use, so task modules can be imported (dry runs, batch export) without an API key.
+- Every request goes through one AIMD concurrency controller (navbench/concurrency.py) that is shared by all
+  call sites and worker processes of a run; retries are driven by it instead of independent per-call backoff.
+"""
+import os
+import sys
+import time
+import random
+from types import SimpleNamespace
+
+import openai
+from openai import OpenAI
+
+from navbench.concurrency import AIMDController
+from navbench.hedging import HedgePolicy
+from navbench.budget import get_budget, set_budget
+from navbench import tokens
+
+MAX_ATTEMPTS = 6
+
+_client = None
+_controller = None
+_hedge = False  # not yet resolved; None = hedging disabled
+
+
+def get_client():
+    """Per-process OpenAI client (worker processes create their own after fork)."""
+    global _client
+    if _client is None:
+        api_key = os.getenv("OPENAI_API_KEY")
+        if not api_key:
+            raise RuntimeError("OPENAI_API_KEY not set.")
+        # retries are handled by chat_completion so that the controller sees every 429
+        _client = OpenAI(api_key=api_key, max_retries=0)
+    return _client
+
+
+def require_api_key():
+    if not os.getenv("OPENAI_API_KEY"):
+        print("[Error] OPENAI_API_KEY not set.")
+        sys.exit(1)
+
+
+def set_controller(controller):
+    """Install the run's shared controller (also used as Pool initializer in worker processes)."""
+    global _controller
+    _controller = controller
+
+
+def init_worker(controller, budget=None):
+    """Pool initializer: share the run's controller and budget with a worker process."""
+    set_controller(controller)
+    set_budget(budget)
+
+
+def get_controller():
+    global _controller
+    if _controller is None:
+        _controller = AIMDController.from_env()
+    return _controller
+
+
+def get_hedge_policy():
+    global _hedge
+    if _hedge is False:
+        _hedge = HedgePolicy.from_env()
+    return _hedge
+
+
+def _retry_after(error):
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000.0
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+def classify_error(error):
+    """(retryable, throttled): 429s, 5xx and timeouts are retried and count as congestion."""
+    if isinstance(error, openai.RateLimitError):
+        return True, True
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError)):
+        return True, True
+    if isinstance(error, openai.APIStatusError):
+        status = getattr(error, "status_code", 0) or 0
+        return status >= 500, status >= 500
+    return False, False
+
+
+def chat_completion(max_attempts=MAX_ATTEMPTS, **kwargs):
+    """client.chat.completions.create(**kwargs) under the shared controller, retried on 429 / 5xx.
+
+    With NAVBENCH_HEDGE_PERCENTILE set, slow requests are hedged (see navbench/hedging.py).
+    """
+    hedge = get_hedge_policy()
+    if hedge is not None:
+        return hedge.call(lambda: _chat_completion(max_attempts, kwargs))
+    return _chat_completion(max_attempts, kwargs)
+
+
+def _failed(controller, error, start, attempt, max_attempts):
+    """Report a failed attempt to the controller; re-raise unless it should be retried, else wait for the retry."""
+    retryable, throttled = classify_error(error)
+    retry_after = _retry_after(error)
+    controller.release(time.time() - start, throttled=throttled, error=not throttled, retry_after=retry_after)
+    if not retryable or attempt == max_attempts - 1:
+        raise error
+    # the controller already blocks everyone until retry-after; jitter spreads the restart
+    time.sleep(retry_after or random.uniform(0, min(60, 2 ** attempt)))
+
+
+def _chat_completion(max_attempts, kwargs):
+    controller = get_controller()
+    for attempt in range(max_attempts):
+        controller.acquire()
+        start = time.time()
+        try:
+            response = get_client().chat.completions.create(**kwargs)
+        except Exception as e:
+            _failed(controller, e, start, attempt, max_attempts)
+            continue
+        controller.release(time.time() - start)
+        if get_budget() is not None:
+            get_budget().record_usage(getattr(response, "usage", None))
+        return response
+
+
+def _estimated_usage(messages, text):
+    """Usage of a stream closed before its usage chunk: input from the request, output from the text received."""
+    image_tokens = sum(85 if detail == "low" else tokens.image_tokens(512, 512)
+                       for _, detail in tokens.message_images(messages))
+    return SimpleNamespace(prompt_tokens=tokens.message_text_tokens(messages) + image_tokens,
+                           completion_tokens=tokens.text_tokens(text))
+
+
+def stream_completion(watch=None, max_attempts=MAX_ATTEMPTS, **kwargs):
+    """Streamed client.chat.completions.create(**kwargs) under the shared controller; returns (text, timing).
+
+    watch(text, elapsed) is called with the text received so far after every chunk. Once it returns True the
+    stream is closed, which stops the generation. timing = {'ttft', 'total', 'cancelled'} (seconds from the
+    start of the request). Retried like chat_completion when the request fails; not hedged.
+    """
+    controller = get_controller()
+    for attempt in range(max_attempts):
+        controller.acquire()
+        start = time.time()
+        try:
+            # stream_options through extra_body: also accepted by SDK versions that do not know the parameter
+            stream = get_client().chat.completions.create(
+                stream=True, extra_body={"stream_options": {"include_usage": True}}, **kwargs)
+        except Exception as e:
+            _failed(controller, e, start, attempt, max_attempts)
+            continue
+        text, usage, ttft, cancelled = "", None, None, False
+        try:
+            for chunk in stream:
+                if getattr(chunk, "usage", None):
+                    usage = chunk.usage
+                if not chunk.choices or not chunk.choices[0].delta.content:
+                    continue
+                if ttft is None:
+                    ttft = time.time() - start
+                text += chunk.choices[0].delta.content
+                if watch is not None and watch(text, time.time() - start):
+                    cancelled = True
+                    stream.response.close()
+                    break
+        except Exception:
+            controller.release(time.time() - start, error=True)
+            raise
+        total = time.time() - start
+        controller.release(total)
+        if get_budget() is not None:
+            get_budget().record_usage(usage or _estimated_usage(kwargs.get("messages", []), text))
+        return text, {"ttft": ttft, "total": total, "cancelled": cancelled}
+
+
+def request_stats():
+    stats = get_controller().stats()
+    if get_hedge_policy() is not None:
+        stats["hedging"] = get_hedge_policy().stats()
+    return stats
@@ -0,0 +1,262 @@
+"""
+Local OpenAI-compatible chat-completions server for running the pipelines without an API key.
+
+    python -m navbench.mock_server --port 8099 --latency lognormal:1.5,0.6 --rate_429 0.05 --error_rate 0.01
+    OPENAI_BASE_URL=http://127.0.0.1:8099/v1 OPENAI_API_KEY=mock bash run_eval_comprehension.sh
+
+Latency is drawn per request from one of
+    fixed:<s> | uniform:<lo>,<hi> | exponential:<mean> | lognormal:<median>,<sigma>
+plus --per_image_ms for every image in the request. Failures are injected with --rate_429 (with a retry-after
+header) and --error_rate (HTTP 500); --capacity answers 429 whenever more requests than that are in flight.
+
+Answers are scripted (--script: a JSON list of {"match": regex, "answer": text}, first match on the request
+text wins) or heuristic: a random valid option for each Comprehension prompt, and a random action option in
+the Execution format (JSON when response_format is json_object, with only the schema fields for json_schema).
+Requests with logprobs=true get top_logprobs over the Comprehension options (the answer at 0.6).
+Requests with stream=true get server-sent chunks, one every --token_ms; the count of streams closed early by the
+client is kept as stream_closed.
+"""
+import re
+import json
+import math
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def parse_latency(spec):
+    """Sampler for a latency spec such as "lognormal:1.5,0.6" (seconds)."""
+    kind, _, params = spec.partition(":")
+    values = [float(x) for x in params.split(",") if x]
+    if kind == "fixed":
+        return lambda rng: values[0]
+    if kind == "uniform":
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == "exponential":
+        return lambda rng: rng.expovariate(1.0 / values[0])
+    if kind == "lognormal":
+        mu = math.log(values[0])
+        return lambda rng: rng.lognormvariate(mu, values[1])
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+def request_text(messages):
+    """All text parts of the request and the number of images."""
+    texts, n_images = [], 0
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            texts.append(content)
+            continue
+        for part in content or []:
+            if part.get("type") == "text":
+                texts.append(part["text"])
+            elif part.get("type") == "image_url":
+                n_images += 1
+    return "\n".join(texts), n_images
+
+
+_EXEC_OPTIONS = re.compile(r"Action options \(step \d+\): \[(.*)\]")
+
+
+def heuristic_answer(text, json_mode, rng, stop_prob=0.15, fields=None):
+    """A random but well-formed answer for whichever NavBench prompt this is (only `fields`, if a schema gives them)."""
+    match = _EXEC_OPTIONS.search(text)
+    if match:
+        options = re.findall(r"'([A-Z])\. ([^']*)'", match.group(1))
+        stop = [letter for letter, action in options if action == "stop"]
+        moves = [letter for letter, action in options if action != "stop"]
+        letter = stop[0] if stop and (not moves or rng.random() < stop_prob) else rng.choice(moves or ["A"])
+        answer = {"Thought": "Following the instruction towards the next landmark.",
+                  "New Planning": "Keep moving along the described path.", "Action": letter}
+        if json_mode:
+            return json.dumps({k: answer[k] for k in fields} if fields else answer)
+        return f"Thought: {answer['Thought']}\nNew Planning: {answer['New Planning']}\nAction: {letter}"
+    return rng.choice(comprehension_options(text) or ["1"])
+
+
+def comprehension_options(text):
+    """Option labels of a Comprehension prompt (empty for other prompts)."""
+    letters = re.search(r"Reply with one of the letters: ([A-Z](?:, [A-Z])*)", text)
+    if letters:                                             # local action
+        return letters.group(1).split(", ")
+    for pattern in (r"Candidate (\d+):", r"Sub-instruction (\d+):", r"Instruction (\d+):"):
+        numbers = re.findall(pattern, text)                 # local observation / progress / global
+        if numbers:
+            return [str(i) for i in range(1, max(int(n) for n in numbers) + 1)]
+    return []
+
+
+def answer_logprobs(text, answer, top_n):
+    """Chat logprobs of the first answer token: the answer most likely, the other options sharing the rest."""
+    others = [o for o in comprehension_options(text) if o != answer][:max(0, top_n - 1)]
+    probs = [(answer, 0.6)] + [(o, 0.4 / len(others)) for o in others] if others else [(answer, 1.0)]
+    top = [{"token": token, "logprob": math.log(p), "bytes": list(token.encode())} for token, p in probs]
+    return {"content": [dict(top[0], top_logprobs=top)]}
+
+
+class MockConfig(object):
+
+    def __init__(self, latency="fixed:0.05", per_image_ms=0.0, rate_429=0.0, error_rate=0.0, retry_after=1.0,
+                 capacity=0, script=None, seed=0, token_ms=0.0):
+        self.sample_latency = parse_latency(latency)
+        self.per_image_ms = per_image_ms
+        self.rate_429 = rate_429
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.capacity = capacity
+        self.token_ms = token_ms
+        self.script = [(re.compile(r["match"]), r["answer"]) for r in (script or [])]
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.counts = {"requests": 0, "ok": 0, "429": 0, "500": 0, "stream_closed": 0}
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    config = None
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body, headers=None):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _stream(self, payload, answer, usage):
+        """Server-sent events in the chat.completion.chunk format, one ~4-character chunk every token_ms."""
+        cfg = self.config
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        base = {"id": f"chatcmpl-mock-{cfg.counts['requests']}", "object": "chat.completion.chunk",
+                "created": int(time.time()), "model": payload.get("model", "mock")}
+        pieces = [answer[i:i + 4] for i in range(0, len(answer), 4)]
+        events = [dict(base, choices=[{"index": 0, "delta": {"role": "assistant", "content": p}, "finish_reason": None}])
+                  for p in pieces]
+        events.append(dict(base, choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}]))
+        if (payload.get("stream_options") or {}).get("include_usage"):
+            events.append(dict(base, choices=[], usage=usage))
+        try:
+            for event in events:
+                self.wfile.write(b"data: " + json.dumps(event).encode() + b"\n\n")
+                self.wfile.flush()
+                if cfg.token_ms:
+                    time.sleep(cfg.token_ms / 1000.0)
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            with cfg.lock:
+                cfg.counts["stream_closed"] += 1      # the client cancelled the generation
+        self.close_connection = True
+
+    def do_POST(self):
+        cfg = self.config
+        payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            return self._send(404, {"error": {"message": f"Unknown endpoint {self.path}"}})
+        with cfg.lock:
+            cfg.counts["requests"] += 1
+            cfg.in_flight += 1
+            overloaded = cfg.capacity and cfg.in_flight > cfg.capacity
+            roll = cfg.rng.random()
+            latency = cfg.sample_latency(cfg.rng)
+        try:
+            if overloaded or roll < cfg.rate_429:
+                with cfg.lock:
+                    cfg.counts["429"] += 1
+                return self._send(429, {"error": {"message": "Rate limit reached (mock)", "type": "rate_limit_error"}},
+                                  {"retry-after": str(cfg.retry_after)})
+            if roll < cfg.rate_429 + cfg.error_rate:
+                with cfg.lock:
+                    cfg.counts["500"] += 1
+                return self._send(500, {"error": {"message": "Internal error (mock)", "type": "server_error"}})
+            text, n_images = request_text(payload.get("messages", []))
+            time.sleep(latency + n_images * cfg.per_image_ms / 1000.0)
+            response_format = payload.get("response_format") or {}
+            json_mode = response_format.get("type") in ("json_object", "json_schema")
+            fields = list(response_format.get("json_schema", {}).get("schema", {}).get("properties", {})) or None
+            answer = next((a for pattern, a in cfg.script if pattern.search(text)), None)
+            if answer is None:
+                with cfg.lock:
+                    answer = heuristic_answer(text, json_mode, cfg.rng, fields=fields)
+            with cfg.lock:
+                cfg.counts["ok"] += 1
+            prompt_tokens = len(text) // 4 + 85 * n_images
+            completion_tokens = max(1, len(answer) // 4)
+            usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                     "total_tokens": prompt_tokens + completion_tokens}
+            if payload.get("stream"):
+                return self._stream(payload, answer, usage)
+            choice = {"index": 0, "message": {"role": "assistant", "content": answer}, "finish_reason": "stop"}
+            if payload.get("logprobs"):
+                choice["logprobs"] = answer_logprobs(text, answer, payload.get("top_logprobs") or 1)
+            self._send(200, {
+                "id": f"chatcmpl-mock-{cfg.counts['requests']}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": payload.get("model", "mock"),
+                "choices": [choice],
+                "usage": usage,
+            })
+        finally:
+            with cfg.lock:
+                cfg.in_flight -= 1
+
+
+def start_server(config, host="127.0.0.1", port=0):
+    """Serve in a background thread; returns (server, base_url). port=0 picks a free port."""
+    handler = type("BoundMockHandler", (MockHandler,), {"config": config})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/v1"
+
+
+def add_mock_args(parser):
+    parser.add_argument("--latency", type=str, default="lognormal:0.5,0.5", help="Latency distribution (see module doc)")
+    parser.add_argument("--per_image_ms", type=float, default=0.0, help="Extra latency per image in the request")
+    parser.add_argument("--rate_429", type=float, default=0.0, help="Fraction of requests answered with 429")
+    parser.add_argument("--error_rate", type=float, default=0.0, help="Fraction of requests answered with 500")
+    parser.add_argument("--retry_after", type=float, default=1.0, help="retry-after header of 429 answers (s)")
+    parser.add_argument("--capacity", type=int, default=0, help="Answer 429 above this many in-flight requests (0 = unlimited)")
+    parser.add_argument("--script", type=str, default=None, help="JSON list of {match, answer} scripted answers")
+    parser.add_argument("--mock_seed", type=int, default=0)
+    parser.add_argument("--token_ms", type=float, default=0.0, help="Delay between streamed chunks (stream=true requests)")
+    return parser
+
+
+def config_from_args(args):
+    script = None
+    if args.script:
+        with open(args.script) as f:
+            script = json.load(f)
+    return MockConfig(args.latency, args.per_image_ms, args.rate_429, args.error_rate, args.retry_after,
+                      args.capacity, script, args.mock_seed, args.token_ms)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible mock chat-completions server")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    add_mock_args(parser)
+    args = parser.parse_args()
+    server, base_url = start_server(config_from_args(args), args.host, args.port)
+    print(f"[Mock] serving on {base_url} (export OPENAI_BASE_URL={base_url} OPENAI_API_KEY=mock)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+"""
+Dataset preflight: check every image a run can send before any API traffic.
+
+Comprehension: every image referenced by the *.jsonl files.
+Execution: for every split, every viewpoint reachable from the episode start viewpoints in the connectivity
+graph must have all 36 rendered views under <img_root>/<scan>/<viewpoint>/<viewIndex>.jpg (the layout used by
+R2RNavBatch.make_candidate).
+
+Each file is checked for existence, decodability and size in a thread pool; the byte and pixel sizes are
+written to a manifest that the dry-run planner reuses. With an image pack (--image_pack, or NAVBENCH_IMAGE_PACK
+as set by the runners), images in the pack are checked there, as the payload store will read them.
+
+    python -m navbench.preflight [--no_exec] [--img_root Exec_code/RGB_Observations] [--image_pack images.pack]
+"""
+import io
+import os
+import sys
+import json
+import struct
+import argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from navbench.datasets import ROOT, COMP_ROOT, EXEC_ROOT, EXEC_SPLITS, load_exec_split
+from navbench.images import comp_image_paths
+from navbench.image_pack import ImagePack
+
+try:
+    from PIL import Image
+except ImportError:     # optional: full decode check when Pillow is installed
+    Image = None
+
+DEFAULT_OUTPUT = ROOT / "preflight_manifest.json"
+N_VIEWS = 36
+
+
+def _jpeg_size(data):
+    if data[:2] != b"\xff\xd8":
+        raise ValueError("missing JPEG SOI marker")
+    if data.rstrip(b"\x00")[-2:] != b"\xff\xd9":
+        raise ValueError("truncated JPEG (no EOI marker)")
+    i = 2
+    while i + 9 < len(data):
+        if data[i] != 0xFF:
+            raise ValueError(f"corrupt JPEG marker at byte {i}")
+        marker = data[i + 1]
+        if marker == 0xFF:
+            i += 1
+            continue
+        length = struct.unpack(">H", data[i + 2:i + 4])[0]
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height, width = struct.unpack(">HH", data[i + 5:i + 9])
+            return width, height
+        i += 2 + length
+    raise ValueError("no JPEG frame header")
+
+
+def _png_size(data):
+    if data[:8] != b"\x89PNG\r\n\x1a\n" or data[12:16] != b"IHDR":
+        raise ValueError("bad PNG signature")
+    if b"IEND" not in data[-12:]:
+        raise ValueError("truncated PNG (no IEND chunk)")
+    return struct.unpack(">II", data[16:24])
+
+
+def probe_image(path, pack=None):
+    """(bytes, width, height, format) of an image, from pack if it has it; raises OSError / ValueError if unusable."""
+    if pack is not None and path in pack:
+        data = bytes(pack.raw(path))
+    else:
+        with open(path, "rb") as f:
+            data = f.read()
+    if not data:
+        raise ValueError("empty file")
+    if data[:2] == b"\xff\xd8":
+        fmt, (width, height) = "jpeg", _jpeg_size(data)
+    elif data[:4] == b"\x89PNG":
+        fmt, (width, height) = "png", _png_size(data)
+    else:
+        raise ValueError("unknown image format")
+    if Image is not None:
+        with Image.open(io.BytesIO(data)) as im:
+            im.load()
+    return len(data), width, height, fmt
+
+
+def reachable_viewpoints(connectivity_dir, scan, starts):
+    """Viewpoints reachable from any of starts over the navigable (unobstructed, included) edges."""
+    with open(os.path.join(connectivity_dir, f"{scan}_connectivity.json")) as f:
+        data = json.load(f)
+    ids = [item["image_id"] for item in data]
+    adj = {}
+    for i, item in enumerate(data):
+        if not item["included"]:
+            continue
+        adj[ids[i]] = [ids[j] for j, conn in enumerate(item["unobstructed"]) if conn and data[j]["included"]]
+    seen = set(s for s in starts if s in adj)
+    queue = deque(seen)
+    while queue:
+        for nxt in adj[queue.popleft()]:
+            if nxt not in seen:
+                seen.add(nxt)
+                queue.append(nxt)
+    return seen
+
+
+def exec_targets(img_root, connectivity_dir, splits=None, anno_dir=None, pack=None):
+    """
+    (image paths to probe, errors for viewpoints without any rendered views).
+    All 36 discretized views of every reachable viewpoint are probed, since any of them can be in a prompt.
+    """
+    starts = {}
+    for split in splits or EXEC_SPLITS:
+        for item in load_exec_split(split, anno_dir):
+            starts.setdefault(item["scan"], set()).add(item["path"][0])
+    paths, errors = [], []
+    for scan in sorted(starts):
+        for vp in sorted(reachable_viewpoints(connectivity_dir, scan, starts[scan])):
+            vp_dir = os.path.join(img_root, scan, vp)
+            views = [os.path.join(vp_dir, f"{ix}.jpg") for ix in range(N_VIEWS)]
+            if not os.path.isdir(vp_dir) and not (pack is not None and any(v in pack for v in views)):
+                errors.append({"path": os.path.relpath(vp_dir, img_root), "error": "no rendered views for reachable viewpoint"})
+            else:
+                paths.extend(views)
+    return paths, errors
+
+
+def check_images(paths, root, workers=32, pack=None):
+    """Probe every path in a thread pool; returns (images, errors) keyed by path relative to root."""
+    def _one(p):
+        try:
+            return p, probe_image(p, pack), None
+        except (OSError, ValueError) as e:
+            return p, None, str(e)
+
+    images, errors = {}, []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for p, info, err in pool.map(_one, paths):
+            rel = os.path.relpath(p, root)
+            if err is not None:
+                errors.append({"path": rel, "error": err})
+            else:
+                n_bytes, width, height, fmt = info
+                images[rel] = {"bytes": n_bytes, "width": width, "height": height, "format": fmt}
+    return images, errors
+
+
+def run_preflight(comp=True, exec_splits=None, img_root=None, connectivity_dir=None, anno_dir=None,
+                  image_pack=None, workers=32, output=DEFAULT_OUTPUT):
+    """Check the requested data, write the manifest and return True when nothing is missing or broken."""
+    manifest = {"comprehension": None, "execution": None}
+    n_errors = 0
+    image_pack = image_pack or os.environ.get("NAVBENCH_IMAGE_PACK")
+    pack = ImagePack(image_pack) if image_pack else None
+    if comp:
+        images, errors = check_images(comp_image_paths(), COMP_ROOT, workers, pack)
+        manifest["comprehension"] = {"root": str(COMP_ROOT), "images": images, "errors": errors}
+        n_errors += len(errors)
+        print(f"[Preflight] Comprehension: {len(images)} images ok, {len(errors)} errors")
+    if exec_splits:
+        img_root = os.path.abspath(img_root or (EXEC_ROOT / "RGB_Observations"))
+        connectivity_dir = connectivity_dir or str(EXEC_ROOT / "datasets" / "connectivity")
+        paths, vp_errors = exec_targets(img_root, connectivity_dir, exec_splits, anno_dir, pack)
+        images, errors = check_images(paths, img_root, workers, pack)
+        errors = vp_errors + errors
+        manifest["execution"] = {"root": img_root, "splits": list(exec_splits), "images": images, "errors": errors}
+        n_errors += len(errors)
+        print(f"[Preflight] Execution ({', '.join(exec_splits)}): {len(images)} images ok, {len(errors)} errors")
+
+    if pack is not None:
+        pack.close()
+    manifest["ok"] = n_errors == 0
+    if output:
+        with open(output, "w") as f:
+            json.dump(manifest, f, indent=1)
+        print(f"[Preflight] Manifest written to {output}")
+    for section in ("comprehension", "execution"):
+        errors = (manifest[section] or {}).get("errors", [])
+        for err in errors[:10]:
+            print(f"  [{section}] {err['path']}: {err['error']}")
+        if len(errors) > 10:
+            print(f"  [{section}] ... and {len(errors) - 10} more")
+    return manifest["ok"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Validate every image referenced by NavBench before running")
+    parser.add_argument("--no_comp", action="store_true", help="Skip Comprehension images")
+    parser.add_argument("--no_exec", action="store_true", help="Skip Execution observations")
+    parser.add_argument("--splits", nargs="+", default=list(EXEC_SPLITS), help="Execution splits to check")
+    parser.add_argument("--img_root", type=str, default=str(EXEC_ROOT / "RGB_Observations"))
+    parser.add_argument("--connectivity_dir", type=str, default=str(EXEC_ROOT / "datasets" / "connectivity"))
+    parser.add_argument("--image_pack", type=str, default=None, help="Packed image archive to check images in")
+    parser.add_argument("--workers", type=int, default=32)
+    parser.add_argument("--output", type=str, default=str(DEFAULT_OUTPUT))
+    args = parser.parse_args()
+
+    ok = run_preflight(comp=not args.no_comp, exec_splits=None if args.no_exec else args.splits,
+                       img_root=args.img_root, connectivity_dir=args.connectivity_dir,
+                       image_pack=args.image_pack, workers=args.workers, output=args.output)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""
+Stratified, seeded subsets of the NavBench data for fast smoke runs.
+
+The subset is written once as an index file and then consumed by both pipelines:
+the Comprehension scripts (--subset_file) keep the selected line indices of their data file,
+main_gpt.py (--subset_file) keeps the selected instr_ids of its split.
+
+    python -m navbench.sampling --fraction 0.05 --seed 0
+"""
+import os
+import json
+import random
+import argparse
+from collections import defaultdict
+
+from navbench.datasets import (
+    ROOT, COMP_SUBTASKS, EXEC_SPLITS, comp_data_path, comp_subtask_of, read_jsonl,
+    load_exec_split, comp_item_scan, comp_item_length,
+)
+
+SUBSET_DIR = ROOT / "subsets"
+
+
+def _length_bucket(n):
+    # short / medium / long paths; finer buckets leave most strata empty on small subsets
+    if n <= 4:
+        return "short"
+    if n <= 7:
+        return "medium"
+    return "long"
+
+
+def allocate(strata_sizes, n, rng):
+    """Proportional allocation of n items over strata (largest remainder, random tie-break)."""
+    total = sum(strata_sizes.values())
+    if total == 0 or n <= 0:
+        return {k: 0 for k in strata_sizes}
+    n = min(n, total)
+    quotas = {k: n * size / total for k, size in strata_sizes.items()}
+    alloc = {k: int(q) for k, q in quotas.items()}
+    keys = list(strata_sizes)
+    rng.shuffle(keys)
+    keys.sort(key=lambda k: quotas[k] - alloc[k], reverse=True)
+    for k in keys[:n - sum(alloc.values())]:
+        alloc[k] += 1
+    return alloc
+
+
+def stratified_sample(items, strata_fn, n, seed=0):
+    """Indices of a size-n stratified sample of items, returned in original order."""
+    rng = random.Random(seed)
+    strata = defaultdict(list)
+    for i, item in enumerate(items):
+        strata[strata_fn(item)].append(i)
+    alloc = allocate({k: len(v) for k, v in strata.items()}, n, rng)
+    chosen = []
+    for key in sorted(strata, key=str):
+        chosen.extend(rng.sample(strata[key], alloc[key]))
+    return sorted(chosen)
+
+
+def stratified_order(items, strata_fn, seed=0):
+    """
+    All indices of items ordered so that every prefix is (close to) a proportional stratified sample:
+    each next item comes from the stratum that is furthest below its share. Used when a run may be cut short.
+    """
+    rng = random.Random(seed)
+    strata = defaultdict(list)
+    for i, item in enumerate(items):
+        strata[strata_fn(item)].append(i)
+    keys = sorted(strata, key=str)
+    for key in keys:
+        rng.shuffle(strata[key])
+    total = len(items)
+    taken = {key: 0 for key in keys}
+    order = []
+    for n in range(1, total + 1):
+        open_keys = [k for k in keys if taken[k] < len(strata[k])]
+        key = max(open_keys, key=lambda k: (n * len(strata[k]) / total - taken[k], rng.random()))
+        order.append(strata[key][taken[key]])
+        taken[key] += 1
+    return order
+
+
+def comp_strata(item):
+    return comp_item_scan(item), _length_bucket(comp_item_length(item))
+
+
+def exec_strata(item):
+    return item["scan"], _length_bucket(len(item["path"]))
+
+
+def _subset_size(total, fraction=None, size=None):
+    if size is not None:
+        return min(size, total)
+    return max(1, int(round(total * fraction)))
+
+
+def build_subset(fraction=None, size=None, seed=0, anno_dir=None):
+    """
+    Build the index for every Comprehension sub-task and every Execution split.
+    Execution splits are sampled separately, so the difficulty split is always a stratum.
+    """
+    index = {"seed": seed, "fraction": fraction, "size": size, "comprehension": {}, "execution": {}}
+    for subtask, rel_path in COMP_SUBTASKS.items():
+        path = comp_data_path(subtask)
+        if not path.exists():
+            continue
+        items = read_jsonl(path)
+        n = _subset_size(len(items), fraction, size)
+        index["comprehension"][rel_path] = stratified_sample(items, comp_strata, n, seed)
+    for split in EXEC_SPLITS:
+        try:
+            data = load_exec_split(split, anno_dir)
+        except FileNotFoundError:
+            continue
+        n = _subset_size(len(data), fraction, size)
+        chosen = stratified_sample(data, exec_strata, n, seed)
+        index["execution"][split] = [data[i]["instr_id"] for i in chosen]
+    return index
+
+
+def default_subset_path(fraction=None, size=None, seed=0):
+    tag = f"n{size}" if size is not None else f"f{fraction:g}"
+    return SUBSET_DIR / f"subset_{tag}_seed{seed}.json"
+
+
+def load_or_build_subset(fraction=None, size=None, seed=0, path=None, rebuild=False):
+    """Return the path of the cached index file, building it on first use."""
+    if fraction is None and size is None:
+        raise ValueError("Either fraction or size is required")
+    path = path or default_subset_path(fraction, size, seed)
+    if rebuild or not os.path.exists(path):
+        index = build_subset(fraction, size, seed)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(index, f, indent=2)
+        print(f"[Subset] Wrote {path}")
+    return str(path)
+
+
+def load_subset(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def select_comp_lines(lines, subset_file, data_path):
+    """Keep only the lines of data_path selected in subset_file (no-op without a subset file)."""
+    if not subset_file:
+        return lines
+    indices = load_subset(subset_file)["comprehension"].get(COMP_SUBTASKS[comp_subtask_of(data_path)])
+    if indices is None:
+        print(f"[Subset] {data_path} not in {subset_file}, using all items")
+        return lines
+    return [lines[i] for i in indices if i < len(lines)]
+
+
+def select_exec_items(data, subset_file, split):
+    if not subset_file:
+        return data
+    ids = load_subset(subset_file)["execution"].get(split)
+    if ids is None:
+        print(f"[Subset] {split} not in {subset_file}, using all episodes")
+        return data
+    keep = set(ids)
+    return [x for x in data if x["instr_id"] in keep]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a stratified NavBench subset index")
+    parser.add_argument("--fraction", type=float, default=None, help="Fraction of each sub-task / split to keep")
+    parser.add_argument("--size", type=int, default=None, help="Fixed number of items per sub-task / split")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=str, default=None, help="Index file (default: subsets/subset_<tag>_seed<seed>.json)")
+    parser.add_argument("--rebuild", action="store_true", help="Overwrite an existing index file")
+    args = parser.parse_args()
+    if args.fraction is None and args.size is None:
+        parser.error("one of --fraction / --size is required")
+
+    path = load_or_build_subset(args.fraction, args.size, args.seed, args.output, args.rebuild)
+    index = load_subset(path)
+    for name, idxs in list(index["comprehension"].items()) + list(index["execution"].items()):
+        print(f"  {name:<40} {len(idxs)} items")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Makespan-aware ordering of Execution episodes.
+
+An episode runs until the agent stops or max_action_len is reached, so its wall clock is roughly proportional to
+its number of steps. Starting the longest episodes first (LPT scheduling) keeps concurrent runners from ending on a
+tail of long Hard-split episodes. Grouping episodes by scan instead keeps the navigation graphs and buffered
+candidate views of one scan hot (Exec_code/vln/nav_cache.py) and lets a scan be dropped once its episodes are done.
+The order never changes an episode's result, only when it starts.
+"""
+def expected_steps(item, max_action_len, stop_after=3):
+    """
+    Steps an episode is expected to take: one per ground-truth move plus the stop decision, at least
+    stop_after + 1 (the agent cannot stop earlier), at most max_action_len.
+    """
+    steps = max(len(item["path"]), stop_after + 1)
+    return min(steps, max_action_len)
+
+
+def longest_first_order(items, max_action_len, stop_after=3):
+    """Indices of items by decreasing expected steps; ties go to the longer distance, then annotation order."""
+    return sorted(range(len(items)),
+                  key=lambda i: (-expected_steps(items[i], max_action_len, stop_after),
+                                 -float(items[i].get("distance", 0.0)), i))
+
+
+def scan_grouped_order(items, scan_of=lambda item: item["scan"]):
+    """Indices of items grouped by scan: scans in order of first appearance, annotation order within a scan."""
+    first = {}
+    for i, item in enumerate(items):
+        first.setdefault(scan_of(item), i)
+    return sorted(range(len(items)), key=lambda i: (first[scan_of(items[i])], i))
+
+
+def order_episodes(items, max_action_len, stop_after=3, order="annotation"):
+    if order == "longest_first":
+        return [items[i] for i in longest_first_order(items, max_action_len, stop_after)]
+    if order == "scan":
+        return [items[i] for i in scan_grouped_order(items)]
+    return items
+
+
+def interleave_for_shards(items, n_shards):
+    """
+    Reorder items so that cutting the list into n_shards contiguous chunks (the sel_data_idxs split of
+    R2RNavBatch: len // n per chunk, the rest to the last one) deals them out round-robin. Every shard then
+    gets a similar mix of the order above, e.g. its share of the longest episodes first.
+    """
+    n = len(items)
+    sizes = [n // n_shards] * (n_shards - 1) + [n - (n // n_shards) * (n_shards - 1)]
+    buckets = [[] for _ in range(n_shards)]
+    shard = 0
+    for item in items:
+        while len(buckets[shard]) >= sizes[shard]:
+            shard = (shard + 1) % n_shards
+        buckets[shard].append(item)
+        shard = (shard + 1) % n_shards
+    return [item for bucket in buckets for item in bucket]
@@ -0,0 +1,94 @@
+"""
+Small statistics helpers shared by the Comprehension and Execution runners.
+"""
+import math
+import random
+from statistics import NormalDist
+
+
+def z_value(confidence=0.95):
+    return NormalDist().inv_cdf(0.5 + confidence / 2.0)
+
+
+def wilson_interval(correct, total, confidence=0.95):
+    """Wilson score interval for a binomial accuracy, returned as (low, high) in [0, 1]."""
+    if total <= 0:
+        return 0.0, 1.0
+    z = z_value(confidence)
+    p = correct / total
+    denom = 1.0 + z * z / total
+    center = (p + z * z / (2 * total)) / denom
+    margin = z * math.sqrt(p * (1 - p) / total + z * z / (4 * total * total)) / denom
+    return max(0.0, center - margin), min(1.0, center + margin)
+
+
+def half_width(correct, total, confidence=0.95):
+    low, high = wilson_interval(correct, total, confidence)
+    return (high - low) / 2.0
+
+
+def combined_half_width(half_widths):
+    """Half-width of the mean of independent estimates (used for averaged metrics)."""
+    if not half_widths:
+        return None
+    return math.sqrt(sum(h * h for h in half_widths)) / len(half_widths)
+
+
+def seeded_order(n, seed=0):
+    """A deterministic random permutation of range(n)."""
+    order = list(range(n))
+    random.Random(seed).shuffle(order)
+    return order
+
+
+class SequentialStopper(object):
+    """
+    Tracks a running accuracy and tells the caller when its confidence interval is tight enough.
+    Items must be fed in a random order for the interval to be meaningful.
+    """
+
+    def __init__(self, target_half_width=0.05, min_items=30, confidence=0.95):
+        self.target_half_width = target_half_width
+        self.min_items = min_items
+        self.confidence = confidence
+        self.correct = 0
+        self.total = 0
+
+    def update(self, correct):
+        self.total += 1
+        if correct:
+            self.correct += 1
+        return self.should_stop()
+
+    @property
+    def accuracy(self):
+        return self.correct / self.total if self.total else 0.0
+
+    @property
+    def half_width(self):
+        return half_width(self.correct, self.total, self.confidence)
+
+    def should_stop(self):
+        if self.total < self.min_items:
+            return False
+        return self.half_width <= self.target_half_width
+
+    def summary(self):
+        low, high = wilson_interval(self.correct, self.total, self.confidence)
+        return f"{self.correct}/{self.total} = {self.accuracy:.2%}  (±{self.half_width:.2%}, CI [{low:.2%}, {high:.2%}])"
+
+
+def add_sequential_args(parser):
+    """Command-line flags shared by every Comprehension sub-task script."""
+    parser.add_argument("--sequential", action="store_true", help="Sample items in a seeded random order and stop once the accuracy CI is tight enough")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the random item order in --sequential mode")
+    parser.add_argument("--target_half_width", type=float, default=0.05, help="Stop when the CI half-width drops below this (fraction, e.g. 0.05 = 5 points)")
+    parser.add_argument("--min_items", type=int, default=30, help="Never stop before this many scored items in --sequential mode")
+    parser.add_argument("--confidence", type=float, default=0.95, help="Confidence level of the accuracy interval")
+    return parser
+
+
+def make_stopper(args):
+    if not getattr(args, "sequential", False):
+        return None
+    return SequentialStopper(args.target_half_width, args.min_items, args.confidence)
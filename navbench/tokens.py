@@ -0,0 +1,73 @@
+"""
+Token and cost estimates for planning runs (no network).
+Image tokens follow the published GPT-4o vision accounting; text uses tiktoken when it is installed.
+"""
+import json
+import math
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("o200k_base")
+except Exception:     # optional dependency, or no cached encoding files offline
+    _ENCODING = None
+
+# USD per 1M tokens (gpt-4o list price); override on the command line for other models
+DEFAULT_INPUT_PRICE = 2.50
+DEFAULT_OUTPUT_PRICE = 10.00
+TOKENS_PER_MESSAGE = 4
+
+
+def text_tokens(text):
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text))
+    return int(math.ceil(len(text) / 4.0))
+
+
+def image_tokens(width, height, detail="auto"):
+    """85 tokens for low detail; otherwise 85 + 170 per 512px tile after the API's resizing."""
+    if detail == "low":
+        return 85
+    if width > 2048 or height > 2048:
+        scale = 2048.0 / max(width, height)
+        width, height = width * scale, height * scale
+    if min(width, height) > 768:
+        scale = 768.0 / min(width, height)
+        width, height = width * scale, height * scale
+    tiles = math.ceil(width / 512.0) * math.ceil(height / 512.0)
+    return 85 + 170 * tiles
+
+
+def message_text_tokens(messages):
+    """Text tokens of chat messages, ignoring image parts (counted separately)."""
+    total = 0
+    for message in messages:
+        total += TOKENS_PER_MESSAGE
+        content = message["content"]
+        if isinstance(content, str):
+            total += text_tokens(content)
+            continue
+        for part in content:
+            if part.get("type") == "text":
+                total += text_tokens(part["text"])
+    return total
+
+
+def message_images(messages):
+    """(url, detail) of every image part of chat messages."""
+    images = []
+    for message in messages:
+        if isinstance(message["content"], str):
+            continue
+        for part in message["content"]:
+            if part.get("type") == "image_url":
+                images.append((part["image_url"]["url"], part["image_url"].get("detail", "auto")))
+    return images
+
+
+def request_bytes(messages, image_payload_bytes=0):
+    """Approximate HTTP body size: the JSON of the messages plus the base64 payloads not inlined in them."""
+    return len(json.dumps(messages)) + image_payload_bytes
+
+
+def cost(input_tokens, output_tokens, input_price=DEFAULT_INPUT_PRICE, output_price=DEFAULT_OUTPUT_PRICE):
+    return (input_tokens * input_price + output_tokens * output_price) / 1e6
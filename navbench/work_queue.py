@@ -0,0 +1,291 @@
+"""
+Lease-based work queue for spreading a NavBench sweep over several machines that share a filesystem.
+
+Jobs live in one SQLite file: Execution episodes (queue "exec:<split>", job id = instr_id) and Comprehension
+items (queue "comp:<sub-task>", job id = line index in the data file). A worker claims a job with a lease of
+--lease_seconds, renews it from a heartbeat thread while it works, and stores the result. A lease that is not
+renewed (the worker died or lost the filesystem) expires, and the job is handed to the next worker that asks.
+Results are written idempotently: the first result of a job wins, so a job that was run twice after a reclaim
+is counted once.
+
+    python -m navbench.work_queue init --db sweep.sqlite                   # enqueue everything (idempotent)
+    python -m navbench.work_queue status --db sweep.sqlite
+    python -m navbench.work_queue comp_worker --db sweep.sqlite            # on any host, as many as wanted
+    cd Exec_code && python main_gpt.py --queue ../sweep.sqlite --split NavBench_Easy --max_action_len 8 ...
+
+Every worker writes the merged outputs (results/*.jsonl of the Comprehension scripts, submit_<split>.json) once
+its queue is fully done. SQLite locking needs a filesystem with working POSIX locks (most NFSv4 / Lustre setups).
+"""
+import os
+import json
+import time
+import socket
+import sqlite3
+import argparse
+import threading
+from contextlib import contextmanager
+
+from navbench.datasets import COMP_SUBTASKS, EXEC_SPLITS, comp_data_path, read_jsonl, load_exec_split
+
+LEASE_SECONDS = 300
+MAX_ATTEMPTS = 3
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    queue TEXT NOT NULL,
+    job_id TEXT NOT NULL,
+    payload TEXT,
+    state TEXT NOT NULL DEFAULT 'pending',      -- pending | leased | done | failed
+    owner TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    error TEXT,
+    updated REAL,
+    PRIMARY KEY (queue, job_id)
+)
+"""
+
+
+# "all jobs" when the bound job id list is NULL, else membership in that JSON list
+_SELECTION = "(? IS NULL OR job_id IN (SELECT value FROM json_each(?)))"
+
+
+def _selection(job_ids):
+    ids = None if job_ids is None else json.dumps([str(j) for j in job_ids])
+    return ids, ids
+
+
+def worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+class WorkQueue(object):
+
+    def __init__(self, path, max_attempts=MAX_ATTEMPTS):
+        self.path = str(path)
+        self.max_attempts = max_attempts
+        with self._connect() as db:
+            db.execute(_SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        # one short transaction per call, so no connection is shared between threads
+        db = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            yield db
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        finally:
+            db.close()
+
+    def add(self, queue, jobs):
+        """Enqueue (job_id, payload) pairs; jobs that are already queued are left as they are."""
+        now = time.time()
+        with self._connect() as db:
+            db.executemany("INSERT OR IGNORE INTO jobs (queue, job_id, payload, updated) VALUES (?, ?, ?, ?)",
+                           [(queue, str(job_id), json.dumps(payload), now) for job_id, payload in jobs])
+
+    def claim(self, queue, owner, lease_seconds=LEASE_SECONDS, n=1, job_ids=None):
+        """Lease up to n pending (or expired) jobs, among job_ids if given, to owner; returns [(job_id, payload)]."""
+        now = time.time()
+        with self._connect() as db:
+            rows = db.execute(
+                "SELECT job_id, payload FROM jobs WHERE queue = ? AND attempts < ? AND "
+                "(state = 'pending' OR (state = 'leased' AND lease_expires < ?)) AND " + _SELECTION +
+                " ORDER BY rowid LIMIT ?",
+                (queue, self.max_attempts, now) + _selection(job_ids) + (n,)).fetchall()
+            db.executemany(
+                "UPDATE jobs SET state = 'leased', owner = ?, lease_expires = ?, attempts = attempts + 1, updated = ? "
+                "WHERE queue = ? AND job_id = ?",
+                [(owner, now + lease_seconds, now, queue, job_id) for job_id, _ in rows])
+        return [(job_id, json.loads(payload)) for job_id, payload in rows]
+
+    def heartbeat(self, queue, job_id, owner, lease_seconds=LEASE_SECONDS):
+        """Renew a lease; False if the job is no longer leased to owner (expired and reclaimed, or done)."""
+        now = time.time()
+        with self._connect() as db:
+            cur = db.execute("UPDATE jobs SET lease_expires = ?, updated = ? WHERE queue = ? AND job_id = ? "
+                             "AND state = 'leased' AND owner = ?", (now + lease_seconds, now, queue, job_id, owner))
+            return cur.rowcount == 1
+
+    def complete(self, queue, job_id, owner, result):
+        """Store the result of a job unless it already has one; True if this call stored it."""
+        with self._connect() as db:
+            cur = db.execute("UPDATE jobs SET state = 'done', owner = ?, result = ?, lease_expires = NULL, updated = ? "
+                             "WHERE queue = ? AND job_id = ? AND state != 'done'",
+                             (owner, json.dumps(result), time.time(), queue, str(job_id)))
+            return cur.rowcount == 1
+
+    def fail(self, queue, job_id, owner, error):
+        """Give a job back after an error; it is retried until max_attempts, then marked failed."""
+        with self._connect() as db:
+            db.execute("UPDATE jobs SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                       "owner = NULL, lease_expires = NULL, error = ?, updated = ? "
+                       "WHERE queue = ? AND job_id = ? AND state = 'leased' AND owner = ?",
+                       (self.max_attempts, str(error), time.time(), queue, str(job_id), owner))
+
+    def release(self, queue, job_id, owner):
+        """Give a claimed job back without counting the attempt (the worker stops, e.g. at its budget)."""
+        with self._connect() as db:
+            db.execute("UPDATE jobs SET state = 'pending', owner = NULL, lease_expires = NULL, "
+                       "attempts = attempts - 1, updated = ? WHERE queue = ? AND job_id = ? AND state = 'leased' "
+                       "AND owner = ?", (time.time(), queue, str(job_id), owner))
+
+    def counts(self, queue=None):
+        """{queue: {state: n}}, with expired leases counted as "expired"."""
+        now = time.time()
+        with self._connect() as db:
+            rows = db.execute(
+                "SELECT queue, CASE WHEN state = 'leased' AND lease_expires < ? THEN 'expired' ELSE state END, "
+                "COUNT(*) FROM jobs WHERE ? IS NULL OR queue = ? GROUP BY 1, 2", (now, queue, queue)).fetchall()
+        counts = {}
+        for q, state, n in rows:
+            counts.setdefault(q, {})[state] = n
+        return counts
+
+    def open_jobs(self, queue, job_ids=None):
+        """Jobs (among job_ids, if given) that may still produce a result: pending, leased, or expired but retryable."""
+        with self._connect() as db:
+            return db.execute("SELECT COUNT(*) FROM jobs WHERE queue = ? AND (state = 'pending' OR "
+                              "(state = 'leased' AND (lease_expires >= ? OR attempts < ?))) AND " + _SELECTION,
+                              (queue, time.time(), self.max_attempts) + _selection(job_ids)).fetchone()[0]
+
+    def results(self, queue):
+        """{job_id: result} of the done jobs of a queue."""
+        with self._connect() as db:
+            rows = db.execute("SELECT job_id, result FROM jobs WHERE queue = ? AND state = 'done'", (queue,)).fetchall()
+        return {job_id: json.loads(result) for job_id, result in rows}
+
+    @contextmanager
+    def lease(self, queue, job_id, owner, lease_seconds=LEASE_SECONDS):
+        """Keep the lease of a claimed job alive (heartbeat every lease_seconds / 3) while the block runs."""
+        stop = threading.Event()
+        lost = threading.Event()
+
+        def beat():
+            while not stop.wait(lease_seconds / 3.0):
+                if not self.heartbeat(queue, job_id, owner, lease_seconds):
+                    lost.set()
+                    return
+
+        thread = threading.Thread(target=beat, daemon=True)
+        thread.start()
+        try:
+            yield lost
+        finally:
+            stop.set()
+            thread.join()
+
+    def run(self, queue, handler, owner=None, lease_seconds=LEASE_SECONDS, poll_seconds=None, job_ids=None):
+        """
+        Worker loop: claim a job, run handler(job_id, payload) under a lease and store its result, until the
+        queue has no open jobs left. While other workers hold the remaining leases, poll for expired ones.
+        A worker that runs only part of the queue (job_ids) claims and waits for those jobs only.
+        Returns the number of results this worker stored.
+        """
+        owner = owner or worker_id()
+        poll_seconds = poll_seconds or max(1.0, lease_seconds / 4.0)
+        stored = 0
+        while True:
+            jobs = self.claim(queue, owner, lease_seconds, job_ids=job_ids)
+            if not jobs:
+                if not self.open_jobs(queue, job_ids):
+                    return stored
+                time.sleep(poll_seconds)
+                continue
+            job_id, payload = jobs[0]
+            try:
+                with self.lease(queue, job_id, owner, lease_seconds) as lost:
+                    result = handler(job_id, payload)
+            except Exception as e:
+                print(f"[Queue] {queue} {job_id} failed: {e!r}")
+                self.fail(queue, job_id, owner, repr(e))
+                continue
+            if result is None:          # handler declined (e.g. budget stop): give the job back and stop
+                self.release(queue, job_id, owner)
+                return stored
+            if lost.is_set():
+                print(f"[Queue] {queue} {job_id}: lease was lost while running, result kept only if first")
+            stored += self.complete(queue, job_id, owner, result)
+
+
+def exec_queue(split):
+    return f"exec:{split}"
+
+
+def comp_queue(subtask):
+    return f"comp:{subtask}"
+
+
+def enqueue_all(wq, splits=None, subtasks=None):
+    for split in splits if splits is not None else EXEC_SPLITS:
+        wq.add(exec_queue(split), [(item["instr_id"], None) for item in load_exec_split(split)])
+    for subtask in subtasks if subtasks is not None else COMP_SUBTASKS:
+        if comp_data_path(subtask).exists():
+            wq.add(comp_queue(subtask), [(i, None) for i in range(len(read_jsonl(comp_data_path(subtask))))])
+
+
+def comp_worker(wq, subtasks=None, lease_seconds=LEASE_SECONDS, model=None):
+    """Answer and score Comprehension items from the queue; writes each sub-task's results file once it is done."""
+    from navbench.answers import ask
+    from navbench.batch import _in_dir
+    from navbench.comp_tasks import build_messages, score_item, write_results
+
+    model = model or os.environ.get("OPENAI_MODEL", "gpt-4o")
+    for subtask in subtasks or COMP_SUBTASKS:
+        if not comp_data_path(subtask).exists():
+            continue
+        items = read_jsonl(comp_data_path(subtask))
+
+        def handle(job_id, payload):
+            item = items[int(job_id)]
+            with _in_dir(comp_data_path(subtask).parent):
+                text, extra = ask(model, build_messages(subtask, item), subtask, item)
+            # the interactive scripts strip the answer except for progress; keep the same behaviour
+            key, record = score_item(subtask, item, text if subtask == "progress" else text.strip())
+            return [key, dict(record, **extra)]
+
+        stored = wq.run(comp_queue(subtask), handle, lease_seconds=lease_seconds)
+        results = wq.results(comp_queue(subtask))
+        print(f"[Queue] {subtask}: {stored} items scored here, {len(results)}/{len(items)} done")
+        if len(results) == len(items):
+            path = write_results(subtask, [tuple(results[k]) for k in sorted(results, key=int)])
+            print(f"[Queue] {subtask}: results -> {path}")
+
+
+def main():
+    from navbench.answers import add_answer_args, apply_answer_args
+
+    parser = argparse.ArgumentParser(description="Lease-based work queue for NavBench sweeps")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("init", help="Enqueue Execution episodes and Comprehension items (idempotent)")
+    p.add_argument("--db", required=True)
+    p.add_argument("--splits", nargs="*", default=None, choices=list(EXEC_SPLITS))
+    p.add_argument("--subtasks", nargs="*", default=None, choices=list(COMP_SUBTASKS))
+    p = sub.add_parser("status", help="Job counts per queue and state")
+    p.add_argument("--db", required=True)
+    p = sub.add_parser("comp_worker", help="Work on the Comprehension queues")
+    p.add_argument("--db", required=True)
+    p.add_argument("--subtasks", nargs="*", default=None, choices=list(COMP_SUBTASKS))
+    p.add_argument("--lease_seconds", type=float, default=LEASE_SECONDS)
+    add_answer_args(p)
+    args = parser.parse_args()
+    apply_answer_args(args)
+
+    wq = WorkQueue(args.db)
+    if args.command == "init":
+        enqueue_all(wq, args.splits, args.subtasks)
+    elif args.command == "comp_worker":
+        from navbench.llm import require_api_key
+        require_api_key()
+        comp_worker(wq, args.subtasks, args.lease_seconds)
+    for queue, states in sorted(wq.counts().items()):
+        print(f"[Queue] {queue:<24} " + "  ".join(f"{k}: {v}" for k, v in sorted(states.items())))
+
+
+if __name__ == "__main__":
+    main()
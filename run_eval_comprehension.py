@@ -5,11 +5,23 @@ All configuration can be modified in the config block below; if the API key is e
 """
 import os
 import sys
+import re
 import json
 import argparse
+import tempfile
 import subprocess
 from pathlib import Path
 
+from navbench.stats import add_sequential_args, half_width, combined_half_width
+from navbench.sampling import load_or_build_subset, load_subset
+from navbench.preflight import run_preflight
+from navbench.dry_run import add_dry_run_args, load_sizes, plan_comprehension, print_plan
+from navbench.budget import add_budget_args, apply_budget_args, read_ledger
+from navbench.datasets import COMP_SUBTASKS, comp_data_path, read_jsonl
+from navbench.comp_tasks import run_suffix, result_path
+from navbench.answers import add_answer_args, apply_answer_args, calibration
+from navbench.images import MANIFEST_PATH, PayloadStore, build_manifest, comp_image_paths, load_manifest, save_manifest
+
 ROOT = Path(__file__).resolve().parent
 
 # ------------------------------ Configuration (edit here) ------------------------------
@@ -62,43 +74,94 @@ def run_cmd(cmd, cwd, desc):
     return ret.returncode
 
 
-def run_comprehension(max_items):
+def prepare_payload_store(args, max_items, subset_file):
+    """
+    Build the image manifest (once) and encode every unique image of this run into the shared payload cache,
+    so that the task scripts and their worker processes never encode the same image twice.
+    """
+    if not args.payload_cache:
+        return
+    manifest_path = Path(args.image_manifest)
+    if manifest_path.exists():
+        manifest = load_manifest(manifest_path)
+    else:
+        manifest = build_manifest(comp_image_paths())
+        save_manifest(manifest, manifest_path)
+        print(f"[Payload] Wrote image manifest: {manifest_path} ({manifest['n_unique']} unique images)")
+    cache_dir = str(Path(args.payload_cache).resolve())
+    subset = load_subset(subset_file) if subset_file else None
+    paths = comp_image_paths(max_items=None if args.sequential else max_items, subset=subset)
+    n = PayloadStore(manifest, cache_dir).warm(paths)
+    print(f"[Payload] {len(paths)} image paths, {n} newly encoded into {cache_dir}")
+    os.environ["NAVBENCH_IMAGE_MANIFEST"] = str(manifest_path.resolve())
+    os.environ["NAVBENCH_PAYLOAD_CACHE"] = cache_dir
+    os.environ["NAVBENCH_PAYLOAD_MEMORY_MB"] = str(args.payload_memory_mb)
+
+
+def task_flags(args, subset_file=None):
+    """Flags forwarded unchanged to every sub-task script."""
+    flags = ["--subset_file", str(subset_file)] if subset_file else []
+    if args.sequential:
+        flags += [
+            "--sequential",
+            "--seed", str(args.seed),
+            "--target_half_width", str(args.target_half_width),
+            "--min_items", str(args.min_items),
+            "--confidence", str(args.confidence),
+        ]
+    return flags
+
+
+def resolve_subset(args):
+    if args.subset_file:
+        return str(Path(args.subset_file).resolve())
+    if args.subset_fraction is None and args.subset_size is None:
+        return None
+    return load_or_build_subset(args.subset_fraction, args.subset_size, args.seed)
+
+
+def run_comprehension(max_items, extra_flags=()):
     comp_root = ROOT / "Comp_code" / "Eval_code"
     if not comp_root.exists():
         print(f"[Error] Directory not found: {comp_root}")
         return False
+    extra_flags = list(extra_flags)
     tasks = [
-        ("global", "global_gpt.py", ["python", "global_gpt.py"] + (["--max_items", str(max_items)] if max_items else [])),
-        ("progress", "progress_gpt.py", ["python", "progress_gpt.py"] + (["--max_items", str(max_items)] if max_items else [])),
-        ("local", "local_action_gpt.py", ["python", "local_action_gpt.py"] + (["--max_items", str(max_items)] if max_items else [])),
-        ("local_obs", "local_obs_gpt.py", ["python", "local_obs_gpt.py"] + (["--max_items", str(max_items)] if max_items else [])),
+        ("global", "global_gpt.py", ["python", "global_gpt.py"] + (["--max_items", str(max_items)] if max_items else []) + extra_flags),
+        ("progress", "progress_gpt.py", ["python", "progress_gpt.py"] + (["--max_items", str(max_items)] if max_items else []) + extra_flags),
+        ("local", "local_action_gpt.py", ["python", "local_action_gpt.py"] + (["--max_items", str(max_items)] if max_items else []) + extra_flags),
+        ("local_obs", "local_obs_gpt.py", ["python", "local_obs_gpt.py"] + (["--max_items", str(max_items)] if max_items else []) + extra_flags),
     ]
-    for name, script, cmd in tasks:
+    for i, (name, script, cmd) in enumerate(tasks):
         d = comp_root / ("local" if name.startswith("local") else name)
         if name == "local_obs":
             d = comp_root / "local"
         if not (d / script).exists():
             print(f"[Skip] Script not found: {d / script}")
             continue
+        # with a deadline / budget, each task may use an equal share of what is left (see navbench/budget.py)
+        os.environ["NAVBENCH_BUDGET_SHARE"] = f"1/{len(tasks) - i}"
         run_cmd(cmd, str(d), f"Comprehension - {name}")
     return True
 
 
-def collect_comprehension_results(max_items):
+def collect_comprehension_results(max_items, confidence=0.95, suffix=""):
     """
-    Collect Comprehension results:
+    Collect Comprehension results of one run mode (suffix: comp_tasks.run_suffix of a subset / sequential /
+    budget run, so that partial runs are never summarized as full ones):
     - Global: average over four strategies
     - Local: average over Action + Observation
     - Progress: single score
     - Comp. Avg: average over the three metrics above
+    Each row also carries the half-width of its confidence interval (in points); averaged rows
+    combine the sub-task intervals assuming independent sub-tasks.
     """
-    comp_root = ROOT / "Comp_code" / "Eval_code"
     global_accs, local_accs = [], []
-    progress_acc = None
+    global_hws, local_hws = [], []
+    progress_acc = progress_hw = None
 
-    global_dir = comp_root / "global" / "results"
     for strategy in ["basic", "direction", "object", "shuffle"]:
-        p = global_dir / f"{strategy}_results.jsonl"
+        p = result_path(f"global/{strategy}", suffix=suffix)
         if not p.exists():
             continue
         correct, total = 0, 0
@@ -112,8 +175,9 @@ def collect_comprehension_results(max_items):
                     correct += 1
         if total:
             global_accs.append((correct / total) * 100)
+            global_hws.append(half_width(correct, total, confidence) * 100)
 
-    progress_file = comp_root / "progress" / "results" / "progress_results_gpt4o.json"
+    progress_file = result_path("progress", suffix=suffix)
     if progress_file.exists():
         with open(progress_file) as f:
             data = json.load(f)
@@ -121,18 +185,21 @@ def collect_comprehension_results(max_items):
             valid = [v for v in data.values() if isinstance(v, dict) and "correct" in v]
             total = len(valid)
             if total:
-                progress_acc = (sum(1 for v in valid if v.get("correct")) / total) * 100
-
-    local_dir = comp_root / "local" / "results"
-    suffix = f"_sample{max_items}" if max_items else ""
-    for prefix in ["future_action_results_gpt-4o", "local_observation_results_gpt4o"]:
-        p = local_dir / f"{prefix}{suffix}.jsonl"
-        if not p.exists() and suffix:
-            p = local_dir / f"{prefix}.jsonl"
+                correct = sum(1 for v in valid if v.get("correct"))
+                progress_acc = (correct / total) * 100
+                progress_hw = half_width(correct, total, confidence) * 100
+
+    for subtask in ["local/action", "local/observation"]:
+        p = result_path(subtask, max_items, suffix)
+        if not p.exists() and max_items:
+            p = result_path(subtask, None, suffix)
         if not p.exists():
-            for f in local_dir.glob(f"{prefix}*.jsonl"):
-                p = f
-                break
+            # another sample size of the same run mode
+            prefix = result_path(subtask, None, "").stem
+            for f in p.parent.glob(f"{prefix}_sample*{suffix}.jsonl"):
+                if re.fullmatch(rf"{re.escape(prefix)}_sample\d+{re.escape(suffix)}", f.stem):
+                    p = f
+                    break
         if p.exists():
             correct, total = 0, 0
             with open(p) as f:
@@ -145,40 +212,84 @@ def collect_comprehension_results(max_items):
                         correct += 1
             if total:
                 local_accs.append((correct / total) * 100)
+                local_hws.append(half_width(correct, total, confidence) * 100)
 
     rows = []
     global_avg = sum(global_accs) / len(global_accs) if global_accs else None
     local_avg = sum(local_accs) / len(local_accs) if local_accs else None
+    global_hw = combined_half_width(global_hws)
+    local_hw = combined_half_width(local_hws)
     if global_avg is not None:
-        rows.append(("Comprehension", "Global", f"{global_avg:.2f}%"))
+        rows.append(("Comprehension", "Global", f"{global_avg:.2f}%", f"±{global_hw:.2f}"))
     if local_avg is not None:
-        rows.append(("Comprehension", "Local", f"{local_avg:.2f}%"))
+        rows.append(("Comprehension", "Local", f"{local_avg:.2f}%", f"±{local_hw:.2f}"))
     if progress_acc is not None:
-        rows.append(("Comprehension", "Progress", f"{progress_acc:.2f}%"))
+        rows.append(("Comprehension", "Progress", f"{progress_acc:.2f}%", f"±{progress_hw:.2f}"))
     levels = [x for x in [global_avg, local_avg, progress_acc] if x is not None]
+    level_hws = [x for x in [global_hw, local_hw, progress_hw] if x is not None]
     if levels:
-        rows.append(("Comprehension", "Comp. Avg", f"{sum(levels) / len(levels):.2f}%"))
+        rows.append(("Comprehension", "Comp. Avg", f"{sum(levels) / len(levels):.2f}%", f"±{combined_half_width(level_hws):.2f}"))
     return rows
 
 
-def print_summary(rows):
+def print_coverage(max_items, subset_file, suffix=""):
+    """Evaluated / planned items per sub-task, for runs cut short by a deadline or budget."""
+    subset = load_subset(subset_file) if subset_file else None
+    for subtask, rel_path in COMP_SUBTASKS.items():
+        path = result_path(subtask, max_items, suffix)
+        if not comp_data_path(subtask).exists() or not path.exists():
+            continue
+        if subset is not None and rel_path in subset["comprehension"]:
+            planned = len(subset["comprehension"][rel_path])
+        else:
+            n = len(read_jsonl(comp_data_path(subtask)))
+            planned = min(n, max_items) if max_items else n
+        if subtask == "progress":
+            with open(path) as f:
+                done = len(json.load(f))
+        else:
+            done = len(read_jsonl(path))
+        print(f"[Coverage] {subtask:<20} {done}/{planned} ({100.0 * done / planned if planned else 0:.1f}%)")
+
+
+def print_calibration(max_items, suffix=""):
+    """Mean confidence against accuracy per sub-task, for results answered with --answer_mode constrained."""
+    for subtask in COMP_SUBTASKS:
+        path = result_path(subtask, max_items, suffix)
+        if not path.exists():
+            continue
+        if subtask == "progress":
+            with open(path) as f:
+                records = [v for v in json.load(f).values() if isinstance(v, dict)]
+        else:
+            records = read_jsonl(path)
+        cal = calibration(records)
+        if cal is not None:
+            print(f"[Calibration] {subtask:<20} confidence {cal['confidence']:.2%} vs accuracy {cal['accuracy']:.2%} "
+                  f"over {cal['n']} items, ECE {cal['ece']:.3f}")
+
+
+def print_summary(rows, confidence=0.95, suffix=""):
     if not rows:
         print("\n[Info] No result files found. Please run the evaluation first.")
         return
-    w1, w2, w3 = 28, 18, 14
-    sep = "+" + "-" * (w1 + 2) + "+" + "-" * (w2 + 2) + "+" + "-" * (w3 + 2) + "+"
+    ci_title = f"{confidence:.0%} CI"
+    w1, w2, w3, w4 = 28, 18, 14, 10
+    sep = "+" + "-" * (w1 + 2) + "+" + "-" * (w2 + 2) + "+" + "-" * (w3 + 2) + "+" + "-" * (w4 + 2) + "+"
     print("\n" + sep)
-    print(f"| {'Task':<{w1}} | {'Metric':<{w2}} | {'Value':<{w3}} |")
+    print(f"| {'Task':<{w1}} | {'Metric':<{w2}} | {'Value':<{w3}} | {ci_title:<{w4}} |")
     print(sep)
-    for r1, r2, r3 in rows:
-        print(f"| {r1:<{w1}} | {r2:<{w2}} | {str(r3):<{w3}} |")
+    for r1, r2, r3, r4 in rows:
+        print(f"| {r1:<{w1}} | {r2:<{w2}} | {str(r3):<{w3}} | {str(r4):<{w4}} |")
     print(sep)
-    md_path = ROOT / "results_summary.md"
+    if suffix:
+        print(f"Partial run ({suffix.lstrip('_')}): not comparable with full-run scores")
+    md_path = ROOT / f"results_summary{suffix}.md"
     with open(md_path, "w") as f:
-        f.write("# NavBench Comprehension Summary\n\n")
-        f.write("| Task | Metric | Value |\n|------|--------|-------|\n")
-        for r1, r2, r3 in rows:
-            f.write(f"| {r1} | {r2} | {r3} |\n")
+        f.write("# NavBench Comprehension Summary" + (f" (partial run: {suffix.lstrip('_')})" if suffix else "") + "\n\n")
+        f.write(f"| Task | Metric | Value | {ci_title} |\n|------|--------|-------|--------|\n")
+        for r1, r2, r3, r4 in rows:
+            f.write(f"| {r1} | {r2} | {r3} | {r4} |\n")
     print(f"\nSummary written to: {md_path}")
 
 
@@ -196,19 +307,64 @@ def main():
         action="store_true",
         help="Only summarize existing result files without running new evaluations",
     )
+    parser.add_argument("--subset_fraction", type=float, default=None, help="Evaluate a stratified, seeded subset of this fraction of every sub-task")
+    parser.add_argument("--subset_size", type=int, default=None, help="Evaluate a stratified, seeded subset of this many items per sub-task")
+    parser.add_argument("--subset_file", type=str, default=None, help="Use an existing subset index file (see navbench/sampling.py)")
+    parser.add_argument("--payload_cache", type=str, default=None, help="Directory for encoded image payloads shared by all sub-tasks (each unique image is encoded once)")
+    parser.add_argument("--image_manifest", type=str, default=str(MANIFEST_PATH), help="Content-hash image manifest (built on first use)")
+    parser.add_argument("--payload_memory_mb", type=int, default=256, help="In-memory payload LRU budget per process")
+    parser.add_argument("--image_pack", type=str, default=None, help="Read images from a packed archive (see navbench/image_pack.py)")
+    parser.add_argument("--preflight", action="store_true", help="Validate every referenced image before any API call and stop on errors")
+    parser.add_argument("--max_concurrency", type=int, default=None, help="Upper bound for the adaptive number of in-flight API requests (default 32)")
+    add_budget_args(parser)
+    add_answer_args(parser)
+    parser.add_argument("--dry_run", action="store_true", help="Build every request without sending it and print counts, bytes, tokens and cost")
+    add_dry_run_args(parser)
+    add_sequential_args(parser)
     args = parser.parse_args()
+    subset_file = resolve_subset(args)
     if args.max_items is not None and args.max_items <= 0:
         max_items = None
     elif args.max_items is not None:
         max_items = args.max_items
+    elif args.sequential or subset_file:
+        max_items = None  # the subset / sequential mode decides which items run
     else:
         max_items = DEFAULT_MAX_ITEMS if DEFAULT_MAX_ITEMS > 0 else None
+    # result files of subset / sequential / budget runs are named apart from full runs (see comp_tasks.run_suffix)
+    budgeted = bool(args.deadline or args.budget_tokens or args.budget_usd)
+    suffix = run_suffix(subset_file, args.sequential, args.seed, budgeted)
+
+    if args.dry_run:
+        subset = load_subset(subset_file) if subset_file else None
+        plan = plan_comprehension(load_sizes(args), None if args.sequential else max_items, subset, args.comp_output_tokens)
+        print_plan(plan, args.input_price, args.output_price)
+        return
 
     ensure_api_key(args.summary_only)
+    if args.max_concurrency:
+        os.environ["NAVBENCH_CONCURRENCY_MAX"] = str(args.max_concurrency)
+    if args.image_pack:
+        os.environ["NAVBENCH_IMAGE_PACK"] = str(Path(args.image_pack).resolve())
+    apply_answer_args(args)
     if not args.summary_only:
-        run_comprehension(max_items)
-    rows = collect_comprehension_results(max_items)
-    print_summary(rows)
+        if args.preflight and not run_preflight(comp=True, exec_splits=None):
+            print("[Error] Preflight failed, no API request was made. See preflight_manifest.json.")
+            sys.exit(1)
+        ledger = None
+        if budgeted:
+            ledger = os.path.join(tempfile.mkdtemp(prefix="navbench_budget_"), "ledger.json")
+            apply_budget_args(args, ledger)
+        prepare_payload_store(args, max_items, subset_file)
+        run_comprehension(max_items, task_flags(args, subset_file))
+        if ledger:
+            spent = read_ledger(ledger)
+            print(f"\n[Budget] run spent {int(spent['tokens'])} tokens (${spent['usd']:.2f}); "
+                  f"scores below cover the evaluated items only")
+            print_coverage(max_items, subset_file, suffix)
+    rows = collect_comprehension_results(max_items, args.confidence, suffix)
+    print_summary(rows, args.confidence, suffix)
+    print_calibration(max_items, suffix)
 
 
 if __name__ == "__main__":
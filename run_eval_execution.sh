@@ -1,7 +1,7 @@
 #!/usr/bin/env bash
 # NavBench Execution evaluation (local, no Docker):
-# Run gpt4o-easy / gpt4o / gpt4o-hard under Exec_code/scripts
-# and compute the average sr/spl over the three splits.
+# Run the Easy / Medium / Hard splits with Exec_code/main_multi_split.py
+# and save the average sr/spl over the three splits.
 
 set -e
 
@@ -32,107 +32,54 @@ fi
 echo "[info] Repo root: $ROOT_DIR"
 echo "[info] Exec_code dir: $EXEC_DIR"
 
-cd "$EXEC_DIR"
-
-##############################################
-# 3. Run a script and extract sr/spl (stdout-based)
-##############################################
-run_and_get_scores() {
-  local script_path="$1"
-  local tag="$2"   # Easy / Medium / Hard
+# Optional stratified subset (see navbench/sampling.py); made absolute because the scripts run from Exec_code
+if [ -n "$SUBSET_FILE" ]; then
+  SUBSET_FILE="$(cd "$(dirname "$SUBSET_FILE")" && pwd)/$(basename "$SUBSET_FILE")"
+  export SUBSET_FILE
+  echo "[info] Subset file: $SUBSET_FILE"
+fi
 
-  if [ ! -f "$script_path" ]; then
-    echo "[Error] Script not found: $script_path (${tag})"
-    exit 1
+# Optional deadline / budget for the whole run (see navbench/budget.py), e.g. DEADLINE=2h BUDGET_USD=20;
+# the splits run concurrently and stop starting episodes before a limit is reached
+if [ -n "$DEADLINE" ] || [ -n "$BUDGET_TOKENS" ] || [ -n "$BUDGET_USD" ]; then
+  if [ -n "$DEADLINE" ]; then
+    NAVBENCH_DEADLINE="$(cd "$ROOT_DIR" && python -c "from navbench.budget import parse_deadline; print(parse_deadline('$DEADLINE'))")"
+    export NAVBENCH_DEADLINE
   fi
+  [ -n "$BUDGET_TOKENS" ] && export NAVBENCH_BUDGET_TOKENS="$BUDGET_TOKENS"
+  [ -n "$BUDGET_USD" ] && export NAVBENCH_BUDGET_USD="$BUDGET_USD"
+  echo "[info] Deadline: ${DEADLINE:-none}  token budget: ${BUDGET_TOKENS:-none}  cost budget: ${BUDGET_USD:-none}"
+fi
 
-  local tmp_outdir
-  tmp_outdir="$(mktemp -d -t navbench_exec_${tag}_XXXXXX)"
-
-  echo ">>> Running ${script_path} (${tag})"
-  # Capture stdout to avoid relying on log files.
-  # Also redirect the run output to a temp output dir and delete it afterwards.
-  local out
-  out="$(OUTDIR="$tmp_outdir" OPENAI_API_KEY="$OPENAI_API_KEY" bash "$script_path")"
-  echo ">>> ${script_path} finished"
-
-  # Best-effort cleanup for temp outputs
-  rm -rf "$tmp_outdir" >/dev/null 2>&1 || true
-
-  # Get the last "All cases" line from stdout
-  local line
-  line="$(printf '%s\n' "$out" | grep 'All cases' | tail -n 1 || true)"
-
-  if [ -z "$line" ]; then
-    echo "[Error] No 'All cases' line found in stdout (${tag})"
-    exit 1
-  fi
+cd "$EXEC_DIR"
 
-  # Parse sr / spl
-  local sr spl
-  sr=$(echo "$line" | awk '{for(i=1;i<=NF;i++) if($i=="sr:")  {print $(i+1)}}')
-  spl=$(echo "$line" | awk '{for(i=1;i<=NF;i++) if($i=="spl:"){print $(i+1)}}')
+##############################################
+# 3. Run Easy / Medium / Hard in one process
+##############################################
+# main_multi_split.py loads the navigation data once, runs the three splits concurrently
+# (max_action_len 8 / 15 / 20) and writes the averaged scores itself.
 
-  echo "[${tag}] $line"
+SCRIPT="scripts/gpt4o-all.sh"
+if [ ! -f "$SCRIPT" ]; then
+  echo "[Error] Script not found: $SCRIPT"
+  exit 1
+fi
 
-  if [ "$tag" = "Easy" ]; then
-    SR_EASY="$sr"; SPL_EASY="$spl"
-  elif [ "$tag" = "Medium" ]; then
-    SR_MED="$sr"; SPL_MED="$spl"
-  else
-    SR_HARD="$sr"; SPL_HARD="$spl"
-  fi
-}
+# Run outputs go to a temp dir that is deleted afterwards
+tmp_outdir="$(mktemp -d -t navbench_exec_XXXXXX)"
 
-##############################################
-# 4. Run the three Execution scripts
-##############################################
+echo ">>> Running ${SCRIPT} (Easy / Medium / Hard)"
+status=0
+OUTDIR="$tmp_outdir" OPENAI_API_KEY="$OPENAI_API_KEY" \
+  bash "$SCRIPT" --summary_json "${ROOT_DIR}/execution_sr_spl_avg.json" || status=$?
+echo ">>> ${SCRIPT} finished"
 
-run_and_get_scores "scripts/gpt4o-easy.sh"  "Easy"
-run_and_get_scores "scripts/gpt4o.sh"       "Medium"
-run_and_get_scores "scripts/gpt4o-hard.sh"  "Hard"
+# Best-effort cleanup for temp outputs
+rm -rf "$tmp_outdir" >/dev/null 2>&1 || true
 
-##############################################
-# 5. Compute average sr/spl over Easy/Medium/Hard
-##############################################
+if [ "$status" -ne 0 ]; then
+  echo "[Error] Execution evaluation failed (exit code ${status})"
+  exit "$status"
+fi
 
-python - << PY
-sr_easy  = float("${SR_EASY}")
-sr_med   = float("${SR_MED}")
-sr_hard  = float("${SR_HARD}")
-spl_easy = float("${SPL_EASY}")
-spl_med  = float("${SPL_MED}")
-spl_hard = float("${SPL_HARD}")
-
-avg_sr  = (sr_easy + sr_med + sr_hard) / 3.0
-avg_spl = (spl_easy + spl_med + spl_hard) / 3.0
-
-print(f"Average over Easy/Medium/Hard  -  sr: {avg_sr:.2f}  spl: {avg_spl:.2f}")
-PY
-
-python - << PY
-import json
-from pathlib import Path
-
-sr_easy  = float("${SR_EASY}")
-sr_med   = float("${SR_MED}")
-sr_hard  = float("${SR_HARD}")
-spl_easy = float("${SPL_EASY}")
-spl_med  = float("${SPL_MED}")
-spl_hard = float("${SPL_HARD}")
-
-avg_sr  = (sr_easy + sr_med + sr_hard) / 3.0
-avg_spl = (spl_easy + spl_med + spl_hard) / 3.0
-
-out_path = Path("${ROOT_DIR}") / "execution_sr_spl_avg.json"
-payload = {
-  "easy":   {"sr": round(sr_easy, 2),  "spl": round(spl_easy, 2)},
-  "medium": {"sr": round(sr_med, 2),   "spl": round(spl_med, 2)},
-  "hard":   {"sr": round(sr_hard, 2),  "spl": round(spl_hard, 2)},
-  "avg":    {"sr": round(avg_sr, 2),   "spl": round(avg_spl, 2)},
-}
-out_path.write_text(json.dumps(payload, indent=2) + "\n")
-print(f"Saved average scores to: {out_path}")
-PY
-
-echo ">>> Execution evaluation finished"
\ No newline at end of file
+echo ">>> Execution evaluation finished"
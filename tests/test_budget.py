@@ -0,0 +1,52 @@
+import time
+from types import SimpleNamespace
+
+from navbench.budget import RunBudget
+
+
+def one_item(budget, seconds=1.0, prompt_tokens=60, completion_tokens=40):
+    assert budget.try_start()
+    budget.record_usage(SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens))
+    budget.finish(seconds)
+
+
+def test_no_limits():
+    budget = RunBudget()
+    one_item(budget)
+    assert budget._limit_reason() == 0
+
+
+def test_deadline():
+    assert RunBudget(deadline=time.time() - 1)._limit_reason() == 1
+    budget = RunBudget(deadline=time.time() + 50)
+    assert budget._limit_reason() == 0
+    # the next item is expected to take as long as the mean one so far
+    one_item(budget, seconds=100)
+    assert budget._limit_reason() == 1
+
+
+def test_token_budget_counts_items_in_flight():
+    budget = RunBudget(max_tokens=250)
+    assert budget._limit_reason() == 0
+    one_item(budget)                    # 100 tokens spent, 100 per item
+    assert budget._limit_reason() == 0
+    assert budget.try_start()           # one in flight: 100 + 2 x 100 > 250
+    assert budget._limit_reason() == 2
+    budget.cancel()
+    assert budget._limit_reason() == 0
+
+
+def test_cost_budget():
+    # 1M input tokens at $1 per 1M per item
+    budget = RunBudget(max_usd=1.5, input_price=1.0, output_price=0.0)
+    one_item(budget, prompt_tokens=1e6, completion_tokens=0)
+    assert budget._limit_reason() == 3
+    assert not budget.try_start()
+    assert budget.stop_reason == "cost budget"
+
+
+def test_first_limit_wins():
+    budget = RunBudget(deadline=time.time() - 1, max_tokens=0, max_usd=0)
+    assert budget._limit_reason() == 1
+    assert not budget.try_start()
+    assert budget.stop_reason == "deadline"
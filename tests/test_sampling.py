@@ -0,0 +1,27 @@
+from collections import Counter
+
+from navbench.sampling import stratified_order
+
+ITEMS = ["a"] * 60 + ["b"] * 30 + ["c"] * 10
+
+
+def test_order_is_a_seeded_permutation():
+    order = stratified_order(ITEMS, lambda x: x, seed=0)
+    assert sorted(order) == list(range(len(ITEMS)))
+    assert order == stratified_order(ITEMS, lambda x: x, seed=0)
+    assert order != stratified_order(ITEMS, lambda x: x, seed=1)
+
+
+def test_every_prefix_is_proportional():
+    order = stratified_order(ITEMS, lambda x: x, seed=3)
+    shares = {k: n / len(ITEMS) for k, n in Counter(ITEMS).items()}
+    taken = Counter()
+    for n, i in enumerate(order, 1):
+        taken[ITEMS[i]] += 1
+        for key, share in shares.items():
+            assert abs(taken[key] - n * share) <= 1
+
+
+def test_single_stratum_and_empty():
+    assert sorted(stratified_order(["x"] * 5, lambda x: x)) == list(range(5))
+    assert stratified_order([], lambda x: x) == []
@@ -0,0 +1,26 @@
+from navbench.scheduling import interleave_for_shards
+
+
+def shards(items, n_shards):
+    """Contiguous chunks as R2RNavBatch cuts them with sel_data_idxs: len // n each, the rest to the last one."""
+    size = len(items) // n_shards
+    return [items[i * size:(i + 1) * size if i < n_shards - 1 else None] for i in range(n_shards)]
+
+
+def test_chunks_are_dealt_round_robin():
+    items = list(range(10))
+    assert shards(interleave_for_shards(items, 3), 3) == [[0, 3, 6], [1, 4, 7], [2, 5, 8, 9]]
+
+
+def test_permutation_for_any_size():
+    for n in range(0, 12):
+        for n_shards in range(1, 5):
+            items = list(range(n))
+            order = interleave_for_shards(items, n_shards)
+            assert sorted(order) == items
+            assert [len(s) for s in shards(order, n_shards)] == [len(s) for s in shards(items, n_shards)]
+
+
+def test_one_shard_keeps_the_order():
+    items = ["c", "a", "b"]
+    assert interleave_for_shards(items, 1) == items
@@ -0,0 +1,27 @@
+from navbench.stats import SequentialStopper
+
+
+def test_no_stop_before_min_items():
+    stopper = SequentialStopper(target_half_width=0.5, min_items=10)
+    assert not any(stopper.update(True) for _ in range(9))
+    assert stopper.update(True)
+
+
+def test_stops_once_interval_is_tight_enough():
+    stopper = SequentialStopper(target_half_width=0.05, min_items=1)
+    widths = []
+    while not stopper.update(len(widths) % 4 != 0):
+        widths.append(stopper.half_width)
+        assert len(widths) < 10000
+    assert stopper.half_width <= 0.05 < widths[-1]
+    assert abs(stopper.accuracy - 0.75) < 0.01
+
+
+def test_running_accuracy():
+    stopper = SequentialStopper(min_items=100)
+    assert stopper.accuracy == 0.0
+    for correct in (True, False, True, True):
+        stopper.update(correct)
+    assert (stopper.correct, stopper.total, stopper.accuracy) == (3, 4, 0.75)
+    assert not stopper.should_stop()
+    assert stopper.summary().startswith("3/4 = 75.00%")
@@ -0,0 +1,98 @@
+import pytest
+
+from navbench.work_queue import WorkQueue
+
+QUEUE = "exec:test"
+
+
+@pytest.fixture
+def wq(tmp_path):
+    wq = WorkQueue(tmp_path / "queue.sqlite", max_attempts=2)
+    wq.add(QUEUE, [(job_id, {"n": i}) for i, job_id in enumerate(["a", "b", "c"])])
+    return wq
+
+
+def test_add_is_idempotent(wq):
+    wq.add(QUEUE, [("a", {"n": 99})])
+    assert wq.counts(QUEUE) == {QUEUE: {"pending": 3}}
+    assert wq.claim(QUEUE, "w1") == [("a", {"n": 0})]
+
+
+def test_claim_leases_each_job_once(wq):
+    assert wq.claim(QUEUE, "w1", n=2) == [("a", {"n": 0}), ("b", {"n": 1})]
+    assert wq.claim(QUEUE, "w2", n=2) == [("c", {"n": 2})]
+    assert wq.claim(QUEUE, "w3") == []
+    assert wq.counts(QUEUE) == {QUEUE: {"leased": 3}}
+
+
+def test_expired_lease_is_reclaimed(wq):
+    assert wq.claim(QUEUE, "w1", lease_seconds=-1) == [("a", {"n": 0})]
+    assert wq.counts(QUEUE)[QUEUE]["expired"] == 1
+    assert wq.claim(QUEUE, "w2") == [("a", {"n": 0})]
+    # the first worker lost its lease
+    assert not wq.heartbeat(QUEUE, "a", "w1")
+    assert wq.heartbeat(QUEUE, "a", "w2")
+
+
+def test_failed_attempts_up_to_max(wq):
+    for _ in range(2):
+        assert wq.claim(QUEUE, "w1", job_ids=["a"]) == [("a", {"n": 0})]
+        wq.fail(QUEUE, "a", "w1", "boom")
+    assert wq.claim(QUEUE, "w1", job_ids=["a"]) == []
+    assert wq.counts(QUEUE)[QUEUE]["failed"] == 1
+    assert wq.open_jobs(QUEUE, ["a"]) == 0
+
+
+def test_expired_lease_after_last_attempt_is_not_open(wq):
+    for owner in ("w1", "w2"):
+        assert wq.claim(QUEUE, owner, lease_seconds=-1, job_ids=["a"]) == [("a", {"n": 0})]
+    assert wq.claim(QUEUE, "w3", job_ids=["a"]) == []
+    assert wq.open_jobs(QUEUE, ["a"]) == 0
+
+
+def test_release_does_not_count_an_attempt(wq):
+    for _ in range(3):
+        assert wq.claim(QUEUE, "w1", job_ids=["a"]) == [("a", {"n": 0})]
+        wq.release(QUEUE, "a", "w1")
+    assert wq.counts(QUEUE) == {QUEUE: {"pending": 3}}
+
+
+def test_first_result_wins(wq):
+    wq.claim(QUEUE, "w1", lease_seconds=-1)
+    wq.claim(QUEUE, "w2")
+    assert wq.complete(QUEUE, "a", "w2", {"sr": 1})
+    assert not wq.complete(QUEUE, "a", "w1", {"sr": 0})
+    assert wq.results(QUEUE) == {"a": {"sr": 1}}
+    # a late failure of the first worker does not undo the result
+    wq.fail(QUEUE, "a", "w1", "late")
+    assert wq.results(QUEUE) == {"a": {"sr": 1}}
+
+
+def test_selection(wq):
+    assert wq.claim(QUEUE, "w1", n=3, job_ids=["b", "c"]) == [("b", {"n": 1}), ("c", {"n": 2})]
+    assert wq.open_jobs(QUEUE) == 3
+    assert wq.open_jobs(QUEUE, ["a"]) == 1
+    assert wq.open_jobs(QUEUE, []) == 0
+
+
+def test_run_stores_selected_results(wq):
+    stored = wq.run(QUEUE, lambda job_id, payload: payload["n"] * 10, owner="w1", job_ids=["b", "c"])
+    assert stored == 2
+    assert wq.results(QUEUE) == {"b": 10, "c": 20}
+    assert wq.counts(QUEUE)[QUEUE]["pending"] == 1
+
+
+def test_run_retries_errors_and_stops_when_declined(wq):
+    calls = []
+
+    def handler(job_id, payload):
+        calls.append(job_id)
+        if len(calls) == 1:
+            raise RuntimeError("flaky")
+        return None if job_id == "b" else job_id
+
+    assert wq.run(QUEUE, handler, owner="w1") == 1
+    assert calls == ["a", "a", "b"]
+    assert wq.results(QUEUE) == {"a": "a"}
+    # the declined job was given back without using up an attempt
+    assert wq.claim(QUEUE, "w2", job_ids=["b"]) == [("b", {"n": 1})]